@@ -2,10 +2,17 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
-import plotly.graph_objects as go
-import requests
-import json
-import pickle
+
+from cube import CUBE_PATH, cube_metadata, read_cube
+from datasets import DATA_REFRESH_SECONDS, load_dataset
+from duckdb_engine import ANALYTICS_ENGINE, DELAY_PARQUET, PREVIEW_ROWS, clean_parquet, cleaned_rows, parquet_fingerprint
+from figures import AGGREGATES, FIGURES, frontier_chart, simulation_histogram
+from ingestion import INGESTION_DIR, IncrementalCleaner, state_fingerprint
+from pipeline import clean_data, frames_fingerprint
+from row_browser import FILTER_COLUMNS, PAGE_ROWS, RowBrowser
+from scoring import PRICING_BACKEND, load_scorer, sweep
+from simulation import POLICIES, build_timelines, simulate
+from thresholds import CHART_THRESHOLDS, MAX_THRESHOLD, SCOPES, knee_point
 
 
 #################################################################### PAGE CONFIGURATION ####################################################################
@@ -29,55 +36,121 @@ st.sidebar.markdown("« 🥂 Cheers, dear reader! 🍷»")
 #################################################################### Loading data ####################################################################
 ####################################################################       &      ####################################################################
 #################################################################### Cleaning data ####################################################################
-@st.cache_data 
+# The S3 files are parsed once and kept as Arrow files keyed by their ETag (see datasets.py), so a restart doesn't parse them again
 def load_data():
-    data = pd.read_excel("https://full-stack-assets.s3.eu-west-3.amazonaws.com/Deployment/get_around_delay_analysis.xlsx")
+    data = load_dataset("delay")
     return data
     
-@st.cache_data 
 def load_data_price():
-    data_price = pd.read_csv("https://full-stack-assets.s3.eu-west-3.amazonaws.com/Deployment/get_around_pricing_project.csv", index_col=0)
+    data_price = load_dataset("pricing")
     return data_price
 
-data_load_state = st.text('Loading data...')
-data = load_data()
-data_price = load_data_price()
-data_load_state.text("")
-
-mean_rental_per_day = data_price["rental_price_per_day"].mean()
-
-# Count the number of entries with delay_at_checkout_in_minutes > mean + 3*std and < mean - 3*std
-mean_delay_checkout = data["delay_at_checkout_in_minutes"].mean()
-std_delay_checkout = data["delay_at_checkout_in_minutes"].std()
-outliers = data[(data['delay_at_checkout_in_minutes'] > (mean_delay_checkout + 3* std_delay_checkout)) |
-                 (data['delay_at_checkout_in_minutes'] < (mean_delay_checkout - 3* std_delay_checkout))]
-# Get the count of such entries
-num_outliers = len(outliers)
-# Filter out and remove the outliers
-data = data[(data['delay_at_checkout_in_minutes'] <= (mean_delay_checkout + 3* std_delay_checkout)) & (data['delay_at_checkout_in_minutes'] >= (mean_delay_checkout - 3* std_delay_checkout)) | (data['delay_at_checkout_in_minutes'].isna())]
-# We keep the Nan values to keep information of the cancel state of the rental, if not all the cancel state would be removed
-# Define a function to categorize delays
-def categorize_delay(delay):
-    if pd.isna(delay):
-        return "Unknown"
-    elif delay <= 0:
-        return "Early or in time"
-    elif delay < 60:
-        return "< 1 hour"
-    elif delay < 120:
-        return "1 to 2 hours"
-    elif delay < 180:
-        return "2 to 3 hours"
-    elif delay < 360:
-        return "3 to 6 hours"
-    elif delay < 720:
-        return "6 to 12 hours"
-    elif delay < 1440:
-        return "12 to 24 hours"
-    else:
-        return "1 day or more"
-# Apply function to create the new column
-data["checkout_delay_category"] = data["delay_at_checkout_in_minutes"].apply(categorize_delay)
+# Loading and cleaning don't run on every widget interaction: the raw data is checked again every DATA_REFRESH_SECONDS,
+# and the cleaned data (outliers removed, derived delay columns) and its aggregates are computed once per fingerprint
+# of the raw data. They are shared by the reruns and sessions, which only read them (see pipeline.py)
+@st.cache_resource(ttl=DATA_REFRESH_SECONDS, show_spinner="Loading data...")
+def load_raw_data():
+    data, data_price = load_data(), load_data_price()
+    return frames_fingerprint(data, data_price), data, data_price
+
+@st.cache_resource(max_entries=1, show_spinner="Cleaning data...")
+def load_cleaned_data(fingerprint, _data, _data_price):
+    return clean_data(_data, _data_price, fingerprint)
+
+# Fleet-scale history: the Parquet files are summarized out of core by DuckDB instead (see duckdb_engine.py),
+# once per fingerprint of the files
+@st.cache_resource(max_entries=1, show_spinner="Querying the delay data...")
+def load_parquet_cleaned_data(fingerprint, paths):
+    mean_rental_per_day = float(load_data_price()["rental_price_per_day"].mean())
+    return clean_parquet(paths, mean_rental_per_day, fingerprint)
+
+# Daily batches appended with `python ingestion.py ingest`: the aggregates are kept up to date by the ingestion
+# (see ingestion.py), once per ingested batch
+@st.cache_resource(max_entries=1, show_spinner="Loading the ingested data...")
+def load_ingested_cleaned_data(fingerprint, directory):
+    mean_rental_per_day = float(load_data_price()["rental_price_per_day"].mean())
+    return IncrementalCleaner.load(directory).cleaned(mean_rental_per_day, fingerprint, PREVIEW_ROWS)
+
+# Precomputed aggregates (`python cube.py`): the pages only read the cube file, the sources are not loaded (see cube.py)
+@st.cache_resource(max_entries=1, show_spinner="Loading the aggregates...")
+def load_cube_cleaned_data(fingerprint, path):
+    return read_cube(path)
+
+if ANALYTICS_ENGINE == "cube":
+    cleaned = load_cube_cleaned_data(cube_metadata(CUBE_PATH)["fingerprint"], CUBE_PATH)
+elif ANALYTICS_ENGINE == "duckdb":
+    cleaned = load_parquet_cleaned_data(parquet_fingerprint(DELAY_PARQUET), DELAY_PARQUET)
+elif ANALYTICS_ENGINE == "incremental":
+    cleaned = load_ingested_cleaned_data(state_fingerprint(INGESTION_DIR), INGESTION_DIR)
+elif ANALYTICS_ENGINE == "pandas":
+    cleaned = load_cleaned_data(*load_raw_data())
+else:
+    raise ValueError(f"Unknown analytics engine {ANALYTICS_ENGINE!r}, expected 'pandas', 'cube', 'duckdb' or 'incremental'")
+data = cleaned.data
+mean_rental_per_day = cleaned.mean_rental_per_day
+num_outliers = cleaned.num_outliers
+
+# The raw data viewer keeps the rentals on the server and only sends the page it shows (see row_browser.py)
+@st.cache_resource(max_entries=1, show_spinner="Indexing the rentals...")
+def load_row_browser(fingerprint, _data):
+    return RowBrowser(_data)
+
+# The DuckDB and incremental engines only keep a preview of the rentals: the viewer gets all the cleaned rentals, queried
+# from the Parquet files or read from the ingested chunks the first time the raw data is shown
+@st.cache_resource(max_entries=1, show_spinner="Loading the rentals...")
+def load_all_cleaned_rows(fingerprint):
+    if ANALYTICS_ENGINE == "duckdb":
+        return cleaned_rows(DELAY_PARQUET)
+    return IncrementalCleaner.load(INGESTION_DIR).cleaned_rows()
+
+# The charts and the aggregates are built the first time a page shows them, once per fingerprint of the data, and shared
+# by the reruns and sessions: a page only builds what it renders, and a visit only sends the cached figures (see figures.py)
+@st.cache_resource(max_entries=len(FIGURES))
+def build_figure(name, fingerprint, _cleaned):
+    return FIGURES[name](_cleaned)
+
+@st.cache_resource(max_entries=len(AGGREGATES))
+def build_aggregate(name, fingerprint, _cleaned):
+    return AGGREGATES[name](_cleaned)
+
+def show_figure(name, **kwargs):
+    st.plotly_chart(build_figure(name, cleaned.fingerprint, cleaned), use_container_width=True, **kwargs)
+
+def load_aggregate(name):
+    return build_aggregate(name, cleaned.fingerprint, cleaned)
+
+# The optimizer chart depends on the revenue cost of the slider as well
+@st.cache_resource(max_entries=100)
+def build_frontier_chart(fingerprint, revenue_cost, _frontier):
+    return frontier_chart(_frontier, knee_point(_frontier, revenue_cost))
+
+# The simulator replays the rentals themselves: the engines that only keep aggregates load and clean the xlsx for it. The
+# replications run on a process pool (see simulation.py), once per policy.
+@st.cache_resource(max_entries=1, show_spinner="Building the car timelines...")
+def load_timelines(fingerprint, _data):
+    return build_timelines(_data)
+
+@st.cache_data(max_entries=100, show_spinner="Simulating the policy...")
+def run_simulation(fingerprint, threshold, scope, policy, replications, _timelines):
+    baseline = simulate(_timelines, None, scope, policy, replications)
+    outcomes = simulate(_timelines, threshold, scope, policy, replications)
+    return pd.concat([baseline.assign(run="Without threshold"), outcomes.assign(run=f"{threshold} min ({scope}, {policy})")],
+                     ignore_index=True)
+
+# The pricing model (in-process) or the API session (remote) is loaded once and shared by the sessions, and the prices of a
+# car are cached: a sweep chart scores its whole grid in one call (see scoring.py)
+@st.cache_resource(show_spinner="Loading the pricing model...")
+def get_scorer(backend):
+    return load_scorer(backend)
+
+@st.cache_data(max_entries=1000, show_spinner=False)
+def predict_price(backend, car):
+    return float(get_scorer(backend).predict(pd.DataFrame([car]))[0])
+
+@st.cache_data(max_entries=1000, show_spinner="Scoring the price sweep...")
+def price_sweep(backend, car, feature):
+    grid = sweep(car, feature)
+    return pd.DataFrame({feature: grid[feature], "price": get_scorer(backend).predict(grid)})
 
 #################################################################### HOME PAGE ####################################################################
 
@@ -106,44 +179,48 @@ if page == "🏠 Home/Introduction":
     st.write("Raw Data")
     if st.checkbox('Show raw data'):
         st.subheader('Raw data')
-        st.write(data) 
+        if ANALYTICS_ENGINE in ("duckdb", "incremental"):
+            browser = load_row_browser(cleaned.fingerprint, load_all_cleaned_rows(cleaned.fingerprint))
+        else:
+            # The cube has no rentals: they are only loaded and cleaned when asked for
+            rows = cleaned if data is not None else load_cleaned_data(*load_raw_data())
+            browser = load_row_browser(rows.fingerprint, rows.data)
+
+        filter_labels = {"checkin_type": "Check-in type:", "state": "State:", "checkout_delay_category": "Checkout delay:"}
+        filters = {}
+        cols = st.columns(len(FILTER_COLUMNS) + 1)
+        for column, col in zip(FILTER_COLUMNS, cols):
+            with col:
+                filters[column] = st.multiselect(filter_labels[column], browser.values[column])
+        with cols[-1]:
+            car_id = st.number_input("Car id:", min_value=0, value=None, step=1, placeholder="All the cars")
+
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            sort_by = st.selectbox("Sort by:", list(browser.data.columns), index=None, placeholder="Order of the data")
+        with col2:
+            descending = st.checkbox("Descending", disabled=sort_by is None)
+        positions = browser.query(filters, car_id, sort_by, descending)
+        with col3:
+            page_number = st.number_input("Page:", min_value=1, max_value=max(1, -(-len(positions) // PAGE_ROWS)), value=1)
+
+        start = (page_number - 1) * PAGE_ROWS
+        st.caption(f"Rentals {min(start + 1, len(positions))} to {min(start + PAGE_ROWS, len(positions))} of {len(positions)} "
+                   f"matching, {len(browser)} in all")
+        st.dataframe(browser.page(positions, page_number - 1), use_container_width=True)
 
     
-    # Calculate the value counts of each delay category
-    delay_counts = data['checkout_delay_category'].value_counts()
-    # Calculate the percentage of each category
-    delay_percentages = (delay_counts / delay_counts.sum()) * 100
-
     st.markdown("""
     Firstly, we want to check the proportion of check-in type (`mobile` or `connect`) and the proportion of the rentals' states (`ended` or `canceled`).
     """)
 
     col1, col2 = st.columns([1, 2])
     with col1:
-        #visualisation of the percentage of the mobile vs connect check rental
-        checkin_counts = data["checkin_type"].value_counts().reset_index()
-        checkin_counts.columns = ["checkin_type", "count"]
-        fig1 = px.pie(checkin_counts, 
-                    names="checkin_type", 
-                    values="count", 
-                    title="Check-in Type Distribution",
-                    color_discrete_sequence=["#3CB371", "#FFA500"])
-        fig1.update_traces(textfont_color="black")
-        st.plotly_chart(fig1, use_container_width=True, key="1")
-
+        show_figure("checkin_type_pie", key="1")
 
     # Add text in the second column
     with col2:
-        #visualisation of the percentage of the mobile vs connect check rental
-        cancel_counts = data["state"].value_counts().reset_index()
-        cancel_counts.columns = ["state", "count"]
-        fig2 = px.pie(cancel_counts, 
-                    names="state", 
-                    values="count", 
-                    title="Proportion of rentals' states",
-                    color_discrete_sequence=["#3CB371", "#FFA500"])
-        fig2.update_traces(textfont_color="black")
-        st.plotly_chart(fig2, use_container_width=True, key="2")
+        show_figure("state_pie", key="2")
 
     st.markdown("""
     So, we see that the majority of check-in are made by mobile, only 20% are made by the connected car. 
@@ -153,65 +230,13 @@ if page == "🏠 Home/Introduction":
     st.markdown("""
                 Now let's check the distribution of checkout delays in function of category of time.
                 """)
-    # Count occurrences of each category
-    delay_counts = data["checkout_delay_category"].value_counts().reset_index()
-    delay_counts.columns = ["Category", "Count"]
-    delay_counts["Percentage"] = (delay_counts["Count"] / delay_counts["Count"].sum()) * 100
-    # Define custom colors
-    custom_colors = {
-        "Early or in time": "#FFA500",  # Orange
-    }
-    # Assign green as the default color
-    for category in delay_counts["Category"]:
-        if category not in custom_colors:
-            custom_colors[category] = "#3CB371"  # Green
-    # Create a bar chart
-    fig3 = px.bar(
-        delay_counts, 
-        x="Category", 
-        y="Count", 
-        title="Distribution of Checkout Delays", 
-        labels={"Category": "Checkout Delay Category", "Count": "Number of Rentals"},
-        color="Category",
-        text=delay_counts["Percentage"].apply(lambda x: f"{x:.1f}%"),
-        color_discrete_map=custom_colors,
-    )
-    fig3.update_traces(textfont_color="black")
-    fig3.update_xaxes(showgrid=False, tickfont=dict(color='black'))
-    fig3.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
-    fig3.update_layout(xaxis_title="", yaxis_title="", title_font=dict(weight="bold"), showlegend=False, xaxis=dict(zeroline=True,zerolinecolor="black",zerolinewidth=2), plot_bgcolor="#BDDFD6")
-    st.plotly_chart(fig3, use_container_width=True, theme=None)
+    show_figure("delay_distribution", theme=None)
     st.markdown("""
                 There is only 32.6% of rental checkout that are early or in time, without delay. 
                 For 23.4% we don't have informations. And the majoruty of delays are less than 2 hours.
                 """)
 
-    # Count occurrences of each category grouped by checkin_type
-    delay_counts = data.groupby(["checkout_delay_category", "checkin_type"]).size().reset_index(name="Count")
-    delay_counts["Percentage"] = (delay_counts["Count"] / delay_counts["Count"].sum()) * 100
-    # Create a grouped bar chart
-    fig4 = px.bar(
-        delay_counts, 
-        x="checkout_delay_category", 
-        y="Count", 
-        color="checkin_type",
-        title="Distribution of Checkout Delays by Check-in Type", 
-        labels={"checkout_delay_category": "Checkout Delay Category", "Count": "Number of Rentals", "checkin_type": "Check-in Type"},
-        barmode="group",  # Groups bars side by side
-        #text="Count",
-        text=delay_counts["Percentage"].apply(lambda x: f"{x:.1f}%"),
-        color_discrete_sequence=["#FFA500", "#3CB371"]
-    )
-    # Improve layout by setting custom order for x-axis
-    fig4.update_traces(textfont_color="black")
-    fig4.update_xaxes(showgrid=False, tickfont=dict(color='black'))
-    fig4.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
-    fig4.update_layout(xaxis_title="", yaxis_title="", title_font=dict(weight="bold"), xaxis=dict(zeroline=True,zerolinecolor="black",zerolinewidth=2), plot_bgcolor="#BDDFD6")
-    fig4.update_layout(xaxis={'categoryorder':'array', 'categoryarray': [
-        "Early or in time", "< 1 hour", "1 to 2 hours", "2 to 3 hours",
-        "3 to 6 hours", "6 to 12 hours", "12 to 24 hours", "1 day or more", "Unknown"
-    ]})
-    st.plotly_chart(fig4, use_container_width=True,  theme=None)
+    show_figure("delay_distribution_by_checkin", theme=None)
     st.markdown("""
                 There is much more delay problem with mobile checkin type than connect.
                 """)
@@ -247,56 +272,8 @@ elif page == "📊 Delays Analysis":
                 So, for the first question, here's the visualization of the check-out that are `late`, `early or in time` and the `unknown` data.
                 """)
     
-    # Count occurrences of category & group category as simple "late", "in time" or "unknown"
-    delay_drivers = data["checkout_delay_category"].apply(lambda x: "Early or in time" if x == "Early or in time"
-                                                                    else "Unkonwn" if x == "Unknown"
-                                                                    else "Late").value_counts().reset_index()
-    delay_drivers.columns = ["Category", "Count"]
-    delay_drivers["Percentage"] = (delay_drivers["Count"] / delay_drivers["Count"].sum()) * 100
-    # Create a bar chart
-    fig5 = px.bar(
-        delay_drivers, 
-        x="Category", 
-        y="Count", 
-        labels={"Category": "Checkout Delay Category", "Count": "Number of Rentals"},
-        title="Distribution of Checkout Delays", 
-        text=delay_drivers["Percentage"].apply(lambda x: f"{x:.1f}%"),
-        color_discrete_sequence=["#FFA500"],
-    )
-    fig5.update_traces(textfont_color="black")
-    fig5.update_xaxes(showgrid=False, tickfont=dict(color='black'))
-    fig5.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
-    fig5.update_layout(xaxis_title="", yaxis_title="", title_font=dict(weight="bold"), showlegend=False, xaxis=dict(zeroline=True,zerolinecolor="black",zerolinewidth=2), plot_bgcolor="#BDDFD6")
-    st.plotly_chart(fig5, use_container_width=True, theme=None)
-
-    # Count occurrences of each category
-    delay_counts = data["checkout_delay_category"].value_counts().reset_index()
-    delay_counts.columns = ["Category", "Count"]
-    delay_counts["Percentage"] = (delay_counts["Count"] / delay_counts["Count"].sum()) * 100
-    # Define custom colors
-    custom_colors = {
-        "Early or in time": "#FFA500",  # Orange
-    }
-    # Assign green as the default color
-    for category in delay_counts["Category"]:
-        if category not in custom_colors:
-            custom_colors[category] = "#3CB371"  # Green
-    # Create a bar chart
-    fig6 = px.bar(
-        delay_counts, 
-        x="Category", 
-        y="Count", 
-        title="Distribution of Checkout Delays", 
-        labels={"Category": "Checkout Delay Category", "Count": "Number of Rentals"},
-        color="Category",
-        text=delay_counts["Percentage"].apply(lambda x: f"{x:.1f}%"),
-        color_discrete_map=custom_colors,
-    )
-    fig6.update_traces(textfont_color="black")
-    fig6.update_xaxes(showgrid=False, tickfont=dict(color='black'))
-    fig6.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
-    fig6.update_layout(xaxis_title="", yaxis_title="", title_font=dict(weight="bold"), showlegend=False, xaxis=dict(zeroline=True,zerolinecolor="black",zerolinewidth=2), plot_bgcolor="#BDDFD6")
-    st.plotly_chart(fig6, use_container_width=True, theme=None)
+    show_figure("delay_status", theme=None)
+    show_figure("delay_distribution", theme=None)
 
     st.markdown("""
                 Only 32.6% of the check-out are early or in time, whereas almost half of the check-out (44%) are late.
@@ -306,165 +283,60 @@ elif page == "📊 Delays Analysis":
                 Now, for the 2nd question, let's see how delays impact the next driver.
                 """)
     
-    mean_delay_impact = data["time_delta_with_previous_rental_in_minutes"].mean()
-    min_delay_impact = data["time_delta_with_previous_rental_in_minutes"].min()
-    max_delay_impact = data["time_delta_with_previous_rental_in_minutes"].max()
+    delay_statistics = cleaned.delay_statistics
 
     st.markdown("#### Delay impacting informations on the next driver 🚘:")
 
-    st.write(f"▪️*Average delay impacting next driver:* {mean_delay_impact:.2f} minutes")
-    st.write(f"▪️*Minimum delay impacting next driver:* {min_delay_impact:.2f} minutes")
-    st.write(f"▪️*Maximum delay impacting next driver:* {max_delay_impact:.2f} minutes")
-
-    delay_impact = data
-
-    delay_impact["delta-late_checkout"] = delay_impact["time_delta_with_previous_rental_in_minutes"] - delay_impact["delay_at_checkout_in_minutes"]
-    #if negative delta - late checkout, it means that the new rental cannot do its check-in
-    negative_delay_impact = delay_impact[delay_impact["delta-late_checkout"] < 0]
-    late_checkout = delay_drivers[delay_drivers["Category"] == "Late"]["Count"][0]
-    nb_problematic_checkin_late = len(negative_delay_impact)
-    # percentage calculation
-    problematic_delays_rate = nb_problematic_checkin_late*100/late_checkout
-    st.write(f"▪️Among all the delays ({late_checkout}), {problematic_delays_rate:.3f}% \n of delays caused problems to the next rental because the checkout\n was made later than the new rental checkin.")
-
-    # Calculate the average duration of problematic delays
-    average_problematic_delay = negative_delay_impact['delay_at_checkout_in_minutes'].mean()
-    # Calculate the average duration of non-problematic delays
-    average_non_problematic_delay = data[data['delay_at_checkout_in_minutes'] > 0]['delay_at_checkout_in_minutes'].mean()
+    st.write(f"▪️*Average delay impacting next driver:* {delay_statistics['mean_delay_impact']:.2f} minutes")
+    st.write(f"▪️*Minimum delay impacting next driver:* {delay_statistics['min_delay_impact']:.2f} minutes")
+    st.write(f"▪️*Maximum delay impacting next driver:* {delay_statistics['max_delay_impact']:.2f} minutes")
+
+    problematic_delays_rate = delay_statistics["problematic_delays_rate"]
+    st.write(f"▪️Among all the delays ({delay_statistics['late_checkout']}), {problematic_delays_rate:.3f}% \n of delays caused problems to the next rental because the checkout\n was made later than the new rental checkin.")
+
     # Compare the averages
-    st.write(f"▪️Average Duration of Problematic Delays: {average_problematic_delay:.0f} minutes")
-    st.write(f"▪️Average Duration of Non-Problematic Delays: {average_non_problematic_delay:.0f} minutes")
+    st.write(f"▪️Average Duration of Problematic Delays: {delay_statistics['average_problematic_delay']:.0f} minutes")
+    st.write(f"▪️Average Duration of Non-Problematic Delays: {delay_statistics['average_non_problematic_delay']:.0f} minutes")
     
-    delay_impact["problematic_delay"] = delay_impact["delta-late_checkout"] < 0
-    delay_impact["problematic_delay"].value_counts()
-
-    fig7 = px.histogram(delay_impact, x="problematic_delay", color_discrete_sequence=["#FFA500"], title="Proportion of problematic delays"
-                )
-    fig7.update_xaxes(
-        categoryorder='array',
-        categoryarray=["Problematic", "Non-Problematic"],
-        showgrid=False, tickfont=dict(color='black')
-    )
-    fig7.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
-    fig7.add_annotation(x=3, y=10000,text=f"Avg Delay: {average_problematic_delay:.2f} min",showarrow=False)
-    fig7.add_annotation(x=2, y=10000,text=f"Avg Delay: {average_non_problematic_delay:.2f} min",showarrow=False)
-    fig7.update_layout(
-        xaxis=dict(
-            tickmode='array',
-            tickvals=[True, False],
-            ticktext=["Problematic Delay", "Non Problematic Delay"],
-            zeroline=True,zerolinecolor="black",zerolinewidth=2
-        ),
-        xaxis_title="",
-        yaxis_title="",
-        title_font=dict(weight="bold"),
-        showlegend=False,
-        plot_bgcolor="#BDDFD6"
-    )
-    fig7.update_traces(textfont_color="black")
-    st.plotly_chart(fig7, use_container_width=True, theme=None)
+    show_figure("problematic_delays", theme=None)
 
-    st.markdown("""
-                For the majority of cases, it poses no problem to have delay, but for 2.857% of the case it is problematic for the following rental.
+    st.markdown(f"""
+                For the majority of cases, it poses no problem to have delay, but for {problematic_delays_rate:.3f}% of the case it is problematic for the following rental.
                 """)
     
     st.subheader("📌 - Which share of our owner’s revenue would potentially be affected by the feature?",  divider="orange")
 
-    # Define the treshold of minimum time between 2 locations (minutes)
-    thresholds = [30, 60, 90, 120, 180, 360, 720, 1440]  # Example : 1 hour
-
-    data["mean_price_per_rental"] = mean_rental_per_day
-
-    treshold_data = data
-    percentage_revenue_impacted = []
-    percentage_revenue_impacted_displaying = {}
-
-    for threshold in thresholds:
-        treshold_data[f"affected_rentals_{threshold}"] = data["time_delta_with_previous_rental_in_minutes"] <= threshold
-        affected_rentals = data[data["time_delta_with_previous_rental_in_minutes"] <= threshold]
-        affected_revenue = affected_rentals["mean_price_per_rental"].sum()
-        total_revenue = data["mean_price_per_rental"].sum()
-        revenue_impact = (affected_revenue / total_revenue) * 100
-        percentage_revenue_impacted.append(revenue_impact)
-        percentage_revenue_impacted_displaying[threshold] = round(revenue_impact, 3)
+    threshold_index = cleaned.threshold_index
 
     col1, col2 = st.columns([1, 2])
     with col1:
         # Select a threshold
-        selected_threshold = st.selectbox("Select a threshold ⏳ (in minutes):", thresholds, key="selectbox_1")
+        selected_threshold = st.slider("Select a threshold ⏳ (in minutes):", 0, MAX_THRESHOLD, CHART_THRESHOLDS[0], key="threshold_1")
         # Display impacted revenue percentage
-        st.metric(label="💰 Impacted Revenue", value=f"{percentage_revenue_impacted_displaying[selected_threshold]}%")
+        st.metric(label="💰 Impacted Revenue", value=f"{round(threshold_index.revenue_impacted(selected_threshold), 3)}%")
     
     with col2:
-        affected_counts = [treshold_data[f"affected_rentals_{threshold}"].value_counts().get(True, 0) for threshold in thresholds]
-        affected_rentals_plot = pd.DataFrame({"Threshold (min)": thresholds, "Affected rentals": affected_counts})
-
-        fig8 = px.line(affected_rentals_plot, x="Threshold (min)", y="Affected rentals", text="Affected rentals",
-                    title="Number of rentals affected by the treshold",
-                    color_discrete_sequence=["#3CB371"],)
-        fig8.update_traces(textposition='top center', textfont_color="black")
-        fig8.update_xaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'), showline=True, linewidth=2, linecolor='black')
-        fig8.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
-        fig8.update_layout(xaxis_title="", yaxis_title="", title_font=dict(weight="bold"), showlegend=False, xaxis=dict(zeroline=True,zerolinecolor="black",zerolinewidth=2), plot_bgcolor="#BDDFD6")
-        st.plotly_chart(fig8, use_container_width=True, theme=None)
+        show_figure("affected_rentals", theme=None)
 
     
     st.subheader("📌 - How many rentals would be affected by the feature depending on the threshold and scope we choose?",  divider="orange")
 
-    all_affected_list = []
-    all_affected_display = {}
-    connect_affected_list = []
-    connect_affected_display = {}
-    all_affected_percentage = {}
-    connect_affected_percentage = {}
-
-    for threshold in thresholds:
-        all_rentals = len(data)
-        all_affected = data[data["time_delta_with_previous_rental_in_minutes"] <= threshold].shape[0]
-        all_affected_list.append(all_affected)
-        connect_affected = data[(data["time_delta_with_previous_rental_in_minutes"] <= threshold) & 
-                                (data["checkin_type"] == "connect")].shape[0]
-        connect_affected_list.append(connect_affected)
-        all_affected_display[threshold] = all_affected
-        connect_affected_display[threshold] = connect_affected
-        all_affected_percentage[threshold] = (all_affected / all_rentals) * 100
-        connect_affected_percentage[threshold] = (connect_affected / all_rentals) * 100
-
     # Select a threshold
-    selected_threshold = st.selectbox("Select a threshold ⏳ (in minutes):", thresholds, key="selectbox_2")
+    selected_threshold = st.slider("Select a threshold ⏳ (in minutes):", 0, MAX_THRESHOLD, CHART_THRESHOLDS[0], key="threshold_2")
     # Add a title before metrics
     st.markdown(f"#### 🚗 Rentals Affected by the {selected_threshold}-Minutes Threshold")
 
     col1, col2 = st.columns(2)
     # Display metrics side by side
     with col1:
-        st.metric(label="📲 All check-ins affected in number ⇩", value=f"{all_affected_display[selected_threshold]}")
-        st.metric(label="📲 All check-ins affected in % ⇩", value=f"{all_affected_percentage[selected_threshold]:.3f}")
+        st.metric(label="📲 All check-ins affected in number ⇩", value=f"{threshold_index.affected(selected_threshold)}")
+        st.metric(label="📲 All check-ins affected in % ⇩", value=f"{threshold_index.affected_percentage(selected_threshold):.3f}")
 
     with col2:
-        st.metric(label="🛜 Connect check-ins affected in number ⇩", value=f"{connect_affected_display[selected_threshold]}")
-        st.metric(label="🛜 Connect check-ins affected in % ⇩", value=f"{connect_affected_percentage[selected_threshold]:.3f}")
+        st.metric(label="🛜 Connect check-ins affected in number ⇩", value=f"{threshold_index.affected(selected_threshold, 'connect')}")
+        st.metric(label="🛜 Connect check-ins affected in % ⇩", value=f"{threshold_index.affected_percentage(selected_threshold, 'connect'):.3f}")
 
-    data_affected = pd.DataFrame({ "thresholds" : thresholds,
-                 "all_affected" : all_affected_list,
-                 "connect_affected" : connect_affected_list})
-    
-    fig9 = px.scatter(data_affected, x='thresholds', y='all_affected',
-                    color_discrete_sequence=["#FFA500"],
-                    labels={'all_affected': 'All Affected'},
-                    title="Rentals affected by Thresholds in function of the type of check-in")
-    # Add a line for 'all_affected'
-    fig9.add_trace(go.Scatter(x=data_affected['thresholds'], y=data_affected['all_affected'],
-        mode='lines+markers+text', line=dict(color='#FFA500'), name='All Affected', text=data_affected['all_affected']))
-
-    fig9.add_trace(go.Scatter(x=data_affected['thresholds'], y=data_affected['connect_affected'], 
-                        mode='lines+markers+text', marker_color='#3CB371', name='Connect Affected',
-                        text=data_affected['connect_affected'],))  # Texte à afficher sur les marqueurs
-    fig9.update_traces(textposition='top center', textfont_color="black")
-    fig9.update_xaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'), showline=True, linewidth=2, linecolor='black')
-    fig9.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
-    fig9.update_layout(xaxis_title="", yaxis_title="", title_font=dict(weight="bold"), showlegend=True, xaxis=dict(zeroline=True,zerolinecolor="black",zerolinewidth=2), plot_bgcolor="#BDDFD6")
-    st.plotly_chart(fig9, use_container_width=True, theme=None)
+    show_figure("affected_rentals_by_scope", theme=None)
 
     st.markdown("""
                 There are less rentals affected with the scope only on connected check-in than all 
@@ -473,38 +345,15 @@ elif page == "📊 Delays Analysis":
     
     st.subheader("📌 - How many problematic cases will it solve depending on the chosen threshold and scope?",  divider="orange")
 
-    solved_cases_all_list = []
-    solved_cases_connect_list = []
-
-    for threshold, i in zip(thresholds, range(len(thresholds))):
-
-        problematic_cases = negative_delay_impact[(negative_delay_impact["delay_at_checkout_in_minutes"] <= threshold)]
-        problematic_connectec_case = negative_delay_impact[(negative_delay_impact["delay_at_checkout_in_minutes"] <= threshold) & 
-                                                        (negative_delay_impact["checkin_type"] == "connect")]
-        total_problems_cases = len(negative_delay_impact)
-        total_connect_pb_cases = len(negative_delay_impact[negative_delay_impact["checkin_type"] == "connect"])
-
-        solved_cases = problematic_cases.shape[0]
-        solved_cases_all_list.append(solved_cases)
-        solved_cases_connect = problematic_connectec_case.shape[0]
-        solved_cases_connect_list.append(solved_cases_connect)
-
-        percentage_solved_all = (solved_cases / total_problems_cases) * 100
-        percentage_connect_solved = (solved_cases_connect / total_connect_pb_cases) * 100
-
-    # Convert to DataFrame
-    df_solved_cases = pd.DataFrame({
-        "Threshold (minutes)": thresholds,
-        "Solved Cases (All Check-ins)": solved_cases_all_list,
-        "Solved Cases (Connect Check-ins)": solved_cases_connect_list,
-        "Revenue Impacted (%)": percentage_revenue_impacted
-    })
-
     # Select a threshold with a slider
-    selected_threshold = st.selectbox("Select a threshold ⏳ (in minutes):", thresholds, key="selectbox_3")
+    selected_threshold = st.slider("Select a threshold ⏳ (in minutes):", 0, MAX_THRESHOLD, CHART_THRESHOLDS[0], key="threshold_3")
 
     # Get values for selected threshold
-    selected_data = df_solved_cases[df_solved_cases["Threshold (minutes)"] == selected_threshold].iloc[0]
+    selected_data = {
+        "Solved Cases (All Check-ins)": threshold_index.solved(selected_threshold),
+        "Solved Cases (Connect Check-ins)": threshold_index.solved(selected_threshold, "connect"),
+        "Revenue Impacted (%)": threshold_index.revenue_impacted(selected_threshold),
+    }
 
     # Display Metrics in Two Columns
     col1, col2, col3 = st.columns(3)
@@ -515,61 +364,84 @@ elif page == "📊 Delays Analysis":
     with col3:
         st.metric(label="💰 Revenue Impacted", value=f"{selected_data['Revenue Impacted (%)']:.2f} %")
 
-    # Create the figure
-    fig10 = go.Figure()
-    # Add line for "All Check-ins"
-    fig10.add_trace(go.Scatter(
-        x=thresholds, 
-        y=solved_cases_all_list, 
-        mode="lines+markers", 
-        name="Solved Cases (All Check-ins)", 
-        marker=dict(color="#FFA500")
-    ))
-    # Add line for "Connect Check-ins"
-    fig10.add_trace(go.Scatter(
-        x=thresholds, 
-        y=solved_cases_connect_list, 
-        mode="lines+markers", 
-        name="Solved Cases (Connect Check-ins)", 
-        marker=dict(color="#3CB371")
-    ))
-    # Add vertical dashed lines with text annotations
-    for i, threshold in enumerate(thresholds):
-        max_y_value = solved_cases_all_list[i]  # Ensure line stops at "Solved Cases (All Check-ins)"
-        
-        # Add dashed line from y=0 to y=max_y_value
-        fig10.add_trace(go.Scatter(
-            x=[threshold, threshold],  # Vertical line at threshold
-            y=[0, max_y_value],  # Stop at max_y_value
-            mode="lines",
-            line=dict(color="red", width=1.5, dash="dash"),
-            name="Revenue Impact Annotation" if i == 0 else None,  # Show legend only once
-            showlegend=(i == 0)
-        ))
-        # Add text annotation slightly above the dashed line
-        fig10.add_annotation(
-            x=threshold, 
-            y=max_y_value + 20,  # Position slightly above the dashed line
-            text=f"{percentage_revenue_impacted[i]:.2f}%",  # Format percentage
-            showarrow=False,
-            font=dict(size=10, color="red"),
-            align="center",
-        )
-    fig10.update_traces(textposition='top center', textfont_color="black")
-    fig10.update_xaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'), showline=True, linewidth=2, linecolor='black')
-    fig10.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
-    fig10.update_layout(title="Number of Problematic Cases Solved by Threshold",xaxis_title="",yaxis_title="", title_font=dict(weight="bold"),showlegend=True, xaxis=dict(zeroline=True,zerolinecolor="black",zerolinewidth=2), plot_bgcolor="#BDDFD6")
-    st.plotly_chart(fig10, use_container_width=True, theme=None)
+    show_figure("solved_cases", theme=None)
 
     st.markdown("""
                 #### 📊 Data Table""")
-    st.dataframe(df_solved_cases)
+    st.dataframe(load_aggregate("solved_cases_table"))
 
     st.markdown("""
                 Now, we can see the problematic cases solved in function of the check-in type (connect or all {mobile📲 + connect🛜}) 
                 with the impacted revenue percentage of each threshold. For me the best choice to solve problem without too much 
                 economical impact is to choose the threshold of **180** or **360** minutes, for the scope of all check-in type.""")
 
+    st.subheader("📌 - Which threshold and scope give the best trade-off?",  divider="orange")
+
+    st.markdown("""
+                Every threshold from 0 to 1440 minutes is evaluated for each scope (all📲🛜, connect🛜 and mobile📲 check-ins). 
+                The chart only keeps the best trade-offs: no other threshold or scope solves as many problematic cases for less 
+                revenue. The best of them depends on what the revenue is worth: choose how many % of the problematic cases 
+                solved are worth losing 1 % of the revenue.""")
+
+    # Every minute of every scope, from the cumulative histograms of the threshold index (see thresholds.py)
+    frontier = load_aggregate("threshold_frontier")
+    revenue_cost = st.slider("Revenue cost 💰 (% of solved cases worth 1 % of revenue):", 0.0, 50.0, 10.0, 0.5)
+    knee = knee_point(frontier, revenue_cost)
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric(label="⏳ Best Threshold", value=f"{knee['threshold']} min")
+    with col2:
+        st.metric(label="🎯 Best Scope", value=knee["scope"])
+    with col3:
+        st.metric(label="✅ Problematic Cases Solved", value=f"{knee['solved']} ({knee['solved_rate']:.1f} %)")
+    with col4:
+        st.metric(label="💰 Revenue Impacted", value=f"{knee['revenue_impacted']:.2f} %")
+
+    st.plotly_chart(build_frontier_chart(cleaned.fingerprint, revenue_cost, frontier), use_container_width=True, theme=None)
+
+    st.subheader("📌 - What happens when delays cascade from one rental to the next?",  divider="orange")
+
+    st.markdown("""
+                The analysis above only looks at a rental and the one before it. But a late driver can make the next driver late, 
+                who makes the next one late... This simulation replays the rentals of every car hundreds of times with checkout 
+                delays drawn from the real ones, and counts the blocked check-ins and the lost revenue (refused rentals and 
+                rentals canceled after a blocked check-in). With the **refuse** policy, the rentals too close to the previous one 
+                can't be booked; with the **shift** policy, they are moved later instead.""")
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        sim_threshold = st.number_input("Threshold ⏳ (minutes):", 0, MAX_THRESHOLD, 180, 30)
+    with col2:
+        sim_scope = st.selectbox("Scope 🎯:", SCOPES)
+    with col3:
+        sim_policy = st.radio("Policy 🚦:", POLICIES, horizontal=True)
+    with col4:
+        replications = st.slider("Replications 🎲:", 50, 1000, 200, 50)
+
+    if st.button("Run the simulation 🎲"):
+        rows = cleaned if ANALYTICS_ENGINE == "pandas" else load_cleaned_data(*load_raw_data())
+        outcomes = run_simulation(rows.fingerprint, sim_threshold, sim_scope, sim_policy, replications,
+                                  load_timelines(rows.fingerprint, rows.data))
+        means = outcomes.groupby("run", sort=False)[["blocked_checkins", "lost_revenue", "shifted"]].mean()
+        baseline, policy = means.iloc[0], means.iloc[1]
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric(label="🚧 Blocked Check-ins", value=f"{policy['blocked_checkins']:.0f}",
+                      delta=f"{policy['blocked_checkins'] - baseline['blocked_checkins']:.0f}", delta_color="inverse")
+        with col2:
+            st.metric(label="💰 Lost Revenue", value=f"{policy['lost_revenue']:.2f} %",
+                      delta=f"{policy['lost_revenue'] - baseline['lost_revenue']:.2f} %", delta_color="inverse")
+        with col3:
+            st.metric(label="➡️ Rentals Shifted", value=f"{policy['shifted']:.0f}")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.plotly_chart(simulation_histogram(outcomes, "blocked_checkins", "Blocked check-ins"), use_container_width=True, theme=None)
+        with col2:
+            st.plotly_chart(simulation_histogram(outcomes, "lost_revenue", "Lost revenue (%)"), use_container_width=True, theme=None)
+
     st.markdown("""
                 ✨ Thanks for reading all the way through! I hope you enjoyed it and found it interesting.
                 Go to the last page, `The End & Thank You`, for a little surprise and links to my other works‼️
@@ -579,18 +451,16 @@ elif page == "📊 Delays Analysis":
 elif page == "💸 Price Prediction":
     st.title("Price Prediction for a Rental 💸💶")
     st.markdown("""
-    Here, you can choose the parameters of a car and with a connection to my API, you can have a day price prediction of the car.
+    Here, you can choose the parameters of a car and with a connection to my API (or the model loaded in the app), you can have a day price prediction of the car.
     
     🟠 **What you'll find in this page**:
     * 🏎️ Object to select your car's characteristics?
     * 💸 A price prediction for one rental day.
+    * 📈 The price sensitivity of the car to its mileage and engine power.
                 """)
     
     st.write("Select the car parameters below and get an estimated rental price!")
 
-    # Define API URL
-    api_url = "https://hyraxuna-api-getaround.hf.space/predict"
-
     # Define input fields for car parameters
     car_model = st.selectbox("Car Brand:", ['Citroën','Peugeot','PGO','Renault','Audi','BMW','Mercedes','Opel','Volkswagen','Ferrari','Mitsubishi','Nissan','SEAT','Subaru','Toyota','other'])
     mileage = st.slider("Mileage (km):", 0, 600000, 50000, step=1000)
@@ -608,42 +478,56 @@ elif page == "💸 Price Prediction":
     has_speed_regulator = st.checkbox("Speed Regulator Installed")
     winter_tires = st.checkbox("Winter Tires Installed")
 
+    # Features of the selected car
+    car = {
+        "model_key": car_model, 
+        "mileage": mileage,
+        "engine_power": engine_power,
+        "fuel": fuel,
+        "paint_color": paint_color,
+        "car_type": car_type,
+        "private_parking_available": private_parking_available,
+        "has_gps": has_gps,
+        "has_air_conditioning": has_air_conditioning,
+        "automatic_car": automatic_car,
+        "has_getaround_connect": has_getaround_connect,
+        "has_speed_regulator": has_speed_regulator,
+        "winter_tires": winter_tires
+    }
+
     # Button to Predict
     if st.button("🔍 Predict Rental Price"):
         st.subheader("💶 Prediction Results")
 
-        # Prepare input data as JSON
-        input_data = {
-                    "model_key": car_model, 
-                    "mileage": mileage,
-                    "engine_power": engine_power,
-                    "fuel": fuel,
-                    "paint_color": paint_color,
-                    "car_type": car_type,
-                    "private_parking_available": private_parking_available,
-                    "has_gps": has_gps,
-                    "has_air_conditioning": has_air_conditioning,
-                    "automatic_car": automatic_car,
-                    "has_getaround_connect": has_getaround_connect,
-                    "has_speed_regulator": has_speed_regulator,
-                    "winter_tires": winter_tires
-                }
-
-        headers = {"Content-Type": "application/json"}
-
         try:
-            # API Request
-            response = requests.post(api_url, data=json.dumps(input_data), headers=headers)
-            result = response.json()
-
-            if response.status_code == 200:
-                predicted_price = result.get("prediction")
-                st.success(f"💰 Estimated Rental Price: **{predicted_price} € per day**")
-            else:
-                st.error("⚠️ Error fetching prediction. Please check API or try again.")
-        
+            predicted_price = predict_price(PRICING_BACKEND, car)
+            st.success(f"💰 Estimated Rental Price: **{predicted_price:.2f} € per day**")
         except Exception as e:
-            st.error(f"⚠️ API Request Failed: {e}")
+            st.error(f"⚠️ Prediction Failed ({PRICING_BACKEND} model): {e}")
+
+        # The sweeps are only scored once the price is asked for, not on every rerun of the page
+        st.subheader("📈 - Price sensitivity of the selected car",  divider="orange")
+        st.markdown("""
+                    How the price per day of the selected car changes with its mileage and its engine power, all the other parameters being the same.
+                    """)
+        sweep_labels = {"mileage": "Mileage (km)", "engine_power": "Engine Power (HP)"}
+        columns = st.columns(2)
+        for column, (feature, label) in zip(columns, sweep_labels.items()):
+            with column:
+                try:
+                    prices = price_sweep(PRICING_BACKEND, car, feature)
+                except Exception as e:
+                    st.error(f"⚠️ Price sweep Failed ({PRICING_BACKEND} model): {e}")
+                    continue
+                fig = px.line(prices, x=feature, y="price", title=f"Price per day vs. {label}",
+                              labels={feature: label, "price": "Price per day (€)"},
+                              color_discrete_sequence=["#3CB371"])
+                # Selected car
+                fig.add_vline(x=car[feature], line_dash="dash", line_color="#FFA500")
+                fig.update_xaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'), showline=True, linewidth=2, linecolor='black')
+                fig.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
+                fig.update_layout(xaxis_title=label, yaxis_title="", title_font=dict(weight="bold"), showlegend=False, plot_bgcolor="#BDDFD6")
+                st.plotly_chart(fig, use_container_width=True, theme=None)
 
 #################################################################### END & THANK YOU PAGE ####################################################################
 
@@ -0,0 +1,158 @@
+"""
+Precomputed aggregate cube of the dashboard.
+
+`build_cube` cleans the delay analysis xlsx and the pricing CSV offline (`pipeline.clean_data`) and
+materializes what the pages show into an uncompressed Arrow file whose size doesn't depend on the
+number of rentals. Each row is one of two groupings, by check-in type:
+
+* the number of rentals per check-in type, state, checkout delay category and problematic delay
+  (`threshold` is null). The counts per category and status of the pages are sums of them;
+* the deltas with the previous rental and the previous delays of the problematic delays, binned
+  on the threshold grid (`threshold`: every minute up to `MAX_THRESHOLD`, then infinity): the
+  number of rentals (`rentals`) and of problematic delays (`solved`) that a threshold starts to
+  affect or solve at this minute. The `ThresholdIndex` of the pages is built from them, and
+  answers the whole minutes up to `MAX_THRESHOLD` like the one of the rentals.
+
+The statistics of the Delays page, the number of outliers, the mean rental price and the bounds of
+the outlier filter are in the schema metadata.
+
+    python cube.py --output delay_cube.arrow
+
+With `ANALYTICS_ENGINE=cube`, the app only reads this file (`read_cube`): the sources aren't
+downloaded, parsed or cleaned, and the rentals are only loaded when "Show raw data" is ticked.
+
+The schema metadata also records the version of the layout (`CUBE_VERSION`) and the fingerprint
+of the sources (`pipeline.frames_fingerprint`). A cube of another version is rejected and has to
+be built again.
+
+Settings (environment variables):
+
+* `CUBE_PATH`: path of the cube file (default `delay_cube.arrow`).
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from datasets import load_dataset, read_cache
+from delay_features import DELAY_CATEGORIES, DELAY_STATUSES
+from pipeline import CleanedData, clean_data, sorted_counts
+from thresholds import MAX_THRESHOLD, SCOPES, ThresholdIndex
+
+CUBE_VERSION = 1
+CUBE_PATH = os.environ.get("CUBE_PATH", "delay_cube.arrow")
+METADATA_KEY = b"delay_cube"
+CATEGORY_KEYS = ["checkin_type", "state", "checkout_delay_category", "problematic_delay"]
+# Status of each checkout delay category (see `delay_features.delay_statuses`)
+CATEGORY_STATUSES = {**dict.fromkeys(DELAY_CATEGORIES, DELAY_STATUSES[0]),
+                     "Early or in time": DELAY_STATUSES[1], "Unknown": DELAY_STATUSES[2]}
+
+
+def threshold_bins(values):
+    """
+    Bin of each value on the threshold grid: the first whole minute (0 to `MAX_THRESHOLD`) whose
+    threshold reaches it, infinity beyond. `value <= threshold` and `bin <= threshold` agree for
+    every whole threshold up to `MAX_THRESHOLD`.
+    """
+    return np.where(values > MAX_THRESHOLD, np.inf, np.clip(np.ceil(values), 0, None))
+
+
+def build_cube(raw_data, raw_data_price):
+    """Arrow table of the cube of the raw frames, with its metadata."""
+    delays = raw_data["delay_at_checkout_in_minutes"]
+    cleaned = clean_data(raw_data, raw_data_price)
+    data = cleaned.data
+    metadata = {
+        "version": CUBE_VERSION,
+        "fingerprint": cleaned.fingerprint,
+        "mean_rental_per_day": cleaned.mean_rental_per_day,
+        "mean_delay": float(delays.mean()),
+        "std_delay": float(delays.std()),
+        "num_outliers": cleaned.num_outliers,
+        "delay_statistics": {name: float(value) for name, value in cleaned.delay_statistics.items()},
+    }
+
+    categories = data.groupby(CATEGORY_KEYS, observed=True).size().reset_index(name="rentals")
+    deltas = data["time_delta_with_previous_rental_in_minutes"]
+    problematic = data[data["problematic_delay"]]
+    bins = pd.concat([
+        pd.DataFrame({"checkin_type": data["checkin_type"], "threshold": threshold_bins(deltas.to_numpy()),
+                      "rentals": 1, "solved": 0})[deltas.notna().to_numpy()],
+        pd.DataFrame({"checkin_type": problematic["checkin_type"], "rentals": 0, "solved": 1,
+                      "threshold": threshold_bins(problematic["previous_delay_at_checkout_in_minutes"].to_numpy())}),
+    ]).groupby(["checkin_type", "threshold"])[["rentals", "solved"]].sum().reset_index()
+    cube = pd.concat([categories.assign(checkout_delay_category=categories["checkout_delay_category"].astype(str), solved=0), bins],
+                     ignore_index=True)
+    table = pa.Table.from_pandas(cube[[*CATEGORY_KEYS, "threshold", "rentals", "solved"]], preserve_index=False)
+    return table.replace_schema_metadata({**(table.schema.metadata or {}), METADATA_KEY: json.dumps(metadata).encode()})
+
+
+def write_cube(table, path=CUBE_PATH):
+    """Save the cube (atomically: the app may be reading the previous one)."""
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    feather.write_feather(table, temporary_path, compression="uncompressed")
+    os.replace(temporary_path, path)
+
+
+def cube_metadata(path=CUBE_PATH):
+    """Metadata of the cube, from the schema of the file only."""
+    with pa.memory_map(path) as source:
+        metadata = json.loads(pa.ipc.open_file(source).schema.metadata[METADATA_KEY])
+    if metadata["version"] != CUBE_VERSION:
+        raise ValueError(f"{path} is a cube of version {metadata['version']}, expected {CUBE_VERSION}: build it again with cube.py")
+    return metadata
+
+
+def read_cube(path=CUBE_PATH):
+    """`CleanedData` of the cube, like `pipeline.clean_data` of its sources, without `data`."""
+    metadata = cube_metadata(path)
+    cube = read_cache(path)
+    counts, bins = cube[cube["threshold"].isna()], cube[cube["threshold"].notna()]
+    rentals = counts["rentals"]
+    categories = pd.Categorical(counts["checkout_delay_category"], categories=DELAY_CATEGORIES, ordered=True)
+    statuses = pd.Categorical(counts["checkout_delay_category"].map(CATEGORY_STATUSES), categories=DELAY_STATUSES, ordered=True)
+
+    def counts_by(keys, name):
+        counts = rentals.groupby(keys, observed=True).sum().rename_axis(name)
+        return sorted_counts(counts.set_axis(counts.index.astype(str)) if isinstance(counts.index, pd.CategoricalIndex) else counts)
+
+    delay_counts_by_checkin = rentals.groupby([categories, counts["checkin_type"]], observed=True).sum().rename(None)
+    delay_counts_by_checkin.index.names = ["checkout_delay_category", "checkin_type"]
+
+    def binned(column, scope):
+        scope_bins = bins if scope == "all" else bins[bins["checkin_type"] == scope]
+        scope_bins = scope_bins.groupby("threshold")[column].sum()
+        scope_bins = scope_bins[scope_bins > 0]
+        return scope_bins.index.to_numpy(dtype=float), scope_bins.to_numpy()
+
+    threshold_index = ThresholdIndex(int(rentals.sum()), metadata["mean_rental_per_day"],
+                                     {scope: binned("rentals", scope) for scope in SCOPES},
+                                     {scope: binned("solved", scope) for scope in SCOPES})
+    return CleanedData(
+        fingerprint=metadata["fingerprint"],
+        data=None,
+        num_outliers=metadata["num_outliers"],
+        mean_rental_per_day=metadata["mean_rental_per_day"],
+        checkin_type_counts=counts_by(counts["checkin_type"], "checkin_type"),
+        state_counts=counts_by(counts["state"], "state"),
+        delay_counts=counts_by(categories, "checkout_delay_category"),
+        delay_counts_by_checkin=delay_counts_by_checkin[delay_counts_by_checkin > 0],
+        delay_status_counts=counts_by(statuses, "checkout_delay_status"),
+        problematic_counts=counts_by(counts["problematic_delay"].astype(bool), "problematic_delay"),
+        delay_statistics=metadata["delay_statistics"],
+        threshold_index=threshold_index,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=CUBE_PATH, help="Path of the cube file")
+    args = parser.parse_args()
+
+    table = build_cube(load_dataset("delay"), load_dataset("pricing"))
+    write_cube(table, args.output)
+    print(f"{args.output}: {table.num_rows} rows, {os.path.getsize(args.output) / 1e3:.0f} kB")
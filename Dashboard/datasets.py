@@ -0,0 +1,176 @@
+"""
+Local columnar cache of the dashboard datasets.
+
+The delay analysis xlsx and the pricing CSV are downloaded and parsed once, with explicit dtypes,
+then saved as uncompressed Arrow (Feather) files in `DATA_CACHE_DIR`, named after the ETag of the
+source (remote) or the SHA-256 of its content (local file). Later starts, including new processes
+and replicas sharing the directory, load the Arrow file memory-mapped instead of parsing the
+source again.
+
+Settings (environment variables):
+
+* `DATA_SOURCE`: `remote` (default) reads the S3 files, and falls back on the last cached version
+  then on the bundled files when S3 can't be reached; `local` only reads the bundled files.
+* `DATA_CACHE_DIR`: directory of the cache (default `data_cache`).
+* `DATA_REFRESH_SECONDS`: how long the app keeps the loaded datasets before checking the sources
+  again (default 3600).
+"""
+import glob
+import hashlib
+import io
+import os
+from dataclasses import dataclass, field
+
+import pandas as pd
+import pyarrow.feather as feather
+import requests
+
+DATA_SOURCE = os.environ.get("DATA_SOURCE", "remote")
+DATA_CACHE_DIR = os.environ.get("DATA_CACHE_DIR", "data_cache")
+DATA_REFRESH_SECONDS = int(os.environ.get("DATA_REFRESH_SECONDS", 3600))
+REQUEST_TIMEOUT = 10  # seconds
+
+# The bundled copies of the sources are looked up next to the app, then at the root of the repository
+LOCAL_DIRS = [os.path.dirname(os.path.abspath(__file__)), os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+
+
+@dataclass(frozen=True)
+class Dataset:
+    url: str
+    filename: str
+    dtypes: dict
+    read_options: dict = field(default_factory=dict)
+
+    def parse(self, content):
+        """DataFrame of the raw bytes of the source, with the dtypes of the dataset."""
+        if self.filename.endswith(".xlsx"):
+            data = pd.read_excel(io.BytesIO(content), **self.read_options)
+        else:
+            data = pd.read_csv(io.BytesIO(content), **self.read_options)
+        return data.astype(self.dtypes).reset_index(drop=True)
+
+
+DATASETS = {
+    "delay": Dataset(
+        url="https://full-stack-assets.s3.eu-west-3.amazonaws.com/Deployment/get_around_delay_analysis.xlsx",
+        filename="get_around_delay_analysis.xlsx",
+        dtypes={
+            "rental_id": "int64",
+            "car_id": "int64",
+            "checkin_type": "str",
+            "state": "str",
+            "delay_at_checkout_in_minutes": "float64",
+            "previous_ended_rental_id": "float64",
+            "time_delta_with_previous_rental_in_minutes": "float64",
+        },
+    ),
+    "pricing": Dataset(
+        url="https://full-stack-assets.s3.eu-west-3.amazonaws.com/Deployment/get_around_pricing_project.csv",
+        filename="get_around_pricing_project.csv",
+        dtypes={
+            "model_key": "str",
+            "mileage": "int64",
+            "engine_power": "int64",
+            "fuel": "str",
+            "paint_color": "str",
+            "car_type": "str",
+            "private_parking_available": "bool",
+            "has_gps": "bool",
+            "has_air_conditioning": "bool",
+            "automatic_car": "bool",
+            "has_getaround_connect": "bool",
+            "has_speed_regulator": "bool",
+            "winter_tires": "bool",
+            "rental_price_per_day": "int64",
+        },
+        read_options={"index_col": 0},
+    ),
+}
+
+
+def local_path(dataset):
+    """Path of the bundled copy of the dataset, None if there is none."""
+    for directory in LOCAL_DIRS:
+        path = os.path.join(directory, dataset.filename)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def cache_path(name, key, cache_dir=DATA_CACHE_DIR):
+    return os.path.join(cache_dir, f"{name}-{key}.arrow")
+
+
+def cached_versions(name, cache_dir=DATA_CACHE_DIR):
+    """Cached files of the dataset, the most recent first."""
+    return sorted(glob.glob(os.path.join(cache_dir, f"{name}-*.arrow")), key=os.path.getmtime, reverse=True)
+
+
+def read_cache(path):
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def write_cache(name, key, data, cache_dir=DATA_CACHE_DIR):
+    """Save the dataset under its key (atomically, for concurrent starts) and remove its older versions."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(name, key, cache_dir)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    feather.write_feather(data, temporary_path, compression="uncompressed")
+    os.replace(temporary_path, path)
+    for old_path in cached_versions(name, cache_dir):
+        if old_path != path:
+            os.remove(old_path)
+    return path
+
+
+def remote_key(dataset):
+    """ETag of the remote source (HEAD request), None if it can't be reached."""
+    try:
+        response = requests.head(dataset.url, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    etag = response.headers.get("ETag")
+    # Without an ETag, the content is hashed after the download
+    return hashlib.sha256(etag.strip('"').encode()).hexdigest()[:16] if etag else ""
+
+
+def load_local(name, dataset, cache_dir=DATA_CACHE_DIR):
+    path = local_path(dataset)
+    if path is None:
+        raise FileNotFoundError(f"No bundled copy of {dataset.filename} in {LOCAL_DIRS}")
+    with open(path, "rb") as file:
+        content = file.read()
+    key = hashlib.sha256(content).hexdigest()[:16]
+    if os.path.exists(cache_path(name, key, cache_dir)):
+        return read_cache(cache_path(name, key, cache_dir))
+    data = dataset.parse(content)
+    write_cache(name, key, data, cache_dir)
+    return data
+
+
+def load_remote(name, dataset, cache_dir=DATA_CACHE_DIR):
+    key = remote_key(dataset)
+    if key is None:
+        # S3 can't be reached: last cached version, else the bundled copy
+        versions = cached_versions(name, cache_dir)
+        if versions:
+            return read_cache(versions[0])
+        return load_local(name, dataset, cache_dir)
+    if key and os.path.exists(cache_path(name, key, cache_dir)):
+        return read_cache(cache_path(name, key, cache_dir))
+    response = requests.get(dataset.url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    data = dataset.parse(response.content)
+    write_cache(name, key or hashlib.sha256(response.content).hexdigest()[:16], data, cache_dir)
+    return data
+
+
+def load_dataset(name, source=DATA_SOURCE, cache_dir=DATA_CACHE_DIR):
+    """DataFrame of the dataset `name` (see `DATASETS`), from the cache when the source didn't change."""
+    if source not in ("remote", "local"):
+        raise ValueError(f"Unknown data source {source!r}, expected 'remote' or 'local'")
+    dataset = DATASETS[name]
+    if source == "local":
+        return load_local(name, dataset, cache_dir)
+    return load_remote(name, dataset, cache_dir)
@@ -0,0 +1,165 @@
+"""
+Out-of-core engine of the delay analysis, on DuckDB.
+
+`clean_parquet` returns the same `CleanedData` as `pipeline.clean_data`, from Parquet files with
+the schema of the delay analysis xlsx instead of an in-memory DataFrame. The join to the previous
+rentals, the 3σ outlier filter, the delay categories and the threshold scopes are one SQL query
+over the files, run by DuckDB on all the cores within `DUCKDB_MEMORY_LIMIT` (spilling to
+`DUCKDB_TEMP_DIR` beyond it). Only a summary comes back to Python: the number of rentals per
+distinct combination of the columns the pages aggregate (`pipeline.SUMMARY_KEYS`), whose size
+depends on the number of distinct values, not on the number of rentals. The counts, statistics and
+`ThresholdIndex` of the pages are derived from it by `pipeline.summary_to_cleaned`; `data` is a
+preview of the first cleaned rows. `cleaned_rows` queries all of them, for the raw data viewer.
+
+Settings (environment variables):
+
+* `ANALYTICS_ENGINE`: `pandas` (default) cleans the xlsx in memory (see pipeline.py), `duckdb`
+  queries the Parquet files of `DELAY_PARQUET`, `incremental` reads the state of the ingested
+  batches (see ingestion.py), `cube` only reads the precomputed aggregates (see cube.py).
+* `DELAY_PARQUET`: path or glob of the Parquet files of the delay analysis data.
+* `DUCKDB_THREADS`: threads of DuckDB (default 0: all the cores).
+* `DUCKDB_MEMORY_LIMIT`: memory limit of DuckDB (default `2GB`).
+* `DUCKDB_TEMP_DIR`: directory of the spilled data (default `duckdb_tmp`).
+"""
+import glob
+import hashlib
+import os
+
+import pandas as pd
+
+from delay_features import DELAY_CATEGORIES, DELAY_CUT_POINTS, DELAY_STATUSES
+from pipeline import SUMMARY_KEYS, summary_to_cleaned
+
+ANALYTICS_ENGINE = os.environ.get("ANALYTICS_ENGINE", "pandas")
+DELAY_PARQUET = os.environ.get("DELAY_PARQUET", "delay_analysis/*.parquet")
+DUCKDB_THREADS = int(os.environ.get("DUCKDB_THREADS", 0))
+DUCKDB_MEMORY_LIMIT = os.environ.get("DUCKDB_MEMORY_LIMIT", "2GB")
+DUCKDB_TEMP_DIR = os.environ.get("DUCKDB_TEMP_DIR", "duckdb_tmp")
+PREVIEW_ROWS = 1000
+
+
+def sql_list(values):
+    return "[" + ", ".join("'" + str(value).replace("'", "''") + "'" for value in values) + "]"
+
+
+# Code of the checkout delay category (see `delay_features.categorize_delays`): 0 when early or in
+# time, then 1 + the number of cut points the delay reaches, the last code when unknown
+CATEGORY_CODE = (
+    f"CASE WHEN delay_at_checkout_in_minutes IS NULL THEN {len(DELAY_CATEGORIES) - 1} "
+    "WHEN delay_at_checkout_in_minutes <= 0 THEN 0 "
+    "ELSE 1" + "".join(f" + (delay_at_checkout_in_minutes >= {cut_point})::INTEGER" for cut_point in DELAY_CUT_POINTS) + " END"
+)
+# Code of the Late / Early or in time / Unknown status (see `DELAY_STATUSES`)
+STATUS_CODE = ("CASE WHEN delay_at_checkout_in_minutes IS NULL THEN 2 "
+               "WHEN delay_at_checkout_in_minutes > 0 THEN 0 ELSE 1 END")
+
+# Mean and standard deviation of the checkout delays, of the outlier filter
+STATS_QUERY = """
+SELECT avg(delay_at_checkout_in_minutes) AS mean_delay,
+       stddev_samp(delay_at_checkout_in_minutes) AS std_delay
+FROM rentals
+"""
+
+# Rentals joined to their previous rental, with the problematic delays (see
+# `delay_features.add_delay_features`). Only the rentals referenced as a previous rental are kept on
+# the build side of the join.
+JOINED_QUERY = """
+WITH previous AS (
+    SELECT rental_id,
+           delay_at_checkout_in_minutes AS previous_delay_at_checkout_in_minutes,
+           checkin_type AS previous_checkin_type,
+           state AS previous_state
+    FROM rentals
+    WHERE rental_id IN (SELECT CAST(previous_ended_rental_id AS BIGINT) FROM rentals WHERE previous_ended_rental_id IS NOT NULL)
+),
+joined AS (
+    SELECT rentals.*,
+           previous.* EXCLUDE (rental_id),
+           time_delta_with_previous_rental_in_minutes - previous_delay_at_checkout_in_minutes AS "delta-late_checkout",
+           coalesce("delta-late_checkout" < 0, false) AS problematic_delay
+    FROM rentals LEFT JOIN previous ON previous.rental_id = CAST(rentals.previous_ended_rental_id AS BIGINT)
+)
+"""
+
+# Summary of the rentals (see `pipeline.summarize`), outliers included
+SUMMARY_QUERY = JOINED_QUERY + f"""
+SELECT {", ".join(SUMMARY_KEYS[:-1])},
+       CASE WHEN problematic_delay THEN previous_delay_at_checkout_in_minutes END AS problematic_previous_delay,
+       count(*) AS rentals
+FROM joined
+GROUP BY ALL
+"""
+
+# Cleaned rentals (see `pipeline.clean_data`): without the outliers, with the derived delay columns
+CLEANED_QUERY = JOINED_QUERY + f"""
+, cleaned AS (
+    SELECT joined.*, {CATEGORY_CODE} AS category_code, {STATUS_CODE} AS status_code
+    FROM joined
+    WHERE delay_at_checkout_in_minutes IS NULL
+       OR delay_at_checkout_in_minutes BETWEEN $mean_delay - 3 * $std_delay AND $mean_delay + 3 * $std_delay
+)
+SELECT cleaned.* EXCLUDE (category_code, status_code, "delta-late_checkout", problematic_delay),
+       {sql_list(DELAY_CATEGORIES)}[category_code + 1] AS checkout_delay_category,
+       coalesce(delay_at_checkout_in_minutes > 0, false) AS late_checkout,
+       {sql_list(DELAY_STATUSES)}[status_code + 1] AS checkout_delay_status,
+       "delta-late_checkout",
+       problematic_delay
+FROM cleaned
+"""
+
+
+def parquet_files(paths=DELAY_PARQUET):
+    """Parquet files of a path, a glob or a list of them."""
+    paths = [paths] if isinstance(paths, str) else paths
+    files = sorted(file for path in paths for file in glob.glob(path))
+    if not files:
+        raise FileNotFoundError(f"No Parquet file matches {paths}")
+    return files
+
+
+def parquet_fingerprint(paths=DELAY_PARQUET):
+    """Short hash of the path, size and modification time of the Parquet files."""
+    digest = hashlib.sha256()
+    for file in parquet_files(paths):
+        stat = os.stat(file)
+        digest.update(f"{os.path.abspath(file)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def connect(paths=DELAY_PARQUET, threads=DUCKDB_THREADS, memory_limit=DUCKDB_MEMORY_LIMIT, temp_dir=DUCKDB_TEMP_DIR):
+    """In-memory DuckDB connection with the `rentals` view over the Parquet files."""
+    import duckdb
+
+    connection = duckdb.connect(config={"memory_limit": memory_limit, "temp_directory": temp_dir,
+                                        "preserve_insertion_order": False})
+    if threads > 0:
+        connection.execute(f"SET threads = {threads}")
+    connection.read_parquet(parquet_files(paths)).create_view("rentals")
+    return connection
+
+
+def query_cleaned(connection, mean_delay, std_delay, limit=None):
+    """Cleaned rentals (the first `limit` ones when given), with the categories of `delay_features`."""
+    query = CLEANED_QUERY if limit is None else f"{CLEANED_QUERY} LIMIT {int(limit)}"
+    rows = connection.execute(query, {"mean_delay": mean_delay, "std_delay": std_delay}).df()
+    return rows.assign(
+        checkout_delay_category=pd.Categorical(rows["checkout_delay_category"], categories=DELAY_CATEGORIES, ordered=True),
+        checkout_delay_status=pd.Categorical(rows["checkout_delay_status"], categories=DELAY_STATUSES, ordered=True),
+    )
+
+
+def clean_parquet(paths, mean_rental_per_day, fingerprint=None, preview_rows=PREVIEW_ROWS, **connect_options):
+    """`CleanedData` of the Parquet files, like `pipeline.clean_data` of the same rentals."""
+    with connect(paths, **connect_options) as connection:
+        mean_delay, std_delay = connection.execute(STATS_QUERY).fetchone()
+        summary = connection.execute(SUMMARY_QUERY).df()
+        preview = query_cleaned(connection, mean_delay, std_delay, preview_rows) if preview_rows else None
+    return summary_to_cleaned(summary, mean_delay, std_delay, mean_rental_per_day,
+                              fingerprint or parquet_fingerprint(paths), preview)
+
+
+def cleaned_rows(paths=DELAY_PARQUET, **connect_options):
+    """All the cleaned rentals of the Parquet files, like the `data` of `pipeline.clean_data`."""
+    with connect(paths, **connect_options) as connection:
+        mean_delay, std_delay = connection.execute(STATS_QUERY).fetchone()
+        return query_cleaned(connection, mean_delay, std_delay)
@@ -0,0 +1,297 @@
+"""
+Charts and aggregates of the dashboard pages.
+
+Every chart is built by a function of the aggregates of the `CleanedData` of the pipeline (see
+pipeline.py), registered in `FIGURES` under its name. The app caches the figures and the
+aggregates per dataset fingerprint, and a page only builds the charts it renders: a chart is
+built once per dataset, then every visit of its page reuses it. The "Distribution of Checkout Delays" bar of the Home and Delays
+pages is the same figure.
+"""
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from delay_features import DELAY_CATEGORIES
+from thresholds import CHART_THRESHOLDS, pareto_frontier, sweep_thresholds
+
+# Colors of the scopes in the threshold optimizer chart
+SCOPE_COLORS = {"all": "#FFA500", "connect": "#3CB371", "mobile": "#1E90FF"}
+
+
+def checkin_type_pie(cleaned):
+    #visualisation of the percentage of the mobile vs connect check rental
+    checkin_counts = cleaned.checkin_type_counts.reset_index()
+    checkin_counts.columns = ["checkin_type", "count"]
+    fig = px.pie(checkin_counts,
+                 names="checkin_type",
+                 values="count",
+                 title="Check-in Type Distribution",
+                 color_discrete_sequence=["#3CB371", "#FFA500"])
+    fig.update_traces(textfont_color="black")
+    return fig
+
+
+def state_pie(cleaned):
+    cancel_counts = cleaned.state_counts.reset_index()
+    cancel_counts.columns = ["state", "count"]
+    fig = px.pie(cancel_counts,
+                 names="state",
+                 values="count",
+                 title="Proportion of rentals' states",
+                 color_discrete_sequence=["#3CB371", "#FFA500"])
+    fig.update_traces(textfont_color="black")
+    return fig
+
+
+def delay_distribution(cleaned):
+    # Count occurrences of each category
+    delay_counts = cleaned.delay_counts.reset_index()
+    delay_counts.columns = ["Category", "Count"]
+    delay_counts["Percentage"] = (delay_counts["Count"] / delay_counts["Count"].sum()) * 100
+    # "Early or in time" in orange, the delays in green
+    custom_colors = {category: "#FFA500" if category == "Early or in time" else "#3CB371" for category in delay_counts["Category"]}
+    fig = px.bar(
+        delay_counts,
+        x="Category",
+        y="Count",
+        title="Distribution of Checkout Delays",
+        labels={"Category": "Checkout Delay Category", "Count": "Number of Rentals"},
+        color="Category",
+        text=delay_counts["Percentage"].apply(lambda x: f"{x:.1f}%"),
+        color_discrete_map=custom_colors,
+    )
+    fig.update_traces(textfont_color="black")
+    fig.update_xaxes(showgrid=False, tickfont=dict(color='black'))
+    fig.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
+    fig.update_layout(xaxis_title="", yaxis_title="", title_font=dict(weight="bold"), showlegend=False, xaxis=dict(zeroline=True, zerolinecolor="black", zerolinewidth=2), plot_bgcolor="#BDDFD6")
+    return fig
+
+
+def delay_distribution_by_checkin(cleaned):
+    # Count occurrences of each category grouped by checkin_type
+    delay_counts = cleaned.delay_counts_by_checkin.reset_index(name="Count")
+    delay_counts["Percentage"] = (delay_counts["Count"] / delay_counts["Count"].sum()) * 100
+    # Create a grouped bar chart
+    fig = px.bar(
+        delay_counts,
+        x="checkout_delay_category",
+        y="Count",
+        color="checkin_type",
+        title="Distribution of Checkout Delays by Check-in Type",
+        labels={"checkout_delay_category": "Checkout Delay Category", "Count": "Number of Rentals", "checkin_type": "Check-in Type"},
+        barmode="group",  # Groups bars side by side
+        text=delay_counts["Percentage"].apply(lambda x: f"{x:.1f}%"),
+        color_discrete_sequence=["#FFA500", "#3CB371"]
+    )
+    fig.update_traces(textfont_color="black")
+    fig.update_xaxes(showgrid=False, tickfont=dict(color='black'))
+    fig.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
+    fig.update_layout(xaxis_title="", yaxis_title="", title_font=dict(weight="bold"), xaxis=dict(zeroline=True, zerolinecolor="black", zerolinewidth=2), plot_bgcolor="#BDDFD6")
+    # Custom order of the x-axis
+    fig.update_layout(xaxis={'categoryorder': 'array', 'categoryarray': DELAY_CATEGORIES})
+    return fig
+
+
+def delay_status(cleaned):
+    # Late / Early or in time / Unknown checkouts
+    delay_drivers = cleaned.delay_status_counts.reset_index()
+    delay_drivers.columns = ["Category", "Count"]
+    delay_drivers["Percentage"] = (delay_drivers["Count"] / delay_drivers["Count"].sum()) * 100
+    fig = px.bar(
+        delay_drivers,
+        x="Category",
+        y="Count",
+        labels={"Category": "Checkout Delay Category", "Count": "Number of Rentals"},
+        title="Distribution of Checkout Delays",
+        text=delay_drivers["Percentage"].apply(lambda x: f"{x:.1f}%"),
+        color_discrete_sequence=["#FFA500"],
+    )
+    fig.update_traces(textfont_color="black")
+    fig.update_xaxes(showgrid=False, tickfont=dict(color='black'))
+    fig.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
+    fig.update_layout(xaxis_title="", yaxis_title="", title_font=dict(weight="bold"), showlegend=False, xaxis=dict(zeroline=True, zerolinecolor="black", zerolinewidth=2), plot_bgcolor="#BDDFD6")
+    return fig
+
+
+def problematic_delays(cleaned):
+    statistics = cleaned.delay_statistics
+    # Histogram of the 2 counts instead of the whole column: same bars, without sending every rental to the browser
+    problematic_counts = cleaned.problematic_counts.reset_index()
+    fig = px.histogram(problematic_counts, x="problematic_delay", y="count", histfunc="sum", color_discrete_sequence=["#FFA500"], title="Proportion of problematic delays")
+    fig.update_xaxes(
+        categoryorder='array',
+        categoryarray=["Problematic", "Non-Problematic"],
+        showgrid=False, tickfont=dict(color='black')
+    )
+    fig.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
+    fig.add_annotation(x=3, y=10000, text=f"Avg Delay: {statistics['average_problematic_delay']:.2f} min", showarrow=False)
+    fig.add_annotation(x=2, y=10000, text=f"Avg Delay: {statistics['average_non_problematic_delay']:.2f} min", showarrow=False)
+    fig.update_layout(
+        xaxis=dict(
+            tickmode='array',
+            tickvals=[True, False],
+            ticktext=["Problematic Delay", "Non Problematic Delay"],
+            zeroline=True, zerolinecolor="black", zerolinewidth=2
+        ),
+        xaxis_title="",
+        yaxis_title="",
+        title_font=dict(weight="bold"),
+        showlegend=False,
+        plot_bgcolor="#BDDFD6"
+    )
+    fig.update_traces(textfont_color="black", hovertemplate="problematic_delay=%{x}<br>count=%{y}<extra></extra>")
+    return fig
+
+
+def threshold_table(cleaned):
+    """Metrics of the thresholds of the charts (see `ThresholdIndex.table`)."""
+    return cleaned.threshold_index.table(CHART_THRESHOLDS)
+
+
+def solved_cases_table(cleaned):
+    """Data table of the "How many problematic cases will it solve" section of the Delays page."""
+    table = threshold_table(cleaned)
+    return pd.DataFrame({
+        "Threshold (minutes)": table["threshold"],
+        "Solved Cases (All Check-ins)": table["solved_all"],
+        "Solved Cases (Connect Check-ins)": table["solved_connect"],
+        "Revenue Impacted (%)": table["revenue_impacted"],
+    })
+
+
+def threshold_frontier(cleaned):
+    """Pareto frontier of every threshold (minute) and scope (see `thresholds.pareto_frontier`)."""
+    return pareto_frontier(sweep_thresholds(cleaned.threshold_index))
+
+
+def affected_rentals(cleaned):
+    table = threshold_table(cleaned)
+    affected_rentals_plot = pd.DataFrame({"Threshold (min)": table["threshold"], "Affected rentals": table["all_affected"]})
+    fig = px.line(affected_rentals_plot, x="Threshold (min)", y="Affected rentals", text="Affected rentals",
+                  title="Number of rentals affected by the treshold",
+                  color_discrete_sequence=["#3CB371"],)
+    fig.update_traces(textposition='top center', textfont_color="black")
+    fig.update_xaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'), showline=True, linewidth=2, linecolor='black')
+    fig.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
+    fig.update_layout(xaxis_title="", yaxis_title="", title_font=dict(weight="bold"), showlegend=False, xaxis=dict(zeroline=True, zerolinecolor="black", zerolinewidth=2), plot_bgcolor="#BDDFD6")
+    return fig
+
+
+def affected_rentals_by_scope(cleaned):
+    data_affected = threshold_table(cleaned).rename(columns={"threshold": "thresholds"})
+    fig = px.scatter(data_affected, x='thresholds', y='all_affected',
+                     color_discrete_sequence=["#FFA500"],
+                     labels={'all_affected': 'All Affected'},
+                     title="Rentals affected by Thresholds in function of the type of check-in")
+    # Add a line for 'all_affected'
+    fig.add_trace(go.Scatter(x=data_affected['thresholds'], y=data_affected['all_affected'],
+                             mode='lines+markers+text', line=dict(color='#FFA500'), name='All Affected', text=data_affected['all_affected']))
+    fig.add_trace(go.Scatter(x=data_affected['thresholds'], y=data_affected['connect_affected'],
+                             mode='lines+markers+text', marker_color='#3CB371', name='Connect Affected',
+                             text=data_affected['connect_affected'],))  # Texte à afficher sur les marqueurs
+    fig.update_traces(textposition='top center', textfont_color="black")
+    fig.update_xaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'), showline=True, linewidth=2, linecolor='black')
+    fig.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
+    fig.update_layout(xaxis_title="", yaxis_title="", title_font=dict(weight="bold"), showlegend=True, xaxis=dict(zeroline=True, zerolinecolor="black", zerolinewidth=2), plot_bgcolor="#BDDFD6")
+    return fig
+
+
+def solved_cases(cleaned):
+    table = threshold_table(cleaned)
+    thresholds = table["threshold"].tolist()
+    solved_cases_all_list = table["solved_all"].tolist()
+    solved_cases_connect_list = table["solved_connect"].tolist()
+    percentage_revenue_impacted = table["revenue_impacted"].tolist()
+
+    fig = go.Figure()
+    # Add line for "All Check-ins"
+    fig.add_trace(go.Scatter(
+        x=thresholds,
+        y=solved_cases_all_list,
+        mode="lines+markers",
+        name="Solved Cases (All Check-ins)",
+        marker=dict(color="#FFA500")
+    ))
+    # Add line for "Connect Check-ins"
+    fig.add_trace(go.Scatter(
+        x=thresholds,
+        y=solved_cases_connect_list,
+        mode="lines+markers",
+        name="Solved Cases (Connect Check-ins)",
+        marker=dict(color="#3CB371")
+    ))
+    # Add vertical dashed lines with text annotations
+    for i, threshold in enumerate(thresholds):
+        max_y_value = solved_cases_all_list[i]  # Ensure line stops at "Solved Cases (All Check-ins)"
+
+        # Add dashed line from y=0 to y=max_y_value
+        fig.add_trace(go.Scatter(
+            x=[threshold, threshold],  # Vertical line at threshold
+            y=[0, max_y_value],  # Stop at max_y_value
+            mode="lines",
+            line=dict(color="red", width=1.5, dash="dash"),
+            name="Revenue Impact Annotation" if i == 0 else None,  # Show legend only once
+            showlegend=(i == 0)
+        ))
+        # Add text annotation slightly above the dashed line
+        fig.add_annotation(
+            x=threshold,
+            y=max_y_value + 20,  # Position slightly above the dashed line
+            text=f"{percentage_revenue_impacted[i]:.2f}%",  # Format percentage
+            showarrow=False,
+            font=dict(size=10, color="red"),
+            align="center",
+        )
+    fig.update_traces(textposition='top center', textfont_color="black")
+    fig.update_xaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'), showline=True, linewidth=2, linecolor='black')
+    fig.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
+    fig.update_layout(title="Number of Problematic Cases Solved by Threshold", xaxis_title="", yaxis_title="", title_font=dict(weight="bold"), showlegend=True, xaxis=dict(zeroline=True, zerolinecolor="black", zerolinewidth=2), plot_bgcolor="#BDDFD6")
+    return fig
+
+
+def frontier_chart(frontier, knee):
+    """Pareto frontier of the threshold optimizer, with its knee point (see `thresholds.knee_point`)."""
+    fig = px.scatter(frontier, x="revenue_impacted", y="solved_rate", color="scope", hover_data=["threshold", "solved", "affected"],
+                     color_discrete_map=SCOPE_COLORS, title="Best trade-offs between solved cases and impacted revenue",
+                     labels={"revenue_impacted": "Revenue impacted (%)", "solved_rate": "Problematic cases solved (%)"})
+    fig.add_trace(go.Scatter(x=frontier["revenue_impacted"], y=frontier["solved_rate"], mode="lines",
+                             line=dict(color="#A9A9A9", dash="dot"), hoverinfo="skip", showlegend=False))
+    fig.add_trace(go.Scatter(x=[knee["revenue_impacted"]], y=[knee["solved_rate"]], mode="markers+text",
+                             marker=dict(color="red", size=14, symbol="star"), name="Best trade-off",
+                             text=[f"{knee['threshold']} min ({knee['scope']})"], textposition="bottom right"))
+    fig.update_traces(textfont_color="black")
+    fig.update_xaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'), showline=True, linewidth=2, linecolor='black')
+    fig.update_yaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
+    fig.update_layout(title_font=dict(weight="bold"), showlegend=True, plot_bgcolor="#BDDFD6")
+    return fig
+
+
+def simulation_histogram(outcomes, column, label):
+    """Distribution of an outcome of the Monte Carlo replications (see simulation.py), without and with the policy."""
+    fig = px.histogram(outcomes, x=column, color="run", barmode="overlay", opacity=0.7,
+                       color_discrete_sequence=["#A9A9A9", "#FFA500"], title=f"{label} per replication",
+                       labels={column: label, "run": ""})
+    fig.update_xaxes(showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'), showline=True, linewidth=2, linecolor='black')
+    fig.update_yaxes(title="Replications", showgrid=True, gridcolor='#A9A9A9', tickfont=dict(color='black'))
+    fig.update_layout(title_font=dict(weight="bold"), showlegend=True, plot_bgcolor="#BDDFD6")
+    return fig
+
+
+# Charts of the pages, by name
+FIGURES = {
+    "checkin_type_pie": checkin_type_pie,
+    "state_pie": state_pie,
+    "delay_distribution": delay_distribution,
+    "delay_distribution_by_checkin": delay_distribution_by_checkin,
+    "delay_status": delay_status,
+    "problematic_delays": problematic_delays,
+    "affected_rentals": affected_rentals,
+    "affected_rentals_by_scope": affected_rentals_by_scope,
+    "solved_cases": solved_cases,
+}
+
+# Aggregates of the pages, by name
+AGGREGATES = {
+    "solved_cases_table": solved_cases_table,
+    "threshold_frontier": threshold_frontier,
+}
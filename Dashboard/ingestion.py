@@ -0,0 +1,291 @@
+"""
+Incremental ingestion of the delay analysis data.
+
+New rentals arrive every day, and `pipeline.clean_data` goes through the whole history again for
+each of them. `IncrementalCleaner` keeps what the cleaning needs between the batches, so that
+ingesting a batch mostly costs the size of the batch:
+
+* running statistics of the checkout delays: count, mean and sum of squared deviations, merged
+  with the ones of the batch by the parallel form of Welford's algorithm. They give the mean and
+  standard deviation of the 3σ outlier filter without reading the history again;
+* the summary of the rentals (`pipeline.summarize`): the number of rentals per checkout delay,
+  check-in type, state, delta with the previous rental and problematic delay, outliers included.
+  The counts per category, the statistics and the threshold histograms of the pages are derived
+  from it with the current filter (`pipeline.summary_to_cleaned`);
+* the rentals with their derived delay columns, one chunk per batch;
+* an index of the rentals: the chunk and row of each `rental_id`, sorted by id, and the rentals
+  waiting for their previous rental (`previous_ended_rental_id` not ingested yet).
+
+A batch only appends rentals: a batch with a `rental_id` already ingested is rejected. Its rentals
+are joined to their previous rental, in the history or in the batch, and the rentals of the
+history whose previous rental arrives in the batch are joined again (their summary counts are
+replaced). The index answers the three lookups with binary searches (`np.searchsorted`) on the
+ids of the batch, instead of scanning every chunk. `check_consistency` compares the result with
+a full rebuild of the history.
+
+The state is saved in `INGESTION_DIR` (environment variable, default `ingestion_state`):
+`state.json`, the summary, the index and the chunks as Arrow files. A save only writes the chunks
+that changed.
+
+    python ingestion.py ingest new_rentals.xlsx
+    python ingestion.py check
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+from datasets import DATASETS, load_dataset, read_cache
+from delay_features import PREVIOUS_RENTAL_COLUMNS, add_delay_features, add_previous_rental
+from pipeline import clean_data, frames_fingerprint, is_inlier, merge_summaries, summarize, summary_to_cleaned
+from thresholds import MAX_THRESHOLD
+
+INGESTION_DIR = os.environ.get("INGESTION_DIR", "ingestion_state")
+RAW_COLUMNS = list(DATASETS["delay"].dtypes)
+# Columns that change when a rental is joined to its previous rental
+JOINED_COLUMNS = [*PREVIOUS_RENTAL_COLUMNS.values(), "delta-late_checkout", "problematic_delay"]
+# Index of the rentals (sorted by rental_id) and of the rentals waiting for their previous rental
+INDEX_DTYPES = {"rental_id": "int64", "chunk": "int32", "row": "int32"}
+WAITING_DTYPES = {"previous_ended_rental_id": "int64", "rental_id": "int64"}
+# Fields of `CleanedData` that `check_consistency` compares exactly (the statistics are compared with a tolerance)
+COUNT_FIELDS = ["num_outliers", "checkin_type_counts", "state_counts", "delay_counts", "delay_counts_by_checkin",
+                "delay_status_counts", "problematic_counts"]
+
+
+def read_batch(path):
+    """Rentals of an xlsx, CSV or Parquet file with the columns of the delay analysis data."""
+    if path.endswith(".xlsx"):
+        return pd.read_excel(path)
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def featurize(rentals, previous_rentals):
+    """
+    Rentals with their derived delay columns, joined to their previous rental among
+    `previous_rentals` and themselves.
+    """
+    context = pd.concat([previous_rentals[RAW_COLUMNS], rentals[RAW_COLUMNS]], ignore_index=True)
+    return add_delay_features(add_previous_rental(context)).iloc[len(previous_rentals):].reset_index(drop=True)
+
+
+def empty_frame(dtypes):
+    return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()})
+
+
+def insert_sorted(index, rows):
+    """Rows of the index (sorted by rental_id) and of `rows` (sorted by rental_id), sorted by rental_id."""
+    positions = np.searchsorted(index["rental_id"].to_numpy(), rows["rental_id"].to_numpy())
+    return pd.DataFrame({column: np.insert(index[column].to_numpy(), positions, rows[column].to_numpy().astype(dtype))
+                         for column, dtype in INDEX_DTYPES.items()})
+
+
+def write_arrow(data, path):
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    feather.write_feather(data, temporary_path, compression="uncompressed")
+    os.replace(temporary_path, path)
+
+
+class IncrementalCleaner:
+    def __init__(self):
+        self.count = 0  # checkout delays (not null)
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of the squared deviations from the mean
+        self.summary = None
+        self.chunks = []
+        self.index = empty_frame(INDEX_DTYPES)
+        self.waiting = empty_frame(WAITING_DTYPES)
+        self.dirty = set()  # positions of the chunks changed since the last save
+        self.fingerprint = ""  # of the batches, in their order
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks)
+
+    def delay_moments(self):
+        """Mean and standard deviation (ddof 1, like `Series.std`) of the checkout delays."""
+        mean = self.mean if self.count else np.nan
+        return mean, np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def update_moments(self, delays):
+        delays = delays.dropna().to_numpy()
+        if not len(delays):
+            return
+        count, mean = len(delays), delays.mean()
+        m2 = ((delays - mean) ** 2).sum()
+        delta = mean - self.mean
+        total = self.count + count
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def rows(self):
+        """All the ingested rentals, with their derived delay columns, in the order of ingestion."""
+        return pd.concat(self.chunks, ignore_index=True) if self.chunks else pd.DataFrame(columns=RAW_COLUMNS)
+
+    def cleaned_rows(self):
+        """The ingested rentals without the outliers of the current filter, like the `data` of `pipeline.clean_data`."""
+        data = self.rows()
+        return data[is_inlier(data["delay_at_checkout_in_minutes"], *self.delay_moments())]
+
+    def locate(self, rental_ids):
+        """Positions in the index of the ingested rentals among `rental_ids`, and the mask of the ingested ones."""
+        rental_ids = np.asarray(rental_ids, dtype=np.int64)
+        indexed_ids = self.index["rental_id"].to_numpy()
+        positions = np.searchsorted(indexed_ids, rental_ids)
+        found = positions < len(indexed_ids)
+        found[found] = indexed_ids[positions[found]] == rental_ids[found]
+        return positions[found], found
+
+    def take(self, positions):
+        """Rentals of the positions of the index, chunk by chunk, with the position of their chunk."""
+        for chunk, rows in self.index.iloc[positions].groupby("chunk")["row"]:
+            yield chunk, self.chunks[chunk].iloc[rows.to_numpy()]
+
+    def ingest(self, batch):
+        """Append the rentals of `batch` (columns of the delay analysis data) and update the aggregates."""
+        batch = batch[RAW_COLUMNS].astype(DATASETS["delay"].dtypes).reset_index(drop=True)
+        rental_ids = batch["rental_id"]
+        if rental_ids.duplicated().any() or self.locate(rental_ids)[1].any():
+            raise ValueError("The batch has rentals that are already ingested (rental_id), the ingestion only appends rentals")
+
+        previous_ids = batch["previous_ended_rental_id"].dropna()
+        previous_positions, previous_found = self.locate(previous_ids)
+        # Several rentals of the batch can follow the same rental
+        previous_rentals = [rentals[RAW_COLUMNS] for _, rentals in self.take(np.unique(previous_positions))]
+        rows = featurize(batch, pd.concat(previous_rentals) if previous_rentals else batch.iloc[:0])
+        summaries = [] if self.summary is None else [self.summary]
+        summaries.append(summarize(rows))
+
+        # The rentals of the history whose previous rental is in the batch weren't joined to it yet
+        arrived = self.waiting["previous_ended_rental_id"].isin(rental_ids).to_numpy()
+        for position, waiting in self.take(self.locate(self.waiting["rental_id"][arrived])[0]):
+            joined = featurize(waiting, batch).set_axis(waiting.index)
+            removed = summarize(waiting)
+            summaries += [removed.assign(rentals=-removed["rentals"]), summarize(joined)]
+            chunk = self.chunks[position].copy(deep=False)
+            chunk.loc[waiting.index, JOINED_COLUMNS] = joined[JOINED_COLUMNS]
+            self.chunks[position] = chunk
+            self.dirty.add(position)
+
+        self.summary = merge_summaries(*summaries)
+        self.chunks.append(rows)
+        self.dirty.add(len(self.chunks) - 1)
+        order = np.argsort(rental_ids.to_numpy(), kind="stable")
+        self.index = insert_sorted(self.index, pd.DataFrame({"rental_id": rental_ids.to_numpy()[order],
+                                                             "chunk": len(self.chunks) - 1, "row": order}))
+        # Rentals of the batch whose previous rental is neither in the history nor in the batch
+        waiting = previous_ids[~previous_found & ~previous_ids.isin(rental_ids).to_numpy()]
+        self.waiting = pd.concat([
+            self.waiting[~arrived],
+            pd.DataFrame({"previous_ended_rental_id": waiting.to_numpy(), "rental_id": rental_ids[waiting.index].to_numpy()}),
+        ], ignore_index=True).astype(WAITING_DTYPES)
+        self.update_moments(batch["delay_at_checkout_in_minutes"])
+        self.fingerprint = hashlib.sha256((self.fingerprint + frames_fingerprint(batch)).encode()).hexdigest()[:16]
+
+    def cleaned(self, mean_rental_per_day, fingerprint=None, preview_rows=None):
+        """
+        `CleanedData` of the ingested rentals, like `pipeline.clean_data` of the whole history. Its
+        `data` is the first `preview_rows` cleaned rentals when given: copying all of them costs the
+        size of the history.
+        """
+        mean_delay, std_delay = self.delay_moments()
+        if preview_rows is None:
+            data = self.cleaned_rows()
+        else:
+            previews = []
+            for chunk in self.chunks:
+                if sum(map(len, previews)) >= preview_rows:
+                    break
+                inliers = is_inlier(chunk["delay_at_checkout_in_minutes"], mean_delay, std_delay).to_numpy()
+                previews.append(chunk.iloc[np.flatnonzero(inliers)[:preview_rows]])
+            data = pd.concat(previews, ignore_index=True).head(preview_rows)
+        return summary_to_cleaned(self.summary, mean_delay, std_delay, mean_rental_per_day,
+                                  fingerprint or self.fingerprint, data)
+
+    def save(self, directory=INGESTION_DIR):
+        os.makedirs(directory, exist_ok=True)
+        for position in sorted(self.dirty):
+            write_arrow(self.chunks[position], os.path.join(directory, f"chunk-{position:05d}.arrow"))
+        write_arrow(self.summary, os.path.join(directory, "summary.arrow"))
+        write_arrow(self.index, os.path.join(directory, "index.arrow"))
+        write_arrow(self.waiting, os.path.join(directory, "waiting.arrow"))
+        state = {"count": self.count, "mean": self.mean, "m2": self.m2, "fingerprint": self.fingerprint,
+                 "chunks": len(self.chunks)}
+        temporary_path = os.path.join(directory, f"state.json.{os.getpid()}.tmp")
+        with open(temporary_path, "w") as file:
+            json.dump(state, file)
+        os.replace(temporary_path, os.path.join(directory, "state.json"))
+        self.dirty.clear()
+
+    @classmethod
+    def load(cls, directory=INGESTION_DIR):
+        """Saved state of `directory`, an empty one when nothing was ingested yet."""
+        cleaner = cls()
+        if not os.path.exists(os.path.join(directory, "state.json")):
+            return cleaner
+        with open(os.path.join(directory, "state.json")) as file:
+            state = json.load(file)
+        cleaner.count, cleaner.mean, cleaner.m2 = state["count"], state["mean"], state["m2"]
+        cleaner.fingerprint = state["fingerprint"]
+        cleaner.summary = read_cache(os.path.join(directory, "summary.arrow"))
+        cleaner.chunks = [read_cache(os.path.join(directory, f"chunk-{position:05d}.arrow"))
+                          for position in range(state["chunks"])]
+        cleaner.index = read_cache(os.path.join(directory, "index.arrow"))
+        cleaner.waiting = read_cache(os.path.join(directory, "waiting.arrow"))
+        return cleaner
+
+
+def state_fingerprint(directory=INGESTION_DIR):
+    """Fingerprint of the saved state (changes with every ingested batch), without loading it."""
+    with open(os.path.join(directory, "state.json")) as file:
+        return json.load(file)["fingerprint"]
+
+
+def same(actual, expected):
+    return actual.equals(expected) if isinstance(expected, pd.Series) else actual == expected
+
+
+def check_consistency(cleaner, raw_data_price):
+    """
+    Fields of the `CleanedData` of `cleaner` that differ from a full rebuild (`pipeline.clean_data`
+    of the ingested rentals), an empty list when it is consistent.
+    """
+    expected = clean_data(cleaner.rows()[RAW_COLUMNS], raw_data_price)
+    actual = cleaner.cleaned(expected.mean_rental_per_day)
+    mismatches = [name for name in COUNT_FIELDS if not same(getattr(actual, name), getattr(expected, name))]
+    mismatches += [name for name, value in expected.delay_statistics.items()
+                   if not np.isclose(actual.delay_statistics[name], value, equal_nan=True)]
+    thresholds = np.arange(MAX_THRESHOLD + 1)
+    if not actual.threshold_index.table(thresholds).equals(expected.threshold_index.table(thresholds)):
+        mismatches.append("threshold_index")
+    if not actual.data.equals(expected.data):
+        mismatches.append("data")
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=INGESTION_DIR, help="Directory of the ingestion state")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="Append the rentals of xlsx, CSV or Parquet files")
+    ingest_parser.add_argument("files", nargs="+")
+    commands.add_parser("check", help="Compare the aggregates with a full rebuild of the history")
+    args = parser.parse_args()
+
+    cleaner = IncrementalCleaner.load(args.dir)
+    if args.command == "ingest":
+        for path in args.files:
+            batch = read_batch(path)
+            cleaner.ingest(batch)
+            print(f"{path}: {len(batch)} rentals ingested, {len(cleaner)} in total")
+        cleaner.save(args.dir)
+    else:
+        mismatches = check_consistency(cleaner, load_dataset("pricing"))
+        print(f"Inconsistent fields: {', '.join(mismatches)}" if mismatches else f"Consistent ({len(cleaner)} rentals)")
+        sys.exit(1 if mismatches else 0)
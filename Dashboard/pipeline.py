@@ -0,0 +1,196 @@
+"""
+Cleaning pipeline of the dashboard.
+
+`clean_data` takes the raw delay analysis and pricing frames and returns a `CleanedData`: the
+cleaned delay frame with its derived columns, and the aggregates the pages share. It doesn't
+modify its inputs, and the app caches its result per fingerprint of the inputs
+(`st.cache_resource`), so a widget interaction only costs the lookups of the page. The result is
+shared between the sessions: the pages read it and never add or change columns.
+
+The charts only read the aggregates, so a `CleanedData` can also be derived from a summary of the
+rentals (`summarize`, `summary_to_cleaned`): the number of rentals per distinct combination of the
+aggregated columns, before the outlier filter. The out-of-core engine (duckdb_engine.py) and the
+incremental ingestion (ingestion.py) build it without holding the rentals in one frame.
+"""
+import hashlib
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from delay_features import add_delay_features, add_previous_rental, categorize_delays, category_counts, delay_statuses
+from thresholds import ThresholdIndex
+
+# Columns of a summary of the rentals (see `summarize`), whose `rentals` column is the number of
+# rentals of each distinct combination. The previous delay is only kept for the problematic delays.
+SUMMARY_KEYS = ["delay_at_checkout_in_minutes", "checkin_type", "state", "time_delta_with_previous_rental_in_minutes",
+                "problematic_delay", "problematic_previous_delay"]
+
+
+@dataclass(frozen=True)
+class CleanedData:
+    fingerprint: str  # of the raw frames, see `frames_fingerprint`
+    data: pd.DataFrame  # delay analysis data without the outliers, with the derived delay columns (DuckDB engine: its first rows)
+    num_outliers: int
+    mean_rental_per_day: float
+    checkin_type_counts: pd.Series  # rentals per check-in type
+    state_counts: pd.Series  # rentals per state
+    delay_counts: pd.Series  # rentals per checkout delay category
+    delay_counts_by_checkin: pd.Series  # rentals per checkout delay category and check-in type
+    delay_status_counts: pd.Series  # rentals per Late / Early or in time / Unknown status
+    problematic_counts: pd.Series  # rentals per `problematic_delay` (True / False)
+    delay_statistics: dict  # see `delay_statistics`
+    threshold_index: ThresholdIndex
+
+
+def frames_fingerprint(*frames):
+    """Short hash of the content (values, index and columns) of the frames."""
+    digest = hashlib.sha256()
+    for frame in frames:
+        digest.update(",".join(map(str, frame.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def is_inlier(delays, mean_delay_checkout, std_delay_checkout):
+    """
+    Checkout delays within 3 standard deviations of the mean. The rentals without delay are kept, to
+    keep the information of the canceled rentals.
+    """
+    inliers = (delays <= mean_delay_checkout + 3 * std_delay_checkout) & (delays >= mean_delay_checkout - 3 * std_delay_checkout)
+    return inliers | delays.isna()
+
+
+def remove_outliers(data):
+    """Rentals whose checkout delay is not an outlier (see `is_inlier`), and the number of removed rentals."""
+    delays = data["delay_at_checkout_in_minutes"]
+    outliers = ~is_inlier(delays, delays.mean(), delays.std())
+    return data[~outliers], int(outliers.sum())
+
+
+def delay_statistics(data, delay_status_counts):
+    """Figures of the "How often are drivers late" section of the Delays page."""
+    deltas = data["time_delta_with_previous_rental_in_minutes"]
+    #if negative delta - late checkout of the previous rental, it means that the new rental cannot do its check-in
+    problematic_delays = data.loc[data["problematic_delay"], "previous_delay_at_checkout_in_minutes"]
+    late_checkout = int(delay_status_counts["Late"])
+    return {
+        "mean_delay_impact": deltas.mean(),
+        "min_delay_impact": deltas.min(),
+        "max_delay_impact": deltas.max(),
+        "late_checkout": late_checkout,
+        "problematic_delays_rate": len(problematic_delays) * 100 / late_checkout,
+        "average_problematic_delay": problematic_delays.mean(),
+        "average_non_problematic_delay": data.loc[data["delay_at_checkout_in_minutes"] > 0, "delay_at_checkout_in_minutes"].mean(),
+    }
+
+
+def clean_data(raw_data, raw_data_price, fingerprint=None):
+    """`CleanedData` of the raw frames. `fingerprint` is the one of the raw frames, when it is already known."""
+    # Each rental is joined to the previous rental of the car (previous_ended_rental_id) before the outliers are removed,
+    # so a rental keeps the delay of its previous rental even when that delay is an outlier
+    data, num_outliers = remove_outliers(add_previous_rental(raw_data))
+    data = add_delay_features(data)
+    mean_rental_per_day = float(raw_data_price["rental_price_per_day"].mean())
+    delay_status_counts = category_counts(data["checkout_delay_status"])
+    return CleanedData(
+        fingerprint=fingerprint or frames_fingerprint(raw_data, raw_data_price),
+        data=data,
+        num_outliers=num_outliers,
+        mean_rental_per_day=mean_rental_per_day,
+        checkin_type_counts=data["checkin_type"].value_counts(),
+        state_counts=data["state"].value_counts(),
+        delay_counts=category_counts(data["checkout_delay_category"]),
+        delay_counts_by_checkin=data.groupby(["checkout_delay_category", "checkin_type"], observed=True).size(),
+        delay_status_counts=delay_status_counts,
+        problematic_counts=data["problematic_delay"].value_counts(),
+        delay_statistics=delay_statistics(data, delay_status_counts),
+        threshold_index=ThresholdIndex.from_data(data, mean_rental_per_day),
+    )
+
+
+def summarize(data):
+    """
+    Summary (see `SUMMARY_KEYS`) of delay analysis data joined to the previous rentals, with the
+    derived delay columns (`add_delay_features`), outliers included.
+    """
+    keys = data[SUMMARY_KEYS[:-1]].assign(
+        problematic_previous_delay=data["previous_delay_at_checkout_in_minutes"].where(data["problematic_delay"]))
+    return keys.groupby(SUMMARY_KEYS, dropna=False).size().reset_index(name="rentals")
+
+
+def merge_summaries(*summaries):
+    """Sum of summaries. A summary with negative counts removes rentals."""
+    summary = pd.concat(summaries, ignore_index=True).groupby(SUMMARY_KEYS, dropna=False)["rentals"].sum().reset_index()
+    return summary[summary["rentals"] != 0].reset_index(drop=True)
+
+
+def sorted_counts(counts):
+    """Counts sorted like `value_counts`: the most frequent first, without the absent values."""
+    return counts[counts > 0].sort_values(ascending=False, kind="stable").rename("count")
+
+
+def weighted_mean(values, weights):
+    present = values.notna()
+    return float((values[present] * weights[present]).sum() / weights[present].sum()) if present.any() else np.nan
+
+
+def summary_to_cleaned(summary, mean_delay_checkout, std_delay_checkout, mean_rental_per_day, fingerprint, data=None):
+    """
+    `CleanedData` of a summary, with the outlier filter of the mean and standard deviation of all the
+    checkout delays. The same as `clean_data` of the summarized rentals, but `data` is the frame given.
+    """
+    n_raw = int(summary["rentals"].sum())
+    summary = summary[is_inlier(summary["delay_at_checkout_in_minutes"], mean_delay_checkout, std_delay_checkout)]
+    rentals = summary["rentals"]
+    delays = summary["delay_at_checkout_in_minutes"]
+    categories, statuses = categorize_delays(delays), delay_statuses(delays)
+
+    def counts_by(keys, name):
+        counts = rentals.groupby(keys, observed=True).sum().rename_axis(name)
+        return sorted_counts(counts.set_axis(counts.index.astype(str)) if isinstance(counts.index, pd.CategoricalIndex) else counts)
+
+    delay_status_counts = counts_by(statuses, "checkout_delay_status")
+    delay_counts_by_checkin = rentals.groupby([categories, summary["checkin_type"]], observed=True).sum().rename(None)
+    delay_counts_by_checkin.index.names = ["checkout_delay_category", "checkin_type"]
+
+    problematic = summary[summary["problematic_delay"]]
+    time_deltas = summary["time_delta_with_previous_rental_in_minutes"]
+    late = delays > 0
+    late_checkout = int(delay_status_counts["Late"])
+    delay_statistics = {
+        "mean_delay_impact": weighted_mean(time_deltas, rentals),
+        "min_delay_impact": time_deltas.min(),
+        "max_delay_impact": time_deltas.max(),
+        "late_checkout": late_checkout,
+        "problematic_delays_rate": int(problematic["rentals"].sum()) * 100 / late_checkout,
+        "average_problematic_delay": weighted_mean(problematic["problematic_previous_delay"], problematic["rentals"]),
+        "average_non_problematic_delay": weighted_mean(delays[late], rentals[late]),
+    }
+
+    def value_counts(frame, column):
+        counts = frame[frame[column].notna()].groupby(column)["rentals"].sum()
+        return counts.index.to_numpy(dtype=float), counts.to_numpy()
+
+    scopes = {"all": summary, "connect": summary[summary["checkin_type"] == "connect"],
+              "mobile": summary[summary["checkin_type"] == "mobile"]}
+    threshold_index = ThresholdIndex(
+        int(rentals.sum()),
+        mean_rental_per_day,
+        {scope: value_counts(frame, "time_delta_with_previous_rental_in_minutes") for scope, frame in scopes.items()},
+        {scope: value_counts(frame[frame["problematic_delay"]], "problematic_previous_delay") for scope, frame in scopes.items()},
+    )
+    return CleanedData(
+        fingerprint=fingerprint,
+        data=data,
+        num_outliers=n_raw - int(rentals.sum()),
+        mean_rental_per_day=mean_rental_per_day,
+        checkin_type_counts=counts_by(summary["checkin_type"], "checkin_type"),
+        state_counts=counts_by(summary["state"], "state"),
+        delay_counts=counts_by(categories, "checkout_delay_category"),
+        delay_counts_by_checkin=delay_counts_by_checkin[delay_counts_by_checkin > 0],
+        delay_status_counts=delay_status_counts,
+        problematic_counts=counts_by(summary["problematic_delay"], "problematic_delay"),
+        delay_statistics=delay_statistics,
+        threshold_index=threshold_index,
+    )
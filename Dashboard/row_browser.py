@@ -0,0 +1,68 @@
+"""
+Server-side browser of the rentals of the Home page.
+
+`st.write` of the cleaned frame serializes every rental and sends them all to the browser. The
+frame stays on the server in a `RowBrowser` instead, with an index of the columns the viewer
+filters and sorts on, and the page only sends the `PAGE_ROWS` rentals it shows (`st.dataframe`
+sends them as Arrow):
+
+* the filtered columns (`FILTER_COLUMNS`) are kept as category codes, so a filter compares small
+  integers with the codes of the selected values. `car_id` is kept as an integer array;
+* the sort order of a column (stable, missing values last) is computed the first time it's asked
+  for and kept. A sorted query only takes the positions of the order that pass the filters: the
+  frame itself is never sorted or filtered, only the rows of the page are copied.
+
+The app builds the browser once per fingerprint of the data (`st.cache_resource`) and shares it
+between the sessions.
+"""
+import numpy as np
+import pandas as pd
+
+FILTER_COLUMNS = ["checkin_type", "state", "checkout_delay_category"]
+PAGE_ROWS = 500
+
+
+class RowBrowser:
+    def __init__(self, data):
+        self.data = data
+        self.codes, self.values = {}, {}
+        for column in FILTER_COLUMNS:
+            # checkout_delay_category is already categorical: its categories keep their order
+            categories = pd.Categorical(data[column])
+            self.codes[column] = categories.codes
+            self.values[column] = list(categories.categories)
+        self.car_ids = data["car_id"].to_numpy()
+        self.sort_orders = {}  # (column, descending) -> positions of the rentals in that order
+
+    def __len__(self):
+        return len(self.data)
+
+    def sort_order(self, column, descending=False):
+        if (column, descending) not in self.sort_orders:
+            values = self.data[column].reset_index(drop=True)
+            order = values.sort_values(ascending=not descending, kind="stable", na_position="last").index.to_numpy()
+            self.sort_orders[column, descending] = order
+        return self.sort_orders[column, descending]
+
+    def query(self, filters=None, car_id=None, sort_by=None, descending=False):
+        """
+        Positions of the rentals with one of the selected values of each filter ({column of
+        `FILTER_COLUMNS`: values}, an empty selection keeps every rental) and of the car, in the
+        order of `sort_by` (the order of the frame without it).
+        """
+        mask = np.ones(len(self.data), dtype=bool)
+        for column, selected in (filters or {}).items():
+            if len(selected):
+                selected = set(selected)
+                codes = [code for code, value in enumerate(self.values[column]) if value in selected]
+                mask &= np.isin(self.codes[column], codes)
+        if car_id is not None:
+            mask &= self.car_ids == car_id
+        if sort_by is None:
+            return np.flatnonzero(mask)
+        order = self.sort_order(sort_by, descending)
+        return order[mask[order]]
+
+    def page(self, positions, page, page_rows=PAGE_ROWS):
+        """Rentals of the page `page` (from 0) of the positions."""
+        return self.data.iloc[positions[page * page_rows:(page + 1) * page_rows]]
@@ -0,0 +1,100 @@
+"""
+Scoring backends of the Price Prediction page.
+
+* `LocalScorer` loads the preprocessor and the XGBoost booster of an offline bundle with the loader
+  of the API (`bundle.load_bundle` of `PRICING_API_DIR`, which checks the checksums and the feature
+  schema of the manifest) and scores in-process: no network, and a whole grid of cars costs one
+  `preprocessor.transform` and one model call.
+* `RemoteScorer` calls the pricing API through a `requests.Session` (kept-alive connection, timeout):
+  one car goes to `/predict`, several cars go to `/predict/batch` in one request.
+
+Both take a DataFrame with one column per feature of `PredictionFeatures` and return the price per
+day of each row. `sweep` builds the grid of a "sweep" chart: the selected car with one numeric
+feature going through `SWEEPS`.
+
+Settings (environment variables):
+
+* `PRICING_BACKEND`: `remote` (default) or `local`.
+* `PRICING_API_URL`: base URL of the pricing API (default the Hugging Face deployment).
+* `PRICING_BUNDLE_DIR`: directory of the offline bundle of the `local` backend (default `bundle`).
+* `PRICING_API_DIR`: code of the pricing API, imported by the `local` backend (default `../ML_&_API`).
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import requests
+
+PRICING_BACKEND = os.environ.get("PRICING_BACKEND", "remote")
+PRICING_API_URL = os.environ.get("PRICING_API_URL", "https://hyraxuna-api-getaround.hf.space")
+PRICING_BUNDLE_DIR = os.environ.get("PRICING_BUNDLE_DIR", "bundle")
+PRICING_API_DIR = os.environ.get("PRICING_API_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ML_&_API"))
+REQUEST_TIMEOUT = 10  # seconds
+
+# Values of the numeric feature going through each sweep chart
+SWEEPS = {
+    "mileage": np.arange(0, 600001, 10000),
+    "engine_power": np.arange(0, 1001, 10),
+}
+
+
+class LocalScorer:
+    name = "local"
+
+    def __init__(self, bundle_dir=PRICING_BUNDLE_DIR, api_dir=PRICING_API_DIR):
+        # The bundle is loaded like the API does, after the checksum and feature schema checks of its manifest.
+        # The API directory comes last on the path, so its modules don't shadow the ones of the dashboard
+        if api_dir not in sys.path:
+            sys.path.append(api_dir)
+        from bundle import load_bundle
+        from schemas import FEATURE_COLUMNS
+
+        self.preprocessor, self.model, self.manifest = load_bundle(bundle_dir)
+        self.feature_columns = FEATURE_COLUMNS
+
+    def predict(self, cars):
+        # The native engine of the API keeps the absent entries of the sparse preprocessor output as missing values
+        return self.model.predict(self.preprocessor.transform(cars[self.feature_columns]))
+
+
+class RemoteScorer:
+    name = "remote"
+
+    def __init__(self, api_url=PRICING_API_URL):
+        self.api_url = api_url.rstrip("/")
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def post(self, endpoint, payload):
+        response = self.session.post(f"{self.api_url}{endpoint}", json=payload, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def predict(self, cars):
+        if len(cars) == 1:
+            return np.array([self.post("/predict", to_payload(cars.iloc[0].to_dict()))["prediction"]])
+        # One list of values per feature (`ColumnarPredictionFeatures`)
+        columns = {column: cars[column].tolist() for column in cars.columns}
+        return np.asarray(self.post("/predict/batch", columns)["predictions"])
+
+
+def to_payload(car):
+    """JSON-serializable values of a car (NumPy scalars to Python ones)."""
+    return {column: value.item() if isinstance(value, np.generic) else value for column, value in car.items()}
+
+
+def load_scorer(backend=PRICING_BACKEND):
+    if backend == "local":
+        return LocalScorer()
+    if backend == "remote":
+        return RemoteScorer()
+    raise ValueError(f"Unknown pricing backend {backend!r}, expected 'local' or 'remote'")
+
+
+def sweep(car, feature, values=None):
+    """Grid of cars: `car` (dict of the features) with `feature` taking each of `values` (default `SWEEPS[feature]`)."""
+    values = SWEEPS[feature] if values is None else values
+    grid = pd.DataFrame([car] * len(values))
+    grid[feature] = values
+    return grid
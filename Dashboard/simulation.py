@@ -0,0 +1,181 @@
+"""
+Monte Carlo simulator of the minimum delay between two rentals, with cascading delays.
+
+The threshold analysis of the Delays page is a static filter: a rental is problematic when the
+previous rental of the car was checked out later than the delta between them. It can't show a late
+checkout cascading through several consecutive rentals of a car, nor a policy moving the later
+bookings. The simulator replays the timelines of the cars under a policy (threshold and scope):
+
+* `build_timelines` links each rental to the previous rental of its car (`previous_ended_rental_id`)
+  in arrays sorted by car and position in the chain. The chains are replayed level by level (every
+  first rental, then every second one...) with vectorized operations.
+* Each replication draws the checkout delay of every rental from the empirical checkout delays of
+  its check-in type.
+* A rental starts late when its car comes back after its planned check-in, and its checkout is
+  late by as much: the delay cascades to the next rental of the car. A blocked check-in is
+  canceled with probability `cancel_rate` (default: the excess cancellation rate of the problematic
+  rentals in the data). A rental that doesn't take place stops the cascade: the rental durations
+  aren't in the data, and its slot is assumed to absorb the delay.
+* The policy applies to the rentals of the scope whose delta with the previous rental is at most the
+  threshold. With `policy="refuse"`, they can't be booked (lost, like the affected rentals of
+  `ThresholdIndex`). With `policy="shift"`, they start `threshold` minutes after the planned
+  checkout of the previous rental instead, and push the later rentals of the car as much as needed.
+  With `threshold=None`, the policy applies to no rental: the baseline of the cascades without threshold.
+
+The lost revenue counts the refused and canceled rentals at the mean price of a rental day, in %
+of the revenue of all the rentals.
+
+The replications are spread over a pool of `SIMULATION_WORKERS` processes (environment variable,
+default: the number of cores). Each process receives the timelines once and runs its share of the
+replications, each with its own random stream (`np.random.SeedSequence.spawn`): the results don't
+depend on the number of processes, and the runtime goes down with the cores.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from thresholds import SCOPES
+
+SIMULATION_WORKERS = int(os.environ.get("SIMULATION_WORKERS", 0)) or os.cpu_count()
+POLICIES = ["refuse", "shift"]
+
+
+@dataclass(frozen=True)
+class Timelines:
+    car_ids: np.ndarray
+    checkin_types: np.ndarray
+    gaps: np.ndarray  # planned minutes between the checkout of the previous rental and the check-in, NaN without previous rental
+    previous: np.ndarray  # position of the previous rental of the car, -1 when it isn't in the data
+    levels: list  # positions of the second rentals of the chains, then of the third ones...
+    delay_pools: dict  # check-in type -> empirical checkout delays (minutes)
+    cancel_rate: float  # probability that a blocked check-in is canceled
+    n_rentals: int
+
+
+def excess_cancel_rate(data):
+    """Cancellation rate of the problematic rentals minus the one of the other rentals with a known previous rental."""
+    with_previous = data[data["previous_delay_at_checkout_in_minutes"].notna()]
+    canceled = (with_previous["state"] == "canceled").groupby(with_previous["problematic_delay"]).mean()
+    return max(float(canceled.get(True, 0.0) - canceled.get(False, 0.0)), 0.0)
+
+
+def build_timelines(data):
+    """Timelines of the cleaned delay analysis data (`pipeline.clean_data`)."""
+    previous_ids = data["previous_ended_rental_id"].to_numpy()
+    known = ~np.isnan(previous_ids)
+    previous = np.full(len(data), -1)
+    previous[known] = pd.Index(data["rental_id"]).get_indexer(previous_ids[known].astype(np.int64))
+
+    # Position of each rental in its chain
+    depths = np.zeros(len(data), dtype=np.int64)
+    for _ in range(len(data)):
+        new_depths = np.where(previous >= 0, depths[previous] + 1, 0)
+        if np.array_equal(new_depths, depths):
+            break
+        depths = new_depths
+
+    order = np.lexsort((depths, data["car_id"].to_numpy()))
+    positions = np.empty(len(data), dtype=np.int64)
+    positions[order] = np.arange(len(data))
+    previous = previous[order]
+    previous = np.where(previous >= 0, positions[np.maximum(previous, 0)], -1)
+    depths = depths[order]
+
+    delays = data["delay_at_checkout_in_minutes"]
+    return Timelines(
+        car_ids=data["car_id"].to_numpy()[order],
+        checkin_types=data["checkin_type"].to_numpy(dtype=object)[order],
+        gaps=data["time_delta_with_previous_rental_in_minutes"].to_numpy(dtype=float)[order],
+        previous=previous,
+        levels=[np.flatnonzero(depths == depth) for depth in range(1, depths.max() + 1)] if len(data) else [],
+        delay_pools={checkin_type: group.to_numpy() for checkin_type, group in delays.dropna().groupby(data["checkin_type"])},
+        cancel_rate=excess_cancel_rate(data),
+        n_rentals=len(data),
+    )
+
+
+def replicate(timelines, threshold, scope, policy, cancel_rate, rng):
+    """Outcome of one replication of the timelines under the policy."""
+    delays = np.zeros(timelines.n_rentals)
+    for checkin_type, pool in timelines.delay_pools.items():
+        rentals = timelines.checkin_types == checkin_type
+        delays[rentals] = rng.choice(pool, rentals.sum())
+
+    gaps = timelines.gaps
+    if threshold is None:
+        # Baseline without threshold: the policy applies to no rental
+        affected = np.zeros(timelines.n_rentals, dtype=bool)
+        threshold = 0.0
+    else:
+        in_scope = np.ones(timelines.n_rentals, dtype=bool) if scope == "all" else timelines.checkin_types == scope
+        affected = in_scope & (gaps <= threshold)
+    refused = affected if policy == "refuse" else np.zeros(timelines.n_rentals, dtype=bool)
+    # Minutes each booking is moved later than planned
+    shifts = np.where(affected, threshold - gaps, 0.0) if policy == "shift" else np.zeros(timelines.n_rentals)
+    happens = ~refused
+    lateness = np.zeros(timelines.n_rentals)  # minutes between the planned check-in and the return of the car
+    blocked = np.zeros(timelines.n_rentals, dtype=bool)
+
+    for level in timelines.levels:
+        previous = timelines.previous[level]
+        if policy == "shift":
+            required = np.where(affected[level], threshold, 0.0)
+            shifts[level] = np.maximum(0.0, shifts[previous] + required - gaps[level])
+        gap = gaps[level] + shifts[level] - shifts[previous]
+        # The previous rental started late by its lateness, so it comes back late by its delay plus its lateness
+        returned = delays[previous] + lateness[previous]
+        late = np.where(happens[previous] & happens[level], np.maximum(0.0, returned - gap), 0.0)
+        blocked[level] = late > 0
+        canceled = blocked[level] & (rng.random(len(level)) < cancel_rate)
+        happens[level] &= ~canceled
+        lateness[level] = np.where(canceled, 0.0, late)
+
+    lost = refused | (blocked & ~happens)
+    return {
+        "blocked_checkins": int(blocked.sum()),
+        "canceled": int((blocked & ~happens).sum()),
+        "refused": int(refused.sum()),
+        "shifted": int((shifts > 0).sum()),
+        "lost_revenue": lost.sum() / timelines.n_rentals * 100,
+    }
+
+
+# Timelines of the worker processes, sent once by the pool initializer
+_timelines = None
+
+
+def set_timelines(timelines):
+    global _timelines
+    _timelines = timelines
+
+
+def run_replications(seeds, threshold, scope, policy, cancel_rate, timelines=None):
+    timelines = _timelines if timelines is None else timelines
+    return [replicate(timelines, threshold, scope, policy, cancel_rate, np.random.default_rng(seed)) for seed in seeds]
+
+
+def simulate(timelines, threshold, scope="all", policy="refuse", replications=200, cancel_rate=None, seed=0,
+             workers=SIMULATION_WORKERS):
+    """
+    Outcomes of `replications` replications of the timelines under the policy (none with
+    `threshold=None`), one row each: blocked check-ins, canceled, refused and shifted rentals, and
+    lost revenue (%).
+    """
+    if scope not in SCOPES:
+        raise ValueError(f"Unknown scope {scope!r}, expected one of {SCOPES}")
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy {policy!r}, expected one of {POLICIES}")
+    cancel_rate = timelines.cancel_rate if cancel_rate is None else cancel_rate
+    seeds = np.random.SeedSequence(seed).spawn(replications)
+    run = partial(run_replications, threshold=threshold, scope=scope, policy=policy, cancel_rate=cancel_rate)
+    workers = min(workers, replications)
+    if workers <= 1:
+        outcomes = run(seeds, timelines=timelines)
+    else:
+        with ProcessPoolExecutor(workers, initializer=set_timelines, initargs=(timelines,)) as pool:
+            outcomes = [outcome for chunk in pool.map(run, np.array_split(np.array(seeds, dtype=object), workers)) for outcome in chunk]
+    return pd.DataFrame(outcomes)
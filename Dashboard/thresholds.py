@@ -0,0 +1,147 @@
+"""
+Threshold index of the Delays page.
+
+The rentals affected by a minimum delay between two rentals, the revenue they weigh and the
+problematic cases it solves only depend on the threshold through `<= threshold` comparisons.
+`ThresholdIndex` keeps the distinct values of the relevant column per scope, sorted, with the
+cumulative number of rentals, so any threshold is answered by a binary search (`np.searchsorted`)
+instead of filtering the whole frame again. It is built from the cleaned frame (`from_data`) or
+from value counts computed elsewhere (see `pipeline.summary_to_cleaned`), and its size only
+depends on the number of distinct values.
+
+The same binary search answers every minute of every scope at once: `sweep_thresholds` evaluates
+them all, `pareto_frontier` keeps the (scope, threshold) pairs that no other pair beats (as many
+solved cases for less revenue), and `knee_point` picks the best of them for a cost of the revenue.
+"""
+import numpy as np
+import pandas as pd
+
+SCOPES = ["all", "connect", "mobile"]
+MAX_THRESHOLD = 1440  # minutes
+# Thresholds of the charts and the data table of the page (minutes)
+CHART_THRESHOLDS = [30, 60, 90, 120, 180, 360, 720, 1440]
+
+
+class ThresholdIndex:
+    """
+    Distinct values of the delay analysis data (with the columns of `delay_features.add_delay_features`)
+    for each scope, sorted, with the cumulative number of rentals:
+
+    * `time_delta_with_previous_rental_in_minutes` of the rentals: a threshold affects the rentals
+      whose delta with the previous rental is <= threshold. Every rental weighs the mean price of
+      a rental day in the revenue.
+    * `previous_delay_at_checkout_in_minutes` of the problematic delays: a threshold solves the cases
+      whose previous rental was checked out at most `threshold` minutes late.
+
+    Every query accepts a threshold or an array of thresholds.
+    """
+
+    def __init__(self, n_rentals, mean_rental_per_day, deltas, problematic_delays):
+        """`deltas` and `problematic_delays`: {scope: (distinct values, number of rentals of each value)}."""
+        self.n_rentals = n_rentals
+        self.mean_rental_per_day = mean_rental_per_day
+        self.total_revenue = mean_rental_per_day * n_rentals
+        self.deltas, self.affected_counts = self.cumulative(deltas)
+        self.problematic_delays, self.solved_counts = self.cumulative(problematic_delays)
+
+    @staticmethod
+    def cumulative(value_counts):
+        """Sorted values and cumulative counts (starting at 0) of each scope."""
+        values, cumulative_counts = {}, {}
+        for scope, (scope_values, counts) in value_counts.items():
+            order = np.argsort(scope_values)
+            values[scope] = np.asarray(scope_values, dtype=float)[order]
+            cumulative_counts[scope] = np.concatenate([[0], np.cumsum(np.asarray(counts, dtype=np.int64)[order])])
+        return values, cumulative_counts
+
+    @classmethod
+    def from_data(cls, data, mean_rental_per_day):
+        checkin_types = data["checkin_type"].to_numpy()
+        scopes = {"all": np.ones(len(data), dtype=bool), "connect": checkin_types == "connect", "mobile": checkin_types == "mobile"}
+        deltas = data["time_delta_with_previous_rental_in_minutes"].to_numpy(dtype=float)
+        problematic = data["problematic_delay"].to_numpy()
+        previous_delays = data["previous_delay_at_checkout_in_minutes"].to_numpy(dtype=float)
+        return cls(
+            len(data),
+            mean_rental_per_day,
+            {scope: np.unique(deltas[mask & ~np.isnan(deltas)], return_counts=True) for scope, mask in scopes.items()},
+            {scope: np.unique(previous_delays[mask & problematic], return_counts=True) for scope, mask in scopes.items()},
+        )
+
+    @staticmethod
+    def check_scope(scope):
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown scope {scope!r}, expected one of {SCOPES}")
+
+    def affected(self, threshold, scope="all"):
+        """Number of rentals of the scope affected by the threshold."""
+        self.check_scope(scope)
+        return self.affected_counts[scope][np.searchsorted(self.deltas[scope], threshold, side="right")]
+
+    def affected_percentage(self, threshold, scope="all"):
+        """Rentals of the scope affected by the threshold, in % of all the rentals."""
+        return self.affected(threshold, scope) / self.n_rentals * 100
+
+    def revenue_impacted(self, threshold, scope="all"):
+        """Revenue of the rentals of the scope affected by the threshold, in % of the total revenue."""
+        return self.affected(threshold, scope) * self.mean_rental_per_day / self.total_revenue * 100
+
+    def problematic_cases(self, scope="all"):
+        """Number of problematic delays of the scope."""
+        self.check_scope(scope)
+        return self.solved_counts[scope][-1]
+
+    def solved(self, threshold, scope="all"):
+        """Number of problematic delays of the scope solved by the threshold."""
+        self.check_scope(scope)
+        return self.solved_counts[scope][np.searchsorted(self.problematic_delays[scope], threshold, side="right")]
+
+    def table(self, thresholds):
+        """Metrics of each threshold, for the charts and the data table of the page."""
+        thresholds = np.asarray(thresholds)
+        return pd.DataFrame({
+            "threshold": thresholds,
+            "revenue_impacted": self.revenue_impacted(thresholds),
+            "all_affected": self.affected(thresholds),
+            "connect_affected": self.affected(thresholds, "connect"),
+            "solved_all": self.solved(thresholds),
+            "solved_connect": self.solved(thresholds, "connect"),
+        })
+
+
+def sweep_thresholds(index, thresholds=None, scopes=SCOPES):
+    """
+    Metrics of every threshold (default every minute up to `MAX_THRESHOLD`) of every scope, one row
+    per scope and threshold. `solved_rate` is in % of all the problematic cases.
+    """
+    thresholds = np.arange(MAX_THRESHOLD + 1) if thresholds is None else np.asarray(thresholds)
+    sweep = pd.concat([pd.DataFrame({
+        "scope": scope,
+        "threshold": thresholds,
+        "affected": index.affected(thresholds, scope),
+        "revenue_impacted": index.revenue_impacted(thresholds, scope),
+        "solved": index.solved(thresholds, scope),
+    }) for scope in scopes], ignore_index=True)
+    sweep["solved_rate"] = sweep["solved"] / index.problematic_cases() * 100 if index.problematic_cases() else 0.0
+    return sweep
+
+
+def pareto_frontier(sweep):
+    """
+    Rows of a sweep that no other row beats: every other row solves fewer cases, or impacts more
+    revenue, or the same of both with a higher threshold. Sorted by revenue impacted.
+    """
+    ordered = sweep.sort_values(["revenue_impacted", "solved", "threshold"], ascending=[True, False, True], kind="stable")
+    solved = ordered["solved"].to_numpy()
+    # A row is on the frontier when it solves more than every row impacting less or as much revenue before it
+    best_before = np.concatenate([[-1], np.maximum.accumulate(solved)[:-1]])
+    return ordered[solved > best_before].reset_index(drop=True)
+
+
+def knee_point(frontier, revenue_cost):
+    """
+    Row of the frontier with the best trade-off: the highest `solved_rate - revenue_cost *
+    revenue_impacted` (both in %), the cheapest on a tie.
+    """
+    score = frontier["solved_rate"] - revenue_cost * frontier["revenue_impacted"]
+    return frontier.loc[score.idxmax()]
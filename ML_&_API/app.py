@@ -1,16 +1,100 @@
-import mlflow 
-import uvicorn
-import pandas as pd 
-from pydantic import BaseModel
-from typing import Literal, List, Union
+import asyncio
+import time
+import traceback
+import numpy as np
+from typing import List, Union
 from fastapi import FastAPI, File, UploadFile
-import joblib
-from fastapi.responses import RedirectResponse
-import pickle
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+import os
+from types import SimpleNamespace
+from config import BATCH_CHUNK_SIZE, CACHE_MAX_SIZE, CACHE_TTL_SECONDS, CACHE_MILEAGE_BUCKET, CACHE_ENGINE_POWER_BUCKET
+from config import MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS, MODEL_ENGINE
+from config import PROFILING_SAMPLE_RATE, PROFILING_DIR, PROFILER
+from metrics import BATCH_ROWS, TimedRoute, render_metrics, stage
+from profiling import ProfilingMiddleware
+from batching import MicroBatcher
+from cache import PredictionCache
+from bulk import PREDICTION_COLUMN, is_parquet, read_chunks, csv_stream, parquet_stream, scored_chunks
+from encoder import FastEncoder, check_categories
+from engines import load_model
+from bundle import has_bundle, load_bundle
+from schemas import PredictionFeatures, ColumnarPredictionFeatures, FEATURE_COLUMNS, WARM_UP_CARS
 
-logged_model = 'runs:/c2037b0c2c9e4c629a02b7b8a7eb2642/model'
-loaded_model = mlflow.pyfunc.load_model(logged_model)
-print("✅ Model loaded successfully!")
+# Importing the app doesn't load anything: pandas, scikit-learn, XGBoost, onnxruntime and MLFlow are imported by the
+# loading of the model, at the startup of the server (or in the gunicorn master, see gunicorn_conf.py), so the
+# server answers `/healthz` while the model loads, and `/readyz` once it's loaded and warmed up
+preprocessor = None
+loaded_model = None
+encoder = None
+startup = {"status": "loading", "error": None, "load_seconds": None, "warm_up_seconds": None}
+
+
+def load_serving_state():
+    """Load the model and the preprocessor, once per process."""
+    global preprocessor, loaded_model, encoder
+    if loaded_model is not None:
+        return
+    start = time.perf_counter()
+    if MODEL_ENGINE != "onnx" and has_bundle():
+        # Offline bundle: the model and the preprocessor are loaded locally, without MLFlow nor network
+        preprocessor, model, manifest = load_bundle()
+        print(f"✅ Model loaded successfully! (bundle {manifest['version']})")
+    else:
+        # Native XGBoost booster if it was exported locally, MLFlow pyfunc model otherwise, or ONNX graph (see config.py)
+        model = load_model()
+        print(f"✅ Model loaded successfully! ({model.name} engine)")
+
+        # Load the preprocessor, the ONNX graph includes it
+        if not model.raw_features:
+            import pickle
+
+            with open('preprocessor.pkl', 'rb') as file:
+                preprocessor = pickle.load(file)
+
+    # Compile the preprocessor into a fast single-row encoder (no DataFrame needed)
+    encoder = FastEncoder(preprocessor) if preprocessor is not None else None
+    cache.check_model_version(model.version)
+    loaded_model = model
+    startup["load_seconds"] = time.perf_counter() - start
+
+
+def warm_up():
+    """
+    Predict representative cars through the single-row and the DataFrame paths, so that the first
+    requests don't pay the lazy initializations of pandas, the preprocessor and the model.
+    """
+    if startup["warm_up_seconds"] is not None:
+        # Already warmed up by the gunicorn master
+        return
+    import pandas as pd
+
+    start = time.perf_counter()
+    cars = [SimpleNamespace(**car) for car in WARM_UP_CARS]
+    predict_features(cars[:1])
+    predict_features(cars)
+    predict_dataframe(pd.DataFrame(WARM_UP_CARS, columns=FEATURE_COLUMNS))
+    startup["warm_up_seconds"] = time.perf_counter() - start
+
+
+async def start_serving():
+    try:
+        await run_in_threadpool(load_serving_state)
+        await run_in_threadpool(warm_up)
+    except Exception as error:
+        # The server keeps running: `/healthz` fails, so the orchestrator restarts the container
+        traceback.print_exc()
+        startup.update(status="failed", error=f"{type(error).__name__}: {str(error).splitlines()[0] if str(error) else ''}")
+        return
+    startup["status"] = "ready"
+    print(f"✅ API ready (model loaded in {startup['load_seconds']:.2f} s, warmed up in {startup['warm_up_seconds']:.2f} s)")
+
+
+def check_ready():
+    if startup["status"] != "ready":
+        raise HTTPException(status_code=503, detail=f"The model is {startup['status']}", headers={"Retry-After": "1"})
 
 
 description = """
@@ -18,40 +102,85 @@ Welcome to the rental price predictor API for Getaround 🏎️ !\n
 Submit the parameters of your car and a XGBoost Machine Learning model, trained on GetAround data, will recommend you a price per day for your rental. 
 
 **Use the endpoint `/predict` to estimate the daily rental price of your car !**
+
+**Use the endpoint `/predict/batch` to estimate the daily rental price of a whole fleet in one call !**
+
+**Use the endpoint `/predict/file` to upload a CSV or Parquet file of cars and download it back with a `rental_price_per_day_pred` column !**
 """
 
 tags_metadata = [
     {
         "name": "Price Predictions 💶💶💶",
         "description": "Use this endpoint for getting predictions"
+    },
+    {
+        "name": "Monitoring 🩺",
+        "description": "Use these endpoints for monitoring the API"
     }
 ]
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The model is loaded and warmed up in the background: the server accepts connections meanwhile (see `/readyz`)
+    loading = asyncio.create_task(start_serving())
+    # The micro-batching of the `/predict` requests runs on the event loop of the server
+    if batcher is not None:
+        await batcher.start()
+    yield
+    if batcher is not None:
+        await batcher.stop()
+    loading.cancel()
+
 app = FastAPI(
     title="💸 Rental Price Prediction API",
     description=description,
     version="1.0",
-    openapi_tags=tags_metadata
+    openapi_tags=tags_metadata,
+    lifespan=lifespan
+)
+# Time every route and the validation/serialization around the endpoints (see `/metrics`)
+app.router.route_class = TimedRoute
+
+if PROFILING_SAMPLE_RATE > 0:
+    app.add_middleware(ProfilingMiddleware, sample_rate=PROFILING_SAMPLE_RATE, output_dir=PROFILING_DIR, profiler=PROFILER)
+
+# Cache of the `/predict` results, emptied when the model version changes
+cache = PredictionCache(
+    FEATURE_COLUMNS,
+    max_size=CACHE_MAX_SIZE,
+    ttl=CACHE_TTL_SECONDS,
+    buckets={"mileage": CACHE_MILEAGE_BUCKET, "engine_power": CACHE_ENGINE_POWER_BUCKET},
 )
 
-class PredictionFeatures(BaseModel):
-    model_key: Literal['Citroën','Peugeot','PGO','Renault','Audi','BMW','Mercedes','Opel','Volkswagen','Ferrari','Mitsubishi','Nissan','SEAT','Subaru','Toyota','other'] 
-    mileage: Union[int, float]
-    engine_power: Union[int, float]
-    fuel: Literal['diesel','petrol','other']
-    paint_color: Literal['black','grey','white','red','silver','blue','beige','brown','other']
-    car_type: Literal['convertible','coupe','estate','hatchback','sedan','subcompact','suv','van']
-    private_parking_available: bool
-    has_gps: bool
-    has_air_conditioning: bool
-    automatic_car: bool
-    has_getaround_connect: bool
-    has_speed_regulator: bool
-    winter_tires: bool
-
-# Load the preprocessor
-with open('preprocessor.pkl', 'rb') as file:
-    preprocessor = pickle.load(file)
+
+def predict_features(features_list):
+    """Encode several cars into one matrix and predict them with a single model call."""
+    BATCH_ROWS.observe(len(features_list), "micro_batch")
+    if encoder is None:
+        # The ONNX graph takes one array per feature
+        with stage("predict"):
+            columns = {column: [getattr(features, column) for features in features_list] for column in FEATURE_COLUMNS}
+            return loaded_model.predict(columns).tolist()
+    with stage("encode"):
+        input_data = np.zeros((len(features_list), encoder.n_features), dtype=np.float32)
+        for row, features in zip(input_data, features_list):
+            encoder.encode(features, out=row)
+    with stage("predict"):
+        return loaded_model.predict(input_data).tolist()
+
+# Coalesce the concurrent `/predict` requests into batches
+batcher = MicroBatcher(predict_features, MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS) if MICRO_BATCH_MAX_SIZE > 0 else None
+
+
+async def score(features):
+    """Predict one car off the event loop, within a micro-batch when it is enabled."""
+    try:
+        if batcher is not None and batcher.running:
+            return await batcher.submit(features)
+        return (await run_in_threadpool(predict_features, [features]))[0]
+    except ValueError as error:
+        # The schema accepts 'other', that the preprocessor doesn't know for every feature
+        raise HTTPException(status_code=422, detail=str(error))
 
 # Redirect automatically to /docs (without showing this endpoint in /docs)
 @app.get("/", include_in_schema=False)
@@ -61,27 +190,141 @@ async def docs_redirect():
 
 @app.post("/predict", tags=["Price Predictions 💶💶💶"])
 async def predict(predictionFeatures: PredictionFeatures):
-    # Read data 
-    input_data = pd.DataFrame({
-            "model_key": [predictionFeatures.model_key],
-            "mileage": [predictionFeatures.mileage],
-            "engine_power": [predictionFeatures.engine_power],
-            "fuel": [predictionFeatures.fuel],
-            "paint_color": [predictionFeatures.paint_color],
-            "car_type": [predictionFeatures.car_type],
-            "private_parking_available": [predictionFeatures.private_parking_available],
-            "has_gps": [predictionFeatures.has_gps],
-            "has_air_conditioning": [predictionFeatures.has_air_conditioning],
-            "automatic_car": [predictionFeatures.automatic_car],
-            "has_getaround_connect": [predictionFeatures.has_getaround_connect],
-            "has_speed_regulator": [predictionFeatures.has_speed_regulator],
-            "winter_tires": [predictionFeatures.winter_tires]
-        })
-    
-    preprocessed_data = preprocessor.transform(input_data)
-
-    prediction = loaded_model.predict(preprocessed_data)
+    check_ready()
+    if not cache.enabled:
+        prediction = await score(predictionFeatures)
+        return {"prediction": prediction}
+
+    # Look for the prediction in the cache first
+    with stage("cache"):
+        cache.check_model_version(loaded_model.version)
+        canonical = cache.canonicalize(predictionFeatures)
+        key = cache.key(canonical)
+        prediction = cache.get(key)
+    if prediction is None:
+        # Predict the canonical (possibly bucketed) features
+        prediction = await score(SimpleNamespace(**canonical))
+        cache.put(key, prediction)
 
     # Format response
-    response = {"prediction": prediction.tolist()[0]}
+    response = {"prediction": prediction}
     return response
+
+
+def predict_dataframe(input_data: "pd.DataFrame") -> np.ndarray:
+    """Run the preprocessor and the model once per chunk of `BATCH_CHUNK_SIZE` rows."""
+    predictions = []
+    for start in range(0, len(input_data), BATCH_CHUNK_SIZE):
+        chunk = input_data.iloc[start:start + BATCH_CHUNK_SIZE]
+        BATCH_ROWS.observe(len(chunk), "dataframe_chunk")
+        try:
+            if preprocessor is None:
+                with stage("predict"):
+                    predictions.append(loaded_model.predict(chunk))
+                continue
+            with stage("preprocess"):
+                preprocessed_data = preprocessor.transform(chunk)
+        except ValueError:
+            # The preprocessor only names the position of the column: name the row and the column of the unknown category
+            check_categories(chunk, encoder.categories if encoder is not None else loaded_model.categories, start)
+            raise
+        with stage("predict"):
+            predictions.append(loaded_model.predict(preprocessed_data))
+    if not predictions:
+        return np.empty(0)
+    return np.concatenate(predictions)
+
+
+@app.post("/predict/batch", tags=["Price Predictions 💶💶💶"])
+async def predict_batch(predictionFeatures: Union[List[PredictionFeatures], ColumnarPredictionFeatures]):
+    check_ready()
+    import pandas as pd
+
+    # Read data: a list of cars or one list of values per feature
+    with stage("dataframe"):
+        if isinstance(predictionFeatures, ColumnarPredictionFeatures):
+            input_data = pd.DataFrame(predictionFeatures.model_dump(), columns=FEATURE_COLUMNS)
+        else:
+            input_data = pd.DataFrame([features.model_dump() for features in predictionFeatures], columns=FEATURE_COLUMNS)
+
+    try:
+        prediction = await run_in_threadpool(predict_dataframe, input_data)
+    except ValueError as error:
+        # The schema accepts 'other', that the preprocessor doesn't know for every feature
+        raise HTTPException(status_code=422, detail=str(error))
+
+    # Format response, predictions are in the same order as the input cars
+    response = {"predictions": prediction.tolist()}
+    return response
+
+
+def score_chunk(chunk: "pd.DataFrame") -> "pd.DataFrame":
+    chunk[PREDICTION_COLUMN] = predict_dataframe(chunk[FEATURE_COLUMNS])
+    return chunk
+
+
+@app.post("/predict/file", tags=["Price Predictions 💶💶💶"])
+async def predict_file(file: UploadFile = File(...)):
+    check_ready()
+    # The file is read, scored and sent back chunk by chunk
+    parquet = is_parquet(file.filename)
+    chunks = read_chunks(file.file, parquet, BATCH_CHUNK_SIZE)
+
+    # Score the first chunk before answering, so that a file that can't be scored gets an error status
+    try:
+        first_chunk = await run_in_threadpool(next, chunks, None)
+        if first_chunk is None:
+            raise HTTPException(status_code=400, detail="The file has no rows")
+        missing = [column for column in FEATURE_COLUMNS if column not in first_chunk.columns]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing columns: {', '.join(missing)}")
+        first_chunk = await run_in_threadpool(score_chunk, first_chunk)
+    except (ValueError, KeyError) as error:
+        raise HTTPException(status_code=400, detail=f"The file can't be scored: {error}")
+
+    stream = parquet_stream if parquet else csv_stream
+    filename = os.path.splitext(os.path.basename(file.filename or "cars"))[0] + ("_pred.parquet" if parquet else "_pred.csv")
+    return StreamingResponse(
+        stream(scored_chunks(first_chunk, chunks, score_chunk)),
+        media_type="application/vnd.apache.parquet" if parquet else "text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.get("/healthz", tags=["Monitoring 🩺"])
+async def healthz():
+    # Liveness: the server answers, and the model is loading or loaded
+    status_code = 500 if startup["status"] == "failed" else 200
+    return JSONResponse({"status": startup["status"], "error": startup["error"]}, status_code=status_code)
+
+
+@app.get("/readyz", tags=["Monitoring 🩺"])
+async def readyz():
+    # Readiness: the model is loaded and warmed up, the predictions are served
+    ready = startup["status"] == "ready"
+    return JSONResponse({
+        **startup,
+        "engine": loaded_model.name if loaded_model is not None else None,
+        "model_version": loaded_model.version if loaded_model is not None else None,
+    }, status_code=200 if ready else 503)
+
+
+@app.get("/cache", tags=["Monitoring 🩺"])
+async def cache_stats():
+    # Hit/miss/eviction counters of the `/predict` cache
+    return cache.stats()
+
+
+@app.get("/batching", tags=["Monitoring 🩺"])
+async def batching_stats():
+    # Number and size of the micro-batches of `/predict` requests
+    return batcher.stats() if batcher is not None else {"max_batch_size": 0}
+
+
+@app.get("/metrics", tags=["Monitoring 🩺"], response_class=PlainTextResponse)
+async def metrics():
+    # Per-stage timing histograms, batch sizes and cache counters in the Prometheus text format
+    return PlainTextResponse(
+        render_metrics(cache.stats(), batcher.stats() if batcher is not None else None),
+        media_type="text/plain; version=0.0.4"
+    )
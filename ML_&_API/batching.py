@@ -0,0 +1,110 @@
+"""
+Micro-batching of the concurrent `/predict` requests.
+
+Every request puts its features in a queue and waits for its own future. A background
+task takes the queued features as one batch as soon as `max_batch_size` items are waiting
+or `max_wait_ms` milliseconds after the first one, runs a single vectorized prediction
+in a worker thread (off the event loop) and resolves the future of each caller. When the
+batch fails, its items are predicted one by one, so an invalid item only fails its own caller.
+"""
+import asyncio
+from collections import Counter
+
+
+class MicroBatcher:
+    def __init__(self, predict_batch, max_batch_size, max_wait_ms):
+        # predict_batch: list of items -> list of predictions, in the same order
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.task = None
+        # Number of batches per batch size
+        self.batch_sizes = Counter()
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        # Nobody will answer the requests still waiting
+        while self.queue is not None and not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("The API is shutting down"))
+
+    async def submit(self, item):
+        """Queue `item` and wait for its prediction."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            self.batch_sizes[len(batch)] += 1
+            try:
+                predictions = await asyncio.to_thread(self.predict_batch, [item for item, _ in batch])
+            except Exception as error:
+                if len(batch) == 1:
+                    predictions = [error]
+                else:
+                    # One invalid item fails the whole batch: predict each item on its own, so only its request fails
+                    predictions = await asyncio.to_thread(self._predict_each, [item for item, _ in batch])
+            for (_, future), prediction in zip(batch, predictions):
+                if future.done():
+                    continue
+                if isinstance(prediction, Exception):
+                    future.set_exception(prediction)
+                else:
+                    future.set_result(prediction)
+
+    def _predict_each(self, items):
+        """Prediction of each item, or the exception it raised."""
+        predictions = []
+        for item in items:
+            try:
+                predictions.append(self.predict_batch([item])[0])
+            except Exception as error:
+                predictions.append(error)
+        return predictions
+
+    def stats(self):
+        batches = sum(self.batch_sizes.values())
+        items = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": items / batches if batches else 0,
+        }
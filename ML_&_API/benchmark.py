@@ -0,0 +1,393 @@
+"""
+Benchmarks of the price prediction API, run in-process.
+
+`batch`: cars are sampled from `get_around_pricing_project.csv` and scored once through
+`/predict` (one request per car) and once through `/predict/batch` (one request for all
+the cars) with the FastAPI TestClient, then the rows/sec of both paths are printed:
+
+    python benchmark.py batch --sizes 1 100 10000
+
+`encoder`: p50/p99 latency of the single-row preprocessing, DataFrame + `preprocessor.transform`
+against the compiled `FastEncoder` (no model needed):
+
+    python benchmark.py encoder --rows 2000
+
+`engines`: load time, single-row p50/p99 latency and batch rows/sec of the MLFlow pyfunc
+model against the native XGBoost booster and the ONNX graph (preprocessing included for ONNX:
+it takes the features themselves):
+
+    python benchmark.py engines --rows 2000
+    python benchmark.py engines --engines native onnx     # without the tracking server
+
+`startup`: time to import the app in a fresh process, and time from the launch of a uvicorn
+server until `/readyz` answers (model loaded and warmed up), from the offline bundle against
+the MLFlow/native loading path:
+
+    python benchmark.py startup --bundle-dir bundle --runs 5
+
+`imports`: the modules imported by `import app`, by cumulative import time (`python -X importtime`):
+
+    python benchmark.py imports --top 15
+
+`load`: throughput and tail latency of `/predict` under concurrent traffic, against a
+uvicorn server started with and without micro-batching (cache disabled):
+
+    python benchmark.py load --concurrency 64 --requests 5000
+
+`scaling`: req/s of `/predict` served by gunicorn with 1 to N workers (see gunicorn_conf.py),
+with the cars of the pricing dataset replayed as traffic (cache disabled):
+
+    python benchmark.py scaling --workers 1 2 4
+
+`file`: rows/sec and memory high-water of the API process for `/predict/file`, with the
+pricing dataset repeated up to each number of rows:
+
+    python benchmark.py file --rows 50000 200000 500000 --format csv
+"""
+import argparse
+import asyncio
+import os
+import pickle
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from encoder import FastEncoder
+
+PRICING_DATA = "../get_around_pricing_project.csv"
+
+
+def load_cars(size, seed=0):
+    """Sample `size` cars accepted by `PredictionFeatures` from the pricing dataset."""
+    from pydantic import ValidationError
+    from schemas import PredictionFeatures, FEATURE_COLUMNS
+
+    data = pd.read_csv(PRICING_DATA, index_col=0)[FEATURE_COLUMNS]
+    cars = []
+    for car in data.to_dict(orient="records"):
+        try:
+            cars.append(PredictionFeatures(**car).model_dump())
+        except ValidationError:
+            continue
+    return pd.DataFrame(cars).sample(size, replace=True, random_state=seed).to_dict(orient="records")
+
+
+def rows_per_second(client, cars, single_limit):
+    # Single-row path: one `/predict` call per car (capped at `single_limit` calls)
+    single_cars = cars[:single_limit]
+    start = time.perf_counter()
+    for car in single_cars:
+        client.post("/predict", json=car).raise_for_status()
+    single = len(single_cars) / (time.perf_counter() - start)
+
+    # Batch path: a single `/predict/batch` call for all the cars
+    start = time.perf_counter()
+    client.post("/predict/batch", json=cars).raise_for_status()
+    batch = len(cars) / (time.perf_counter() - start)
+    return single, batch
+
+
+def wait_until_ready(get, timeout=300):
+    """Poll `/readyz` with `get` (a client method) until the model is loaded and warmed up."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = get("/readyz")
+        if response.status_code == 200:
+            return response.json()
+        if response.json()["status"] == "failed":
+            raise RuntimeError(f"The API failed to start: {response.json()['error']}")
+        time.sleep(0.05)
+    raise RuntimeError(f"The API wasn't ready in {timeout} s")
+
+
+def benchmark_batch(args):
+    from fastapi.testclient import TestClient
+    from app import app
+
+    with TestClient(app) as client:
+        wait_until_ready(client.get)
+        benchmark_batch_sizes(client, args)
+
+
+def benchmark_batch_sizes(client, args):
+    print(f"{'batch size':>10} | {'/predict rows/s':>15} | {'/predict/batch rows/s':>21} | {'speed-up':>8}")
+    for size in args.sizes:
+        single, batch = rows_per_second(client, load_cars(size), args.single_limit)
+        print(f"{size:>10} | {single:>15.0f} | {batch:>21.0f} | {batch / single:>7.1f}x")
+
+
+def latencies(function, cars):
+    """Latency in microseconds of `function` called on each car."""
+    timings = np.empty(len(cars))
+    for i, car in enumerate(cars):
+        start = time.perf_counter()
+        function(car)
+        timings[i] = time.perf_counter() - start
+    return timings * 1e6
+
+
+def benchmark_encoder(args):
+    with open("preprocessor.pkl", "rb") as file:
+        preprocessor = pickle.load(file)
+    encoder = FastEncoder(preprocessor)
+
+    data = pd.read_csv(PRICING_DATA, index_col=0).drop(columns=["rental_price_per_day"])
+    cars = data.sample(args.rows, replace=True, random_state=0).to_dict(orient="records")
+
+    paths = {
+        "DataFrame + preprocessor.transform": lambda car: preprocessor.transform(pd.DataFrame({k: [v] for k, v in car.items()})),
+        "FastEncoder.encode + to_sparse": lambda car: encoder.to_sparse(encoder.encode(SimpleNamespace(**car))),
+    }
+    print(f"{'path':>35} | {'p50 (µs)':>9} | {'p99 (µs)':>9}")
+    for name, function in paths.items():
+        timings = latencies(function, cars)
+        print(f"{name:>35} | {np.percentile(timings, 50):>9.1f} | {np.percentile(timings, 99):>9.1f}")
+
+
+def benchmark_engines(args):
+    from engines import NativeModel, OnnxModel, PyfuncModel
+
+    with open("preprocessor.pkl", "rb") as file:
+        preprocessor = pickle.load(file)
+    encoder = FastEncoder(preprocessor)
+
+    data = pd.read_csv(PRICING_DATA, index_col=0).drop(columns=["rental_price_per_day"])
+    cars = data.sample(args.rows, replace=True, random_state=0).to_dict(orient="records")
+    batch = preprocessor.transform(data)
+
+    print(f"{'engine':>7} | {'load (s)':>8} | {'p50 (µs)':>9} | {'p99 (µs)':>9} | {'batch rows/s':>12}")
+    engines = {"pyfunc": PyfuncModel, "native": NativeModel, "onnx": OnnxModel}
+    for engine in (engines[name] for name in args.engines):
+        start = time.perf_counter()
+        model = engine()
+        load = time.perf_counter() - start
+
+        if model.raw_features:
+            timings = latencies(lambda car: model.predict({column: [value] for column, value in car.items()}), cars)
+        else:
+            timings = latencies(lambda car: model.predict(encoder.encode(SimpleNamespace(**car))), cars)
+
+        start = time.perf_counter()
+        model.predict(data if model.raw_features else batch)
+        rows = batch.shape[0] / (time.perf_counter() - start)
+        print(f"{engine.name:>7} | {load:>8.2f} | {np.percentile(timings, 50):>9.1f} | {np.percentile(timings, 99):>9.1f} | {rows:>12.0f}")
+
+
+def import_time(env):
+    """Wall time of `import app` in a fresh Python process (the model isn't loaded by the import)."""
+    code = "import time; start = time.perf_counter(); import app; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], env={**os.environ, **env}, check=True, capture_output=True, text=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def time_to_ready(env, port):
+    """Wall time from the launch of a uvicorn server until `/readyz` answers."""
+    start = time.perf_counter()
+    process = serve(env, port)
+    try:
+        return time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def benchmark_startup(args):
+    paths = {
+        "bundle": {"MODEL_BUNDLE_DIR": args.bundle_dir},
+        "no bundle": {"MODEL_BUNDLE_DIR": os.devnull},
+    }
+    print(f"{'startup':>9} | {'import median (s)':>17} | {'ready median (s)':>16} | {'ready max (s)':>13}")
+    for name, env in paths.items():
+        imports = [import_time(env) for _ in range(args.runs)]
+        ready = [time_to_ready(env, args.port) for _ in range(args.runs)]
+        print(f"{name:>9} | {np.median(imports):>17.2f} | {np.median(ready):>16.2f} | {max(ready):>13.2f}")
+
+
+def benchmark_imports(args):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], check=True, capture_output=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # The modules imported by app.py are one level below it
+        if name.startswith("   ") and not name.startswith("     "):
+            imports.append((int(cumulative) / 1e3, name.strip()))
+        elif name.strip() == "app":
+            total = int(cumulative) / 1e3
+    print(f"import app: {total:.0f} ms")
+    print(f"{'module':>20} | {'cumulative (ms)':>15}")
+    for cumulative, name in sorted(imports, reverse=True)[:args.top]:
+        print(f"{name:>20} | {cumulative:>15.1f}")
+
+
+def serve(env, port, command=None):
+    """Start the API (with uvicorn by default) in a subprocess and wait until it's ready."""
+    import httpx
+
+    command = command or [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"]
+    process = subprocess.Popen(command, env={**os.environ, **env})
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        try:
+            wait_until_ready(lambda path: httpx.get(f"http://127.0.0.1:{port}{path}"))
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.05)
+        except RuntimeError:
+            process.kill()
+            raise
+    process.kill()
+    raise RuntimeError("The API didn't start in 5 minutes")
+
+
+async def send_requests(url, path, payloads, concurrency):
+    """Post the payloads with `concurrency` requests in flight, return the throughput and the latencies (ms)."""
+    import httpx
+
+    timings = []
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        async def send(payload):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(path, json=payload)
+                response.raise_for_status()
+                timings.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(payload) for payload in payloads))
+        return len(payloads) / (time.perf_counter() - start), np.array(timings)
+
+
+def benchmark_load(args):
+    cars = load_cars(args.requests)
+    settings = {
+        "without coalescing": {"MICRO_BATCH_MAX_SIZE": "0", "CACHE_MAX_SIZE": "0"},
+        "with coalescing": {"MICRO_BATCH_MAX_SIZE": str(args.max_batch_size), "MICRO_BATCH_MAX_WAIT_MS": str(args.max_wait_ms), "CACHE_MAX_SIZE": "0"},
+    }
+    print(f"{'setting':>18} | {'req/s':>7} | {'p50 (ms)':>8} | {'p99 (ms)':>8}")
+    for name, env in settings.items():
+        process = serve(env, args.port)
+        try:
+            throughput, timings = asyncio.run(send_requests(f"http://127.0.0.1:{args.port}", "/predict", cars, args.concurrency))
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"{name:>18} | {throughput:>7.0f} | {np.percentile(timings, 50):>8.1f} | {np.percentile(timings, 99):>8.1f}")
+
+
+def benchmark_scaling(args):
+    data = pd.read_csv(PRICING_DATA, index_col=0)
+    cars = load_cars(len(data) * args.replays)
+    command = [sys.executable, "-m", "gunicorn", "app:app", "-c", "gunicorn_conf.py", "--log-level", "warning"]
+
+    print(f"{'workers':>7} | {'req/s':>7} | {'p50 (ms)':>8} | {'p99 (ms)':>8} | {'scaling':>7}")
+    baseline = None
+    for workers in args.workers:
+        env = {"WEB_CONCURRENCY": str(workers), "PORT": str(args.port), "CACHE_MAX_SIZE": "0"}
+        process = serve(env, args.port, command)
+        try:
+            throughput, timings = asyncio.run(send_requests(f"http://127.0.0.1:{args.port}", "/predict", cars, args.concurrency))
+        finally:
+            process.terminate()
+            process.wait()
+        baseline = baseline or throughput
+        print(f"{workers:>7} | {throughput:>7.0f} | {np.percentile(timings, 50):>8.1f} | {np.percentile(timings, 99):>8.1f} | {throughput / baseline:>6.2f}x")
+
+
+def memory_high_water(pid):
+    """Peak resident memory (MB) of a process, read from /proc (Linux only)."""
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+
+def benchmark_file(args):
+    import tempfile
+    import httpx
+
+    data = pd.read_csv(PRICING_DATA, index_col=0)
+    print(f"{'rows':>8} | {'rows/s':>7} | {'memory high-water (MB)':>22}")
+    for rows in args.rows:
+        cars = pd.concat([data] * (rows // len(data) + 1)).head(rows).reset_index(drop=True)
+        with tempfile.NamedTemporaryFile(suffix=f".{args.format}") as upload:
+            if args.format == "parquet":
+                cars.to_parquet(upload.name)
+            else:
+                cars.to_csv(upload.name)
+
+            process = serve({"CACHE_MAX_SIZE": "0"}, args.port)
+            try:
+                start = time.perf_counter()
+                with open(upload.name, "rb") as file:
+                    with httpx.stream("POST", f"http://127.0.0.1:{args.port}/predict/file", files={"file": file}, timeout=None) as response:
+                        response.raise_for_status()
+                        for _ in response.iter_bytes():
+                            pass
+                throughput = rows / (time.perf_counter() - start)
+                memory = memory_high_water(process.pid)
+            finally:
+                process.terminate()
+                process.wait()
+        print(f"{rows:>8} | {throughput:>7.0f} | {memory:>22.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    batch_parser = subparsers.add_parser("batch", help="rows/sec of /predict against /predict/batch")
+    batch_parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000], help="Batch sizes to benchmark")
+    batch_parser.add_argument("--single-limit", type=int, default=1000, help="Maximum number of `/predict` calls per size")
+    batch_parser.set_defaults(run=benchmark_batch)
+
+    encoder_parser = subparsers.add_parser("encoder", help="p50/p99 latency of the single-row preprocessing")
+    encoder_parser.add_argument("--rows", type=int, default=2000, help="Number of single-row calls per path")
+    encoder_parser.set_defaults(run=benchmark_encoder)
+
+    engines_parser = subparsers.add_parser("engines", help="load time and latency of the pyfunc and native engines")
+    engines_parser.add_argument("--rows", type=int, default=2000, help="Number of single-row calls per engine")
+    engines_parser.add_argument("--engines", nargs="+", choices=["pyfunc", "native", "onnx"], default=["pyfunc", "native", "onnx"],
+                                help="Engines to compare")
+    engines_parser.set_defaults(run=benchmark_engines)
+
+    startup_parser = subparsers.add_parser("startup", help="startup time with and without the offline bundle")
+    startup_parser.add_argument("--bundle-dir", default="bundle", help="Directory of the offline bundle")
+    startup_parser.add_argument("--runs", type=int, default=5, help="Number of startups per path")
+    startup_parser.add_argument("--port", type=int, default=8765, help="Port of the benchmarked server")
+    startup_parser.set_defaults(run=benchmark_startup)
+
+    imports_parser = subparsers.add_parser("imports", help="import time of the modules imported by the app")
+    imports_parser.add_argument("--top", type=int, default=15, help="Number of modules to show")
+    imports_parser.set_defaults(run=benchmark_imports)
+
+    load_parser = subparsers.add_parser("load", help="throughput and tail latency with and without micro-batching")
+    load_parser.add_argument("--requests", type=int, default=5000, help="Number of `/predict` requests per setting")
+    load_parser.add_argument("--concurrency", type=int, default=64, help="Number of requests in flight")
+    load_parser.add_argument("--max-batch-size", type=int, default=64, help="MICRO_BATCH_MAX_SIZE of the coalescing setting")
+    load_parser.add_argument("--max-wait-ms", type=float, default=2, help="MICRO_BATCH_MAX_WAIT_MS of the coalescing setting")
+    load_parser.add_argument("--port", type=int, default=8765, help="Port of the benchmarked server")
+    load_parser.set_defaults(run=benchmark_load)
+
+    scaling_parser = subparsers.add_parser("scaling", help="req/s of gunicorn with 1 to N workers")
+    scaling_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Numbers of workers to benchmark")
+    scaling_parser.add_argument("--replays", type=int, default=1, help="Number of times the pricing dataset is replayed")
+    scaling_parser.add_argument("--concurrency", type=int, default=64, help="Number of requests in flight")
+    scaling_parser.add_argument("--port", type=int, default=8765, help="Port of the benchmarked server")
+    scaling_parser.set_defaults(run=benchmark_scaling)
+
+    file_parser = subparsers.add_parser("file", help="rows/sec and memory high-water of /predict/file")
+    file_parser.add_argument("--rows", type=int, nargs="+", default=[50000, 200000, 500000], help="Numbers of rows of the uploaded files")
+    file_parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="Format of the uploaded files")
+    file_parser.add_argument("--port", type=int, default=8765, help="Port of the benchmarked server")
+    file_parser.set_defaults(run=benchmark_file)
+
+    args = parser.parse_args()
+    args.run(args)
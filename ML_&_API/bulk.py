@@ -0,0 +1,85 @@
+"""
+Bulk scoring of CSV and Parquet files shaped like `get_around_pricing_project.csv`.
+
+The uploaded file is read chunk by chunk, every chunk is scored on its own and written
+back to the response stream with a `rental_price_per_day_pred` column, so the memory
+used by the API doesn't depend on the size of the file.
+"""
+import io
+
+PREDICTION_COLUMN = "rental_price_per_day_pred"
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+
+
+def is_parquet(filename):
+    return (filename or "").lower().endswith(PARQUET_EXTENSIONS)
+
+
+def read_chunks(file, parquet, chunk_size):
+    """DataFrames of `chunk_size` rows read from the uploaded file."""
+    if parquet:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        import pandas as pd
+
+        for chunk in pd.read_csv(file, chunksize=chunk_size):
+            # Keep the header of the unnamed index column of the pricing dataset as it was
+            yield chunk.rename(columns=lambda column: "" if column.startswith("Unnamed: ") else column)
+
+
+def csv_stream(chunks):
+    for i, chunk in enumerate(chunks):
+        yield chunk.to_csv(index=False, header=(i == 0))
+
+
+class _StreamSink(io.RawIOBase):
+    """Write-only file that keeps the written bytes until they are sent."""
+
+    def __init__(self):
+        self.buffers = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffers.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Position in the whole file, the Parquet footer stores the offsets of the row groups
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.buffers)
+        self.buffers.clear()
+        return data
+
+
+def parquet_stream(chunks):
+    """One Parquet row group per chunk, sent as soon as it is written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _StreamSink()
+    writer = None
+    for chunk in chunks:
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema)
+        writer.write_table(table)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+def scored_chunks(first_chunk, chunks, score):
+    """The already scored first chunk, then the next chunks scored one by one."""
+    yield first_chunk
+    for chunk in chunks:
+        yield score(chunk)
@@ -0,0 +1,118 @@
+"""
+Offline model bundle: the XGBoost booster and the preprocessor in one versioned local
+directory, so the API starts without the MLFlow tracking server or S3.
+
+    bundle/
+        manifest.json       version, source model, feature schema and SHA-256 checksums
+        booster.json        XGBoost booster of the MLFlow model
+        preprocessor.pkl    fitted preprocessor
+
+Export it once (needs the tracking server), then ship it with the API:
+
+    python bundle.py export --model-uri runs:/<run_id>/model --version 1.0 --output-dir bundle
+    python bundle.py verify bundle
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from datetime import datetime, timezone
+
+from config import MODEL_BUNDLE_DIR, MODEL_URI
+from engines import NATIVE_MODEL_FILE, NativeModel, export_native
+from schemas import PredictionFeatures
+
+MANIFEST_FILE = "manifest.json"
+PREPROCESSOR_FILE = "preprocessor.pkl"
+BUNDLE_FILES = (NATIVE_MODEL_FILE, PREPROCESSOR_FILE)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def bundle_checksum(files):
+    """Checksum of the whole bundle, computed from the checksums of its files."""
+    return hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()
+
+
+def write_manifest(output_dir, version, model_uri):
+    """Write the manifest of the booster and preprocessor already saved in `output_dir`."""
+    import sklearn
+    import xgboost
+
+    files = {name: file_sha256(os.path.join(output_dir, name)) for name in BUNDLE_FILES}
+    manifest = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "model_uri": model_uri,
+        "feature_schema": PredictionFeatures.model_json_schema(),
+        "libraries": {"xgboost": xgboost.__version__, "scikit-learn": sklearn.__version__},
+        "files": files,
+        "checksum": bundle_checksum(files),
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=2, ensure_ascii=False)
+    return manifest
+
+
+def export_bundle(model_uri, output_dir, version, preprocessor_path="preprocessor.pkl"):
+    export_native(model_uri, output_dir)
+    shutil.copyfile(preprocessor_path, os.path.join(output_dir, PREPROCESSOR_FILE))
+    manifest = write_manifest(output_dir, version, model_uri)
+    print(f"✅ Bundle {version} saved in {output_dir} (checksum {manifest['checksum'][:12]})")
+
+
+def has_bundle(bundle_dir=MODEL_BUNDLE_DIR):
+    return os.path.exists(os.path.join(bundle_dir, MANIFEST_FILE))
+
+
+def verify_bundle(bundle_dir=MODEL_BUNDLE_DIR):
+    """Read the manifest and check the files and the feature schema of the bundle."""
+    with open(os.path.join(bundle_dir, MANIFEST_FILE)) as file:
+        manifest = json.load(file)
+
+    files = {name: file_sha256(os.path.join(bundle_dir, name)) for name in manifest["files"]}
+    if files != manifest["files"] or bundle_checksum(files) != manifest["checksum"]:
+        corrupted = [name for name in files if files[name] != manifest["files"][name]]
+        raise RuntimeError(f"Bundle {bundle_dir} is corrupted, checksum mismatch on {', '.join(corrupted) or MANIFEST_FILE}")
+    if manifest["feature_schema"] != PredictionFeatures.model_json_schema():
+        raise RuntimeError(f"Bundle {bundle_dir} was exported for other features than PredictionFeatures")
+    return manifest
+
+
+def load_bundle(bundle_dir=MODEL_BUNDLE_DIR):
+    """Load the preprocessor and the native model of the bundle, and its manifest."""
+    manifest = verify_bundle(bundle_dir)
+    with open(os.path.join(bundle_dir, PREPROCESSOR_FILE), "rb") as file:
+        preprocessor = pickle.load(file)
+    model = NativeModel(bundle_dir)
+    model.version = f"bundle:{manifest['version']}:{manifest['checksum'][:12]}"
+    return preprocessor, model, manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export the MLFlow model and the preprocessor into a bundle")
+    export_parser.add_argument("--model-uri", default=MODEL_URI, help="MLFlow model to export")
+    export_parser.add_argument("--version", default=datetime.now().strftime("%Y%m%d%H%M%S"), help="Version of the bundle")
+    export_parser.add_argument("--preprocessor", default="preprocessor.pkl", help="Fitted preprocessor to export")
+    export_parser.add_argument("--output-dir", default=MODEL_BUNDLE_DIR, help="Directory of the bundle")
+
+    verify_parser = subparsers.add_parser("verify", help="Check the checksums and the feature schema of a bundle")
+    verify_parser.add_argument("bundle_dir", nargs="?", default=MODEL_BUNDLE_DIR, help="Directory of the bundle")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_bundle(args.model_uri, args.output_dir, args.version, args.preprocessor)
+    else:
+        manifest = verify_bundle(args.bundle_dir)
+        print(f"✅ Bundle {manifest['version']} is valid (checksum {manifest['checksum'][:12]})")
@@ -0,0 +1,96 @@
+"""
+In-process LRU/TTL cache of the predictions, in front of the preprocessing and the model.
+
+The key is the canonical form of a `PredictionFeatures`: its values in the column order
+of the preprocessor, numbers as floats (so 1000 and 1000.0 share an entry), optionally
+rounded to a bucket step. The cache is emptied when the version of the model changes.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    def __init__(self, columns, max_size, ttl=0, buckets=None, model_version=None):
+        self.columns = list(columns)
+        self.max_size = max_size
+        self.ttl = ttl
+        # {column: step}, only the columns with a step > 0 are rounded
+        self.buckets = {column: step for column, step in (buckets or {}).items() if step > 0}
+        self.model_version = model_version
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def canonicalize(self, features):
+        """Canonical values of `features`, numeric values rounded to their bucket step."""
+        values = {}
+        for column in self.columns:
+            value = getattr(features, column)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                step = self.buckets.get(column)
+                value = float(round(value / step) * step) if step else float(value)
+            values[column] = value
+        return values
+
+    def key(self, canonical):
+        return tuple(canonical[column] for column in self.columns)
+
+    def check_model_version(self, model_version):
+        """Empty the cache if the predictions were made by another version of the model."""
+        if model_version != self.model_version:
+            with self.lock:
+                self.entries.clear()
+                self.model_version = model_version
+                self.invalidations += 1
+
+    def get(self, key):
+        """Cached prediction of `key`, or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            prediction, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return prediction
+
+    def put(self, key, prediction):
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else None
+        with self.lock:
+            self.entries[key] = (prediction, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "model_version": self.model_version,
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,49 @@
+import os
+
+# Maximum number of rows sent at once to the preprocessor and the model by `/predict/batch`
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", 5000))
+
+# MLFlow model served by the `pyfunc` engine (needs the tracking server)
+MODEL_URI = os.environ.get("MODEL_URI", "runs:/c2037b0c2c9e4c629a02b7b8a7eb2642/model")
+
+# Serving engine of the model:
+#   "native": XGBoost booster exported in NATIVE_MODEL_DIR (see `python engines.py export-native`)
+#   "pyfunc": MLFlow pyfunc model loaded from MODEL_URI
+#   "onnx":   preprocessor and booster in one ONNX graph, ONNX_MODEL_PATH, served by onnxruntime
+#             (see `python engines.py export-onnx`)
+#   "auto":   "native" if a booster was exported in NATIVE_MODEL_DIR, "pyfunc" otherwise
+MODEL_ENGINE = os.environ.get("MODEL_ENGINE", "auto")
+NATIVE_MODEL_DIR = os.environ.get("NATIVE_MODEL_DIR", "model")
+ONNX_MODEL_PATH = os.environ.get("ONNX_MODEL_PATH", os.path.join(NATIVE_MODEL_DIR, "model.onnx"))
+
+# Number of threads used by the native XGBoost engine (0: let XGBoost use all the cores)
+XGBOOST_NTHREAD = int(os.environ.get("XGBOOST_NTHREAD", 0))
+
+# Number of intra-op threads of the onnxruntime session (0: let onnxruntime use all the cores)
+ONNX_INTRA_OP_THREADS = int(os.environ.get("ONNX_INTRA_OP_THREADS", 0))
+
+# Offline bundle exported by `python bundle.py export`: when it exists, the model and the
+# preprocessor are loaded from it only, whatever MODEL_ENGINE is (except "onnx")
+MODEL_BUNDLE_DIR = os.environ.get("MODEL_BUNDLE_DIR", "bundle")
+
+# In-process cache of the `/predict` results (see cache.py)
+#   CACHE_MAX_SIZE: maximum number of cached predictions (0 disables the cache)
+#   CACHE_TTL_SECONDS: lifetime of a cached prediction (0: until it is evicted)
+#   CACHE_MILEAGE_BUCKET, CACHE_ENGINE_POWER_BUCKET: round the numeric features to these
+#   steps before predicting, so close cars share one cache entry (0: exact values)
+CACHE_MAX_SIZE = int(os.environ.get("CACHE_MAX_SIZE", 10000))
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", 3600))
+CACHE_MILEAGE_BUCKET = float(os.environ.get("CACHE_MILEAGE_BUCKET", 0))
+CACHE_ENGINE_POWER_BUCKET = float(os.environ.get("CACHE_ENGINE_POWER_BUCKET", 0))
+
+# Micro-batching of the concurrent `/predict` requests (see batching.py): a batch is predicted
+# when MICRO_BATCH_MAX_SIZE requests are waiting or MICRO_BATCH_MAX_WAIT_MS after the first one
+# (MICRO_BATCH_MAX_SIZE=0 disables it, every request is then predicted on its own)
+MICRO_BATCH_MAX_SIZE = int(os.environ.get("MICRO_BATCH_MAX_SIZE", 64))
+MICRO_BATCH_MAX_WAIT_MS = float(os.environ.get("MICRO_BATCH_MAX_WAIT_MS", 2))
+
+# Profiling of sampled requests (see profiling.py): share of the requests to profile
+# (0 disables it), directory of the dumped profiles and profiler ("cprofile" or "pyinstrument")
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+PROFILING_DIR = os.environ.get("PROFILING_DIR", "profiles")
+PROFILER = os.environ.get("PROFILER", "cprofile")
@@ -0,0 +1,103 @@
+"""
+Fast-path feature encoder for single-row predictions.
+
+The fitted `preprocessor` (a ColumnTransformer with a StandardScaler on the numeric
+features and a OneHotEncoder(drop="first") on the categorical ones) is compiled once
+into plain Python dicts and NumPy arrays, so a `PredictionFeatures` is written straight
+into a preallocated float32 row without building a DataFrame.
+
+⚠️ The model was trained on the sparse output of the preprocessor: XGBoost treats the
+absent (zero) entries of a sparse matrix as *missing*, not as 0. The encoded row must be
+given to the model as a sparse matrix (see `to_sparse`), or with `missing=0.0`; the
+engines of `engines.py` take care of it.
+"""
+import numpy as np
+
+
+class FastEncoder:
+    def __init__(self, preprocessor):
+        # scikit-learn is only needed to compile the preprocessor (it's already loaded by its unpickling)
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+        # (column, output index, mean, scale) for each numeric feature
+        self.numeric = []
+        # (column, {category: output index or None if dropped}) for each categorical feature
+        self.categorical = []
+        # Whether an unknown category raises an error, like `preprocessor.transform`
+        self.strict = {}
+        # Known categories of the columns where an unknown category raises an error
+        self.categories = {}
+
+        offset = 0
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer == "drop" or len(columns) == 0:
+                continue
+            step = transformer.steps[-1][1] if isinstance(transformer, Pipeline) else transformer
+            if isinstance(transformer, Pipeline) and len(transformer.steps) > 1:
+                raise TypeError(f"Transformer '{name}' has more than one step, it can't be compiled")
+
+            if isinstance(step, StandardScaler):
+                means = step.mean_ if step.mean_ is not None else np.zeros(len(columns))
+                scales = step.scale_ if step.scale_ is not None else np.ones(len(columns))
+                for i, column in enumerate(columns):
+                    self.numeric.append((column, offset + i, float(means[i]), float(scales[i])))
+                offset += len(columns)
+
+            elif isinstance(step, OneHotEncoder):
+                drop_idx = step.drop_idx_ if step.drop_idx_ is not None else [None] * len(columns)
+                for column, categories, dropped in zip(columns, step.categories_, drop_idx):
+                    mapping = {}
+                    for i, category in enumerate(categories.tolist()):
+                        if dropped is not None and i == dropped:
+                            mapping[category] = None
+                        else:
+                            mapping[category] = offset
+                            offset += 1
+                    self.categorical.append((column, mapping))
+                    self.strict[column] = step.handle_unknown == "error"
+                    if self.strict[column]:
+                        self.categories[column] = frozenset(mapping)
+
+            else:
+                raise TypeError(f"Transformer '{name}' ({type(step).__name__}) can't be compiled")
+
+        self.n_features = offset
+        self.row = np.zeros(self.n_features, dtype=np.float32)
+
+    def encode(self, features, out=None):
+        """Write the encoded `features` into `out` (by default the preallocated row) and return it."""
+        row = self.row if out is None else out
+        row.fill(0)
+        for column, index, mean, scale in self.numeric:
+            row[index] = (getattr(features, column) - mean) / scale
+        for column, mapping in self.categorical:
+            value = getattr(features, column)
+            try:
+                index = mapping[value]
+            except KeyError:
+                if self.strict[column]:
+                    raise ValueError(f"Found unknown category {value!r} in column '{column}' during transform")
+                continue
+            if index is not None:
+                row[index] = 1.0
+        return row
+
+    @staticmethod
+    def to_sparse(row):
+        """One-row CSR matrix, zeros being missing values as in the preprocessor output."""
+        from scipy import sparse
+
+        return sparse.csr_matrix(np.atleast_2d(row))
+
+
+def check_categories(data, categories, first_row=0):
+    """
+    Raise a ValueError naming the first row (numbered from `first_row`) and the column of `data`
+    with a category missing from `categories` ({column: known categories}).
+    """
+    for column, known in categories.items():
+        unknown = ~data[column].isin(list(known)).to_numpy()
+        if unknown.any():
+            row = int(np.argmax(unknown))
+            raise ValueError(f"Found unknown category {data[column].iloc[row]!r} in column '{column}' (row {first_row + row}) during transform")
@@ -0,0 +1,243 @@
+"""
+Serving engines of the pricing model.
+
+The pyfunc and native engines take the output of the preprocessor: a sparse matrix, where
+absent entries are missing values, or a dense row from `FastEncoder` whose zeros are missing
+values too.
+
+* `PyfuncModel`: the MLFlow pyfunc model, loaded from the tracking server.
+* `NativeModel`: the underlying XGBoost booster, loaded from a local directory and
+  called through `inplace_predict` (no MLFlow, no network).
+* `OnnxModel`: the preprocessor and the booster converted into one ONNX graph, served by
+  onnxruntime. It takes the features themselves (`raw_features`), one column per input, and
+  needs neither scikit-learn, XGBoost nor MLFlow at serving time.
+
+Export the booster of the MLFlow model once, before using the native engine:
+
+    python engines.py export-native --model-uri runs:/<run_id>/model --output-dir model
+
+Convert the preprocessor and the booster (exported, or of the MLFlow model) into the ONNX
+graph, then compare it with the current pipeline:
+
+    python engines.py export-onnx --booster model/booster.json --output model/model.onnx
+    python parity.py onnx
+"""
+import argparse
+import copy
+import json
+import os
+import pickle
+
+import numpy as np
+
+from config import MODEL_ENGINE, MODEL_URI, NATIVE_MODEL_DIR, ONNX_INTRA_OP_THREADS, ONNX_MODEL_PATH, XGBOOST_NTHREAD
+from encoder import FastEncoder
+
+NATIVE_MODEL_FILE = "booster.json"
+# Opsets of the ONNX graph: the highest ones the XGBoost converter of onnxmltools supports
+ONNX_OPSET = 15
+ONNX_ML_OPSET = 3
+# NumPy type of the ONNX inputs, per type recorded in the metadata of the graph
+ONNX_INPUT_DTYPES = {"double": np.float64, "int64": np.int64, "string": object}
+
+
+def is_sparse(data):
+    # Output of the preprocessor, without importing scipy for the dense rows of the serving path
+    return hasattr(data, "tocsr")
+
+
+class PyfuncModel:
+    name = "pyfunc"
+    raw_features = False
+
+    def __init__(self, model_uri=MODEL_URI):
+        import mlflow
+
+        self.model = mlflow.pyfunc.load_model(model_uri)
+        self.version = f"pyfunc:{model_uri}"
+
+    def predict(self, data):
+        # The model was trained on sparse matrices: zeros of a dense row must stay missing values
+        if not is_sparse(data):
+            data = FastEncoder.to_sparse(data)
+        return np.asarray(self.model.predict(data))
+
+
+class NativeModel:
+    name = "native"
+    raw_features = False
+
+    def __init__(self, model_dir=NATIVE_MODEL_DIR, nthread=XGBOOST_NTHREAD):
+        import xgboost
+
+        self.booster = xgboost.Booster(model_file=os.path.join(model_dir, NATIVE_MODEL_FILE))
+        self.version = f"native:{os.path.abspath(model_dir)}"
+        if nthread > 0:
+            self.booster.set_param({"nthread": nthread})
+
+    def predict(self, data):
+        if is_sparse(data):
+            return self.booster.inplace_predict(data.tocsr())
+        # Dense rows come from the FastEncoder, where zeros are missing values
+        return self.booster.inplace_predict(np.atleast_2d(data), missing=0.0)
+
+
+class OnnxModel:
+    name = "onnx"
+    raw_features = True
+
+    def __init__(self, model_path=ONNX_MODEL_PATH, intra_op_threads=ONNX_INTRA_OP_THREADS):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.input_types = json.loads(metadata["input_types"])
+        self.categories = {column: frozenset(values) for column, values in json.loads(metadata["categories"]).items()}
+        self.version = f"onnx:{os.path.abspath(model_path)}"
+
+    def predict(self, columns):
+        """Prices of the cars of `columns`, a DataFrame or a mapping of each feature to its values."""
+        inputs = {}
+        for column, input_type in self.input_types.items():
+            values = np.asarray(columns[column], dtype=ONNX_INPUT_DTYPES[input_type])
+            # The ONNX one-hot encoding ignores unknown categories, `preprocessor.transform` rejects them
+            if column in self.categories and not self.categories[column].issuperset(values.tolist()):
+                unknown = next(value for value in values.tolist() if value not in self.categories[column])
+                raise ValueError(f"Found unknown category {unknown!r} in column '{column}' during transform")
+            inputs[column] = values.reshape(-1, 1)
+        return self.session.run(None, inputs)[0].ravel()
+
+
+def has_native_model(model_dir=NATIVE_MODEL_DIR):
+    return os.path.exists(os.path.join(model_dir, NATIVE_MODEL_FILE))
+
+
+def load_model(engine=MODEL_ENGINE):
+    """Load the model with the configured engine, falling back to pyfunc when no booster was exported."""
+    if engine == "auto":
+        engine = "native" if has_native_model() else "pyfunc"
+    if engine == "native":
+        return NativeModel()
+    if engine == "pyfunc":
+        return PyfuncModel()
+    if engine == "onnx":
+        return OnnxModel()
+    raise ValueError(f"Unknown model engine '{engine}', use 'native', 'pyfunc', 'onnx' or 'auto'")
+
+
+def load_mlflow_booster(model_uri):
+    """XGBoost booster of the MLFlow model (a GridSearchCV logged by `mlflow.sklearn.autolog`)."""
+    import mlflow
+
+    model = mlflow.sklearn.load_model(model_uri)
+    return getattr(model, "best_estimator_", model).get_booster()
+
+
+def export_native(model_uri, output_dir):
+    """Save the XGBoost booster of the MLFlow model."""
+    booster = load_mlflow_booster(model_uri)
+    os.makedirs(output_dir, exist_ok=True)
+    booster.save_model(os.path.join(output_dir, NATIVE_MODEL_FILE))
+    print(f"✅ Booster of {model_uri} saved in {output_dir}/{NATIVE_MODEL_FILE}")
+
+
+def build_onnx(preprocessor, booster):
+    """
+    ONNX graph of the preprocessor followed by the booster, with one input per feature column.
+
+    * The numeric features are scaled in float64, like `preprocessor.transform`: scaling them in
+      float32 moves some values across the split thresholds of the trees.
+    * The booster was trained on the sparse output of the preprocessor, where zeros are missing
+      values: the zeros of the dense ONNX output are replaced by NaN, the missing value of the
+      converted trees.
+    * The ONNX one-hot encoder has no boolean input: the boolean categories become 0 / 1 integers.
+    """
+    from onnx import TensorProto, compose, helper
+    from onnxmltools import convert_xgboost
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import DoubleTensorType, FloatTensorType, Int64TensorType, StringTensorType
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+
+    preprocessor = copy.deepcopy(preprocessor)
+    input_types, categories = {}, {}
+    for name, transformer, columns in preprocessor.transformers_:
+        if transformer == "drop" or len(columns) == 0:
+            continue
+        step = transformer.steps[-1][1] if isinstance(transformer, Pipeline) else transformer
+        if not isinstance(step, OneHotEncoder):
+            input_types.update((column, "double") for column in columns)
+            continue
+        step.categories_ = [values.astype(np.int64) if values.dtype == bool else values for values in step.categories_]
+        for column, values in zip(columns, step.categories_):
+            input_types[column] = "int64" if values.dtype == np.int64 else "string"
+            categories[column] = values.tolist()
+    onnx_types = {"double": DoubleTensorType, "int64": Int64TensorType, "string": StringTensorType}
+    opsets = {"": ONNX_OPSET, "ai.onnx.ml": ONNX_ML_OPSET}
+    preprocessor_graph = convert_sklearn(preprocessor, target_opset=opsets,
+                                         initial_types=[(column, onnx_types[input_type]([None, 1]))
+                                                        for column, input_type in input_types.items()])
+    n_features = booster.num_features()
+    booster_graph = convert_xgboost(booster, initial_types=[("features", FloatTensorType([None, n_features]))],
+                                    target_opset=ONNX_OPSET)
+    booster_graph = compose.add_prefix(booster_graph, "booster_")
+
+    # Float32 features of the booster, NaN where the preprocessor output is 0
+    graph = preprocessor_graph.graph
+    (transformed,) = graph.output
+    graph.initializer.extend([helper.make_tensor("zero", TensorProto.FLOAT, [], [0.0]),
+                              helper.make_tensor("missing", TensorProto.FLOAT, [], [np.nan])])
+    graph.node.extend([
+        helper.make_node("Cast", [transformed.name], ["dense_features"], to=TensorProto.FLOAT),
+        helper.make_node("Equal", ["dense_features", "zero"], ["is_missing"]),
+        helper.make_node("Where", ["is_missing", "missing", "dense_features"], ["features"]),
+    ])
+    graph.output.pop()
+    graph.output.append(helper.make_tensor_value_info("features", TensorProto.FLOAT, [None, n_features]))
+
+    booster_graph.ir_version = preprocessor_graph.ir_version
+    del booster_graph.opset_import[:]
+    booster_graph.opset_import.extend(preprocessor_graph.opset_import)
+    model = compose.merge_models(preprocessor_graph, booster_graph, io_map=[("features", "booster_features")])
+    helper.set_model_props(model, {"input_types": json.dumps(input_types), "categories": json.dumps(categories)})
+    return model
+
+
+def export_onnx(output_path, preprocessor_path="preprocessor.pkl", booster_path=None, model_uri=MODEL_URI):
+    """Save the ONNX graph of the preprocessor and the booster (a saved booster, or the one of the MLFlow model)."""
+    import onnx
+    import xgboost
+
+    with open(preprocessor_path, "rb") as file:
+        preprocessor = pickle.load(file)
+    booster = xgboost.Booster(model_file=booster_path) if booster_path else load_mlflow_booster(model_uri)
+    model = build_onnx(preprocessor, booster)
+    onnx.checker.check_model(model)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    onnx.save(model, output_path)
+    print(f"✅ ONNX graph of {preprocessor_path} and {booster_path or model_uri} saved in {output_path} "
+          f"({os.path.getsize(output_path) / 1e3:.0f} kB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export-native", help="Save the XGBoost booster of the MLFlow model")
+    export_parser.add_argument("--model-uri", default=MODEL_URI, help="MLFlow model to export")
+    export_parser.add_argument("--output-dir", default=NATIVE_MODEL_DIR, help="Directory of the exported booster")
+
+    onnx_parser = subparsers.add_parser("export-onnx", help="Convert the preprocessor and the booster into one ONNX graph")
+    onnx_parser.add_argument("--preprocessor", default="preprocessor.pkl", help="Fitted preprocessor to convert")
+    onnx_parser.add_argument("--booster", help="Saved XGBoost booster to convert (default: the booster of --model-uri)")
+    onnx_parser.add_argument("--model-uri", default=MODEL_URI, help="MLFlow model to convert, without --booster")
+    onnx_parser.add_argument("--output", default=ONNX_MODEL_PATH, help="Path of the ONNX graph")
+
+    args = parser.parse_args()
+    if args.command == "export-native":
+        export_native(args.model_uri, args.output_dir)
+    else:
+        export_onnx(args.output, args.preprocessor, args.booster, args.model_uri)
@@ -0,0 +1,39 @@
+"""
+Multi-process serving of the API with gunicorn and uvicorn workers:
+
+    gunicorn app:app -c gunicorn_conf.py
+
+The app is imported (`preload_app`) and its model, preprocessor and encoder are loaded and
+warmed up once in the gunicorn master before the workers are forked, so the workers share
+their memory copy-on-write instead of each loading its own copy, and `/readyz` answers as soon
+as a worker starts.
+
+Environment variables:
+    WEB_CONCURRENCY   number of worker processes (default: number of cores)
+    PORT              port of the API (default 8000)
+"""
+import gc
+import os
+
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+
+# One XGBoost/OpenMP thread per worker unless configured otherwise: the cores are already
+# shared between the workers
+if workers > 1:
+    os.environ.setdefault("XGBOOST_NTHREAD", "1")
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+
+def when_ready(server):
+    import app
+
+    app.load_serving_state()
+    app.warm_up()
+    # The app is loaded: move its objects out of the garbage collector's reach, so the
+    # collections in the workers don't write to (and copy) the shared memory pages
+    gc.freeze()
+    server.log.info(f"API loaded, forking {workers} workers")
@@ -0,0 +1,156 @@
+"""
+Latency and throughput metrics of the prediction pipeline, exposed on `/metrics` in the
+Prometheus text format.
+
+* `getaround_api_request_seconds{path}`: time spent in each route.
+* `getaround_api_stage_seconds{stage}`: time spent in each stage of the pipeline:
+  `validation` (body reading, JSON parsing and pydantic validation), `cache`, `dataframe`,
+  `encode`, `preprocess` (`preprocessor.transform`), `predict` (model call) and
+  `serialization` (response encoding).
+* `getaround_api_batch_rows{source}`: number of rows per model call, for the micro-batches
+  of `/predict` and the DataFrame chunks of `/predict/batch` and `/predict/file`.
+
+The metrics are kept per process: with several gunicorn workers, each worker answers with its own.
+"""
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from fastapi.routing import APIRoute
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROWS_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    def __init__(self, name, help, label, buckets):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        # {label value: [count per bucket..., sum, count]}
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, label_value):
+        with self.lock:
+            values = self.values.setdefault(label_value, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_value, values in sorted(self.values.items()):
+                label = f'{self.label}="{label_value}"'
+                for bound, count in zip(self.buckets, values):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {values[-1]}')
+                lines.append(f"{self.name}_sum{{{label}}} {values[-2]}")
+                lines.append(f"{self.name}_count{{{label}}} {values[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("getaround_api_request_seconds", "Time spent in each route.", "path", LATENCY_BUCKETS)
+STAGE_SECONDS = Histogram("getaround_api_stage_seconds", "Time spent in each stage of the prediction pipeline.", "stage", LATENCY_BUCKETS)
+BATCH_ROWS = Histogram("getaround_api_batch_rows", "Number of rows per model call.", "source", ROWS_BUCKETS)
+
+
+@contextmanager
+def stage(name):
+    """Time the block as the stage `name` of the pipeline."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, name)
+
+
+# Start and end times of the endpoint function of the current request, set by TimedRoute
+_endpoint_times = ContextVar("endpoint_times")
+
+
+def _timed_endpoint(endpoint):
+    # functools.wraps keeps the signature, so FastAPI still sees the parameters of the endpoint
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            times = _endpoint_times.get(None)
+            if times is not None:
+                times["start"] = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                if times is not None:
+                    times["end"] = time.perf_counter()
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            times = _endpoint_times.get(None)
+            if times is not None:
+                times["start"] = time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                if times is not None:
+                    times["end"] = time.perf_counter()
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """Route timing the whole request, and the validation and serialization around its endpoint."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def timed_handler(request):
+            times = {}
+            token = _endpoint_times.set(times)
+            start = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                end = time.perf_counter()
+                _endpoint_times.reset(token)
+                REQUEST_SECONDS.observe(end - start, path)
+                if "start" in times:
+                    STAGE_SECONDS.observe(times["start"] - start, "validation")
+                if "end" in times:
+                    STAGE_SECONDS.observe(end - times["end"], "serialization")
+
+        return timed_handler
+
+
+def render_metrics(cache_stats=None, batching_stats=None):
+    """All the metrics in the Prometheus text format."""
+    lines = []
+    for histogram in (REQUEST_SECONDS, STAGE_SECONDS, BATCH_ROWS):
+        lines.extend(histogram.render())
+
+    counters = {}
+    if cache_stats is not None:
+        counters.update({
+            "getaround_api_cache_hits_total": ("counter", "Predictions found in the cache.", cache_stats["hits"]),
+            "getaround_api_cache_misses_total": ("counter", "Predictions not found in the cache.", cache_stats["misses"]),
+            "getaround_api_cache_evictions_total": ("counter", "Predictions evicted from the full cache.", cache_stats["evictions"]),
+            "getaround_api_cache_expirations_total": ("counter", "Cached predictions expired.", cache_stats["expirations"]),
+            "getaround_api_cache_size": ("gauge", "Number of cached predictions.", cache_stats["size"]),
+        })
+    if batching_stats is not None:
+        counters.update({
+            "getaround_api_micro_batches_total": ("counter", "Micro-batches of /predict requests.", batching_stats["batches"]),
+            "getaround_api_micro_batch_items_total": ("counter", "Requests predicted in micro-batches.", batching_stats["items"]),
+        })
+    for name, (kind, help, value) in counters.items():
+        lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,121 @@
+"""
+Parity checks of the fast serving paths against the reference pipeline
+(`preprocessor.transform` + the MLFlow model), on every row of `get_around_pricing_project.csv`:
+
+    python parity.py encoder
+    python parity.py native     # needs the MLFlow model and an exported booster
+    python parity.py onnx       # needs an exported ONNX graph, and a booster or the MLFlow model
+
+Exits with status 1 if any row differs.
+"""
+import argparse
+import pickle
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from encoder import FastEncoder
+
+PRICING_DATA = "../get_around_pricing_project.csv"
+# Maximum difference between two predictions (in € per day), both engines work in float32
+PREDICTION_TOLERANCE = 1e-3
+
+
+def load_pricing_data():
+    return pd.read_csv(PRICING_DATA, index_col=0).drop(columns=["rental_price_per_day"])
+
+
+def load_preprocessor():
+    with open("preprocessor.pkl", "rb") as file:
+        return pickle.load(file)
+
+
+def check_encoder():
+    """Every encoded row must be equal to the float32 output of `preprocessor.transform`."""
+    data = load_pricing_data()
+    preprocessor = load_preprocessor()
+    encoder = FastEncoder(preprocessor)
+
+    expected = preprocessor.transform(data)
+    expected = (expected.toarray() if hasattr(expected, "toarray") else expected).astype(np.float32)
+    encoded = np.vstack([
+        encoder.encode(SimpleNamespace(**car)).copy()
+        for car in data.to_dict(orient="records")
+    ])
+
+    mismatches = int((encoded != expected).any(axis=1).sum())
+    print(f"encoder: {len(data)} rows, {mismatches} mismatching rows, max abs diff {np.abs(encoded - expected).max():.3g}")
+    return mismatches == 0
+
+
+def check_native():
+    """The native XGBoost engine must predict like the MLFlow pyfunc model, on sparse and encoded rows."""
+    from engines import NativeModel, PyfuncModel
+
+    data = load_pricing_data()
+    preprocessor = load_preprocessor()
+    encoder = FastEncoder(preprocessor)
+    pyfunc_model, native_model = PyfuncModel(), NativeModel()
+
+    expected = pyfunc_model.predict(preprocessor.transform(data))
+    results = {
+        "sparse": native_model.predict(preprocessor.transform(data)),
+        "encoded": np.concatenate([
+            native_model.predict(encoder.encode(SimpleNamespace(**car)))
+            for car in data.to_dict(orient="records")
+        ]),
+    }
+
+    ok = True
+    for name, predictions in results.items():
+        max_diff = np.abs(predictions - expected).max()
+        print(f"native ({name} rows): {len(data)} rows, max abs diff with pyfunc {max_diff:.3g} €")
+        ok = ok and max_diff < PREDICTION_TOLERANCE
+    return ok
+
+
+def check_onnx():
+    """
+    The ONNX engine must predict like the preprocessor and the current model (native engine if a
+    booster was exported, pyfunc otherwise), on the whole dataset and row by row.
+    """
+    from engines import OnnxModel, load_model
+
+    data = load_pricing_data()
+    reference_model, onnx_model = load_model("auto"), OnnxModel()
+
+    expected = reference_model.predict(load_preprocessor().transform(data))
+    results = {
+        "batch": onnx_model.predict(data),
+        "single": np.concatenate([
+            onnx_model.predict({column: [value] for column, value in car.items()})
+            for car in data.to_dict(orient="records")
+        ]),
+    }
+
+    ok = True
+    for name, predictions in results.items():
+        max_diff = np.abs(predictions - expected).max()
+        print(f"onnx ({name} rows): {len(data)} rows, max abs diff with {reference_model.name} {max_diff:.3g} €")
+        ok = ok and max_diff < PREDICTION_TOLERANCE
+    return ok
+
+
+CHECKS = {
+    "encoder": check_encoder,
+    "native": check_native,
+    "onnx": check_onnx,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("checks", nargs="*", help=f"Checks to run among {', '.join(CHECKS)} (all by default)")
+    args = parser.parse_args()
+
+    unknown = set(args.checks) - set(CHECKS)
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(sorted(unknown))}")
+    results = [CHECKS[check]() for check in args.checks or CHECKS]
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,63 @@
+"""
+Optional profiling of sampled requests.
+
+A share `sample_rate` of the HTTP requests is run under cProfile (or pyinstrument, when it
+is installed and `profiler="pyinstrument"`) and the profile is dumped in `output_dir`:
+
+    python -c "import pstats; pstats.Stats('profiles/<file>.prof').sort_stats('cumtime').print_stats(20)"
+
+Only one request is profiled at a time. cProfile records everything the event loop runs
+meanwhile, pyinstrument follows the request across its awaits. Both only see the event loop
+thread: the model calls run in worker threads are timed by the `/metrics` stages instead.
+"""
+import cProfile
+import os
+import random
+import time
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, sample_rate, output_dir, profiler="cprofile"):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.profiler = profiler
+        self.active = False
+        self.profiled = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.active or random.random() >= self.sample_rate:
+            return await self.app(scope, receive, send)
+
+        self.active = True
+        self.profiled += 1
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.profiled}-{scope['method']}{scope['path'].replace('/', '_')}"
+        try:
+            if self.profiler == "pyinstrument":
+                await self._pyinstrument(scope, receive, send, name)
+            else:
+                await self._cprofile(scope, receive, send, name)
+        finally:
+            self.active = False
+
+    async def _cprofile(self, scope, receive, send, name):
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profile.disable()
+            profile.dump_stats(os.path.join(self.output_dir, f"{name}.prof"))
+
+    async def _pyinstrument(self, scope, receive, send, name):
+        from pyinstrument import Profiler
+
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+            with open(os.path.join(self.output_dir, f"{name}.html"), "w") as file:
+                file.write(profiler.output_html())
@@ -0,0 +1,59 @@
+from pydantic import BaseModel, model_validator
+from typing import Literal, List, Union
+
+
+class PredictionFeatures(BaseModel):
+    model_key: Literal['Citroën','Peugeot','PGO','Renault','Audi','BMW','Mercedes','Opel','Volkswagen','Ferrari','Mitsubishi','Nissan','SEAT','Subaru','Toyota','other'] 
+    mileage: Union[int, float]
+    engine_power: Union[int, float]
+    fuel: Literal['diesel','petrol','other']
+    paint_color: Literal['black','grey','white','red','silver','blue','beige','brown','other']
+    car_type: Literal['convertible','coupe','estate','hatchback','sedan','subcompact','suv','van']
+    private_parking_available: bool
+    has_gps: bool
+    has_air_conditioning: bool
+    automatic_car: bool
+    has_getaround_connect: bool
+    has_speed_regulator: bool
+    winter_tires: bool
+
+# Column order expected by the preprocessor
+FEATURE_COLUMNS = list(PredictionFeatures.model_fields)
+
+# Cars of the pricing dataset predicted at startup to warm up the model (see `warm_up` in app.py)
+WARM_UP_CARS = [
+    {"model_key": "Citroën", "mileage": 140411, "engine_power": 100, "fuel": "diesel", "paint_color": "black", "car_type": "convertible",
+     "private_parking_available": True, "has_gps": True, "has_air_conditioning": False, "automatic_car": False,
+     "has_getaround_connect": True, "has_speed_regulator": True, "winter_tires": True},
+    {"model_key": "Audi", "mileage": 132979, "engine_power": 112, "fuel": "diesel", "paint_color": "brown", "car_type": "estate",
+     "private_parking_available": True, "has_gps": True, "has_air_conditioning": False, "automatic_car": False,
+     "has_getaround_connect": True, "has_speed_regulator": True, "winter_tires": True},
+    {"model_key": "Audi", "mileage": 189147, "engine_power": 225, "fuel": "petrol", "paint_color": "grey", "car_type": "sedan",
+     "private_parking_available": False, "has_gps": True, "has_air_conditioning": True, "automatic_car": False,
+     "has_getaround_connect": True, "has_speed_regulator": False, "winter_tires": True},
+    {"model_key": "Nissan", "mileage": 114569, "engine_power": 105, "fuel": "diesel", "paint_color": "silver", "car_type": "suv",
+     "private_parking_available": False, "has_gps": True, "has_air_conditioning": False, "automatic_car": True,
+     "has_getaround_connect": True, "has_speed_regulator": False, "winter_tires": True},
+]
+
+class ColumnarPredictionFeatures(BaseModel):
+    model_key: List[Literal['Citroën','Peugeot','PGO','Renault','Audi','BMW','Mercedes','Opel','Volkswagen','Ferrari','Mitsubishi','Nissan','SEAT','Subaru','Toyota','other']]
+    mileage: List[Union[int, float]]
+    engine_power: List[Union[int, float]]
+    fuel: List[Literal['diesel','petrol','other']]
+    paint_color: List[Literal['black','grey','white','red','silver','blue','beige','brown','other']]
+    car_type: List[Literal['convertible','coupe','estate','hatchback','sedan','subcompact','suv','van']]
+    private_parking_available: List[bool]
+    has_gps: List[bool]
+    has_air_conditioning: List[bool]
+    automatic_car: List[bool]
+    has_getaround_connect: List[bool]
+    has_speed_regulator: List[bool]
+    winter_tires: List[bool]
+
+    @model_validator(mode="after")
+    def check_same_length(self):
+        lengths = {len(getattr(self, column)) for column in FEATURE_COLUMNS}
+        if len(lengths) > 1:
+            raise ValueError("All the feature columns must have the same number of values")
+        return self
@@ -0,0 +1,41 @@
+"""
+Compare two result files of the benchmark suite (see run.py):
+
+    python benchmarks/compare.py benchmarks/results/<old>.json benchmarks/results/<new>.json --tolerance 1.2
+
+Prints the median time of every common case and the ratio new/old, and exits with
+status 1 if a case is slower than `tolerance` times its old median.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old", help="Results of the reference commit")
+    parser.add_argument("new", help="Results of the compared commit")
+    parser.add_argument("--tolerance", type=float, default=1.2, help="Maximum accepted ratio new/old of the medians")
+    args = parser.parse_args()
+
+    old, new = load(args.old), load(args.new)
+    print(f"{'case':<36} | {old['metadata']['commit']:>14} | {new['metadata']['commit']:>14} | {'ratio':>6}")
+    regressions = []
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            continue
+        ratio = result["median"] / old["results"][name]["median"]
+        flag = " ⚠️" if ratio > args.tolerance else ""
+        print(f"{name:<36} | {old['results'][name]['median'] * 1000:>11.3f} ms | {result['median'] * 1000:>11.3f} ms | {ratio:>5.2f}x{flag}")
+        if flag:
+            regressions.append(name)
+
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) above {args.tolerance}x: {', '.join(regressions)}")
+        sys.exit(1)
+    print("✅ No regression")
@@ -0,0 +1,55 @@
+"""
+The computations of `Dashboard/app.py`, as the pages run them.
+
+`Dashboard/app.py` is a Streamlit script and can't be imported, so its computations are
+reproduced here step by step to be benchmarked.
+"""
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+
+# Appended, so the dashboard (and its `app.py`) doesn't shadow the modules of the API of run.py
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Dashboard"))
+
+from cube import build_cube, read_cube, write_cube  # noqa: E402
+from delay_features import add_delay_features, add_previous_rental, category_counts  # noqa: E402
+from duckdb_engine import PREVIEW_ROWS, clean_parquet  # noqa: E402
+from ingestion import IncrementalCleaner  # noqa: E402
+from pipeline import clean_data, remove_outliers  # noqa: E402
+from scoring import SWEEPS, LocalScorer, sweep  # noqa: E402
+from row_browser import RowBrowser  # noqa: E402
+from simulation import build_timelines, simulate  # noqa: E402
+from thresholds import CHART_THRESHOLDS, ThresholdIndex, knee_point, pareto_frontier, sweep_thresholds  # noqa: E402
+
+
+def clean_delay_data(data):
+    """Join to the previous rentals, 3σ outlier filter on the checkout delay and derived delay columns (`pipeline.clean_data`)."""
+    data, _ = remove_outliers(add_previous_rental(data))
+    return add_delay_features(data)
+
+
+def delay_drivers(data):
+    """Late / early / unknown counts of the Delays page."""
+    return category_counts(data["checkout_delay_status"])
+
+
+def threshold_metrics(data, mean_rental_per_day, thresholds=CHART_THRESHOLDS):
+    """Revenue impacted, affected rentals and solved cases per threshold and scope (Delays page)."""
+    return ThresholdIndex.from_data(data, mean_rental_per_day).table(thresholds)
+
+
+def arrow_payload(data):
+    """Size (bytes) of the Arrow stream of a frame, as the app sends it to the browser."""
+    table = pa.Table.from_pandas(data)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().size
+
+
+def browse_page(browser):
+    """Second page of the connect rentals, sorted by decreasing checkout delay (raw data viewer of the Home page)."""
+    positions = browser.query({"checkin_type": ["connect"]}, sort_by="delay_at_checkout_in_minutes", descending=True)
+    return arrow_payload(browser.page(positions, 1))
@@ -0,0 +1,409 @@
+"""
+Local benchmark suite of the API and the dashboard computations.
+
+Runs offline: the API is served in-process by the FastAPI TestClient, with an XGBoost
+stand-in of the MLFlow model (see stub_model.py). The delay data is scaled up with
+synthetic copies (see synthetic.py). Results are saved as JSON, named after the git commit,
+so two commits can be compared with compare.py:
+
+    python benchmarks/run.py                          # everything, scales 1, 10 and 100
+    python benchmarks/run.py --filter dashboard --scales 1 10
+    python benchmarks/run.py --filter engines --rows 1000000 10000000 100000000 --min-repeat 1
+    python benchmarks/run.py --filter ingestion --rows 1000000 10000000
+    python benchmarks/run.py --filter simulation
+    python benchmarks/compare.py benchmarks/results/<old>.json benchmarks/results/<new>.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from functools import cached_property
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(ROOT, "ML_&_API")
+sys.path.insert(0, API_DIR)
+
+import pandas as pd  # noqa: E402
+
+import dashboard  # noqa: E402
+from synthetic import rows_label, scale_delay_data, scale_pricing_data, tiled_rows, write_delay_parquet  # noqa: E402
+
+DELAY_DATA = os.path.join(ROOT, "get_around_delay_analysis.xlsx")
+PRICING_DATA = os.path.join(ROOT, "get_around_pricing_project.csv")
+PREPROCESSOR = os.path.join(API_DIR, "preprocessor.pkl")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+def load_api():
+    """
+    Module of the API (`ML_&_API/app.py`), imported from its path: a bare `import app` would import
+    whichever `app.py` comes first on `sys.path`, and the dashboard has one too.
+    """
+    if "api_app" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("api_app", os.path.join(API_DIR, "app.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+    return sys.modules["api_app"]
+
+
+class Context:
+    """Data and objects shared by the benchmark cases, loaded on first use."""
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+
+    @cached_property
+    def delay_data(self):
+        return pd.read_excel(DELAY_DATA)
+
+    @cached_property
+    def pricing_data(self):
+        return pd.read_csv(PRICING_DATA, index_col=0)
+
+    @cached_property
+    def features(self):
+        return self.pricing_data.drop(columns=["rental_price_per_day"])
+
+    @cached_property
+    def preprocessor(self):
+        import pickle
+
+        with open(PREPROCESSOR, "rb") as file:
+            return pickle.load(file)
+
+    @cached_property
+    def bundle_dir(self):
+        # Offline API: stub bundle, no cache (every call is really predicted), no micro-batching
+        # (sequential requests would wait for its window). The settings are read when `config`
+        # is first imported, so they are set before anything of the API is imported.
+        bundle_dir = os.path.join(self.workdir, "bundle")
+        os.environ.update({
+            "MODEL_BUNDLE_DIR": bundle_dir,
+            "CACHE_MAX_SIZE": "0",
+            "MICRO_BATCH_MAX_SIZE": "0",
+            "PROFILING_SAMPLE_RATE": "0",
+        })
+        from stub_model import build_stub_bundle
+
+        return build_stub_bundle(bundle_dir, self.pricing_data, PREPROCESSOR)
+
+    @cached_property
+    def client(self):
+        self.bundle_dir  # the bundle is built and the settings are set before the API is imported
+        from fastapi.testclient import TestClient
+
+        client = TestClient(load_api().app)
+        client.__enter__()
+        # The model is loaded in the background by the startup of the app
+        while (response := client.get("/readyz")).status_code != 200:
+            if response.json()["status"] == "failed":
+                raise RuntimeError(f"The API failed to start: {response.json()['error']}")
+            time.sleep(0.05)
+        return client
+
+    @cached_property
+    def cars(self):
+        """Cars of the pricing dataset accepted by `PredictionFeatures`, as JSON payloads."""
+        from pydantic import ValidationError
+        from schemas import FEATURE_COLUMNS, PredictionFeatures
+
+        cars = []
+        for car in self.pricing_data[FEATURE_COLUMNS].to_dict(orient="records"):
+            try:
+                cars.append(PredictionFeatures(**car).model_dump())
+            except ValidationError:
+                continue
+        return cars
+
+    def scaled_delay_data(self, scale):
+        return scale_delay_data(self.delay_data, scale)
+
+    def cleaned_delay_data(self, scale):
+        return dashboard.clean_delay_data(self.scaled_delay_data(scale))
+
+    def delay_parquet(self, n_rows):
+        """Parquet file of `n_rows` rows of tiled delay analysis data, written on first use."""
+        path = os.path.join(self.workdir, f"delay_analysis_{rows_label(n_rows)}.parquet")
+        if not os.path.exists(path):
+            write_delay_parquet(self.delay_data, n_rows, path)
+        return path
+
+
+# name -> (group, scale, rows, setup): setup(context) returns the function to time
+CASES = {}
+
+
+def case(name, group, scale=None, rows=None):
+    def register(setup):
+        CASES[name] = (group, scale, rows, setup)
+        return setup
+    return register
+
+
+@case("api/predict_single", "api")
+def predict_single(context):
+    client, cars = context.client, context.cars
+    state = {"i": 0}
+
+    def run():
+        state["i"] = (state["i"] + 1) % len(cars)
+        client.post("/predict", json=cars[state["i"]]).raise_for_status()
+    return run
+
+
+for size in (100, 1000, 10000):
+    @case(f"api/predict_batch_{size}", "api")
+    def predict_batch(context, size=size):
+        client, cars = context.client, (context.cars * (size // len(context.cars) + 1))[:size]
+        return lambda: client.post("/predict/batch", json=cars).raise_for_status()
+
+
+@case("pricing/transform_1_row", "pricing")
+def transform_one_row(context):
+    preprocessor, row = context.preprocessor, context.features.iloc[:1]
+    return lambda: preprocessor.transform(row)
+
+
+@case("pricing/encode_1_row", "pricing")
+def encode_one_row(context):
+    from types import SimpleNamespace
+    from encoder import FastEncoder
+
+    encoder, car = FastEncoder(context.preprocessor), SimpleNamespace(**context.features.iloc[0].to_dict())
+    return lambda: encoder.encode(car)
+
+
+@case("pricing/sweep_grid", "pricing")
+def sweep_grid(context):
+    # Mileage sweep of the Price Prediction page: the whole grid in one local call
+    scorer, car = dashboard.LocalScorer(context.bundle_dir), context.cars[0]
+    return lambda: scorer.predict(dashboard.sweep(car, "mileage"))
+
+
+@case("pricing/sweep_per_point", "pricing")
+def sweep_per_point(context):
+    # Same grid, one call per point (what one request per price costs at best)
+    scorer, car = dashboard.LocalScorer(context.bundle_dir), context.cars[0]
+    points = [dashboard.sweep(car, "mileage", [value]) for value in dashboard.SWEEPS["mileage"]]
+    return lambda: [scorer.predict(point) for point in points]
+
+
+for name in ("delay", "pricing"):
+    @case(f"data/load_cold_{name}", "data")
+    def load_cold(context, name=name):
+        from datasets import load_dataset
+
+        cache_dir = os.path.join(context.workdir, "data_cache_cold")
+
+        def run():
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            load_dataset(name, source="local", cache_dir=cache_dir)
+        return run
+
+    @case(f"data/load_warm_{name}", "data")
+    def load_warm(context, name=name):
+        from datasets import load_dataset
+
+        cache_dir = os.path.join(context.workdir, "data_cache_warm")
+        load_dataset(name, source="local", cache_dir=cache_dir)
+        return lambda: load_dataset(name, source="local", cache_dir=cache_dir)
+
+
+SCALES = (1, 10, 100)
+
+for scale in SCALES:
+    @case(f"pricing/transform_x{scale}", "pricing", scale)
+    def transform_dataset(context, scale=scale):
+        preprocessor, features = context.preprocessor, scale_pricing_data(context.features, scale)
+        return lambda: preprocessor.transform(features)
+
+    @case(f"dashboard/clean_x{scale}", "dashboard", scale)
+    def clean(context, scale=scale):
+        data = context.scaled_delay_data(scale)
+        return lambda: dashboard.clean_delay_data(data)
+
+    @case(f"dashboard/read_cube_x{scale}", "dashboard", scale)
+    def read_cube(context, scale=scale):
+        path = os.path.join(context.workdir, f"delay_cube_x{scale}.arrow")
+        dashboard.write_cube(dashboard.build_cube(context.scaled_delay_data(scale), context.pricing_data), path)
+        return lambda: dashboard.read_cube(path)
+
+    @case(f"dashboard/previous_rental_x{scale}", "dashboard", scale)
+    def previous_rental(context, scale=scale):
+        data = context.scaled_delay_data(scale)
+        return lambda: dashboard.add_previous_rental(data)
+
+    @case(f"dashboard/delay_drivers_x{scale}", "dashboard", scale)
+    def delay_drivers(context, scale=scale):
+        data = context.cleaned_delay_data(scale)
+        return lambda: dashboard.delay_drivers(data)
+
+    @case(f"dashboard/threshold_metrics_x{scale}", "dashboard", scale)
+    def threshold_metrics(context, scale=scale):
+        data = context.cleaned_delay_data(scale)
+        mean_rental_per_day = context.pricing_data["rental_price_per_day"].mean()
+        return lambda: dashboard.threshold_metrics(data, mean_rental_per_day)
+
+    @case(f"dashboard/threshold_query_x{scale}", "dashboard", scale)
+    def threshold_query(context, scale=scale):
+        index = dashboard.ThresholdIndex.from_data(context.cleaned_delay_data(scale), context.pricing_data["rental_price_per_day"].mean())
+        return lambda: (index.affected(137, "connect"), index.revenue_impacted(137), index.solved(137))
+
+    @case(f"dashboard/raw_data_full_x{scale}", "dashboard", scale)
+    def raw_data_full(context, scale=scale):
+        data = context.cleaned_delay_data(scale)
+        return lambda: dashboard.arrow_payload(data)
+
+    @case(f"dashboard/raw_data_page_x{scale}", "dashboard", scale)
+    def raw_data_page(context, scale=scale):
+        # The sort order is computed by the first query, then kept by the browser like in the app
+        browser = dashboard.RowBrowser(context.cleaned_delay_data(scale))
+        return lambda: dashboard.browse_page(browser)
+
+    @case(f"dashboard/threshold_frontier_x{scale}", "dashboard", scale)
+    def threshold_frontier(context, scale=scale):
+        index = dashboard.ThresholdIndex.from_data(context.cleaned_delay_data(scale), context.pricing_data["rental_price_per_day"].mean())
+        return lambda: dashboard.knee_point(dashboard.pareto_frontier(dashboard.sweep_thresholds(index)), 10.0)
+
+
+# Rows of the synthetic Parquet files of the engine comparison; the pandas engine loads the whole
+# file in memory, so it only runs up to PANDAS_MAX_ROWS
+ROWS = (1_000_000, 10_000_000, 100_000_000)
+PANDAS_MAX_ROWS = 10_000_000
+
+for n_rows in ROWS:
+    if n_rows <= PANDAS_MAX_ROWS:
+        @case(f"engines/pandas_clean_{rows_label(n_rows)}", "engines", rows=n_rows)
+        def pandas_clean(context, n_rows=n_rows):
+            path, pricing_data = context.delay_parquet(n_rows), context.pricing_data
+            return lambda: dashboard.clean_data(pd.read_parquet(path), pricing_data)
+
+    @case(f"engines/duckdb_clean_{rows_label(n_rows)}", "engines", rows=n_rows)
+    def duckdb_clean(context, n_rows=n_rows):
+        path, mean_rental_per_day = context.delay_parquet(n_rows), context.pricing_data["rental_price_per_day"].mean()
+        temp_dir = os.path.join(context.workdir, "duckdb_tmp")
+        return lambda: dashboard.clean_parquet(path, mean_rental_per_day, preview_rows=0, temp_dir=temp_dir)
+
+
+# Daily batch of the ingestion comparison, in fraction of the history
+BATCH_FRACTION = 0.01
+
+for n_rows in ROWS:
+    if n_rows <= PANDAS_MAX_ROWS:
+        @case(f"ingestion/ingest_batch_{rows_label(n_rows)}", "ingestion", rows=n_rows)
+        def ingest_batch(context, n_rows=n_rows):
+            # Each call appends the next batch of the tiling to the history and derives the cleaned data again,
+            # with the preview of the rows the app shows
+            cleaner = dashboard.IncrementalCleaner()
+            cleaner.ingest(pd.read_parquet(context.delay_parquet(n_rows)))
+            mean_rental_per_day, batch_rows = context.pricing_data["rental_price_per_day"].mean(), int(n_rows * BATCH_FRACTION)
+
+            def run():
+                start = len(cleaner)
+                cleaner.ingest(tiled_rows(context.delay_data, start, start + batch_rows))
+                return cleaner.cleaned(mean_rental_per_day, preview_rows=dashboard.PREVIEW_ROWS)
+            return run
+
+        @case(f"ingestion/full_rebuild_{rows_label(n_rows)}", "ingestion", rows=n_rows)
+        def full_rebuild(context, n_rows=n_rows):
+            data = tiled_rows(context.delay_data, 0, n_rows + int(n_rows * BATCH_FRACTION))
+            pricing_data = context.pricing_data
+            return lambda: dashboard.clean_data(data, pricing_data)
+
+
+# Replications of the Monte Carlo simulator, spread over 1, 2 and 4 processes (the results are the same)
+SIMULATION_SCALE = 10
+SIMULATION_REPLICATIONS = 100
+
+for workers in (1, 2, 4):
+    @case(f"simulation/monte_carlo_{workers}w_x{SIMULATION_SCALE}", "simulation", SIMULATION_SCALE)
+    def monte_carlo(context, workers=workers):
+        timelines = dashboard.build_timelines(context.cleaned_delay_data(SIMULATION_SCALE))
+        return lambda: dashboard.simulate(timelines, 180, "all", "shift", SIMULATION_REPLICATIONS, workers=workers)
+
+
+def measure(function, min_time, min_repeat, max_repeat):
+    """Call `function` until `min_time` seconds and `min_repeat` calls are reached, return timing statistics."""
+    function()  # warm-up
+    timings = []
+    while (len(timings) < min_repeat or sum(timings) < min_time) and len(timings) < max_repeat:
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "repeat": len(timings),
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def duckdb_version():
+    try:
+        import duckdb
+    except ImportError:
+        return None
+    return duckdb.__version__
+
+
+def metadata():
+    import numpy
+    import sklearn
+    import xgboost
+
+    return {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "libraries": {"pandas": pd.__version__, "numpy": numpy.__version__, "scikit-learn": sklearn.__version__, "xgboost": xgboost.__version__, "duckdb": duckdb_version()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="Only run the cases whose name contains this text")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(SCALES), help=f"Dataset scales to run among {SCALES}")
+    parser.add_argument("--rows", type=int, nargs="+", default=[ROWS[0]], help=f"Rows of the engine comparison among {ROWS}")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Minimum measured time per case (s)")
+    parser.add_argument("--min-repeat", type=int, default=5, help="Minimum number of measured calls per case")
+    parser.add_argument("--max-repeat", type=int, default=1000, help="Maximum number of measured calls per case")
+    parser.add_argument("--output", help="JSON file of the results (default: benchmarks/results/<commit>.json)")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        context = Context(workdir)
+        for name, (group, scale, rows, setup) in CASES.items():
+            if args.filter not in name or (scale is not None and scale not in args.scales) or (rows is not None and rows not in args.rows):
+                continue
+            stats = measure(setup(context), args.min_time, args.min_repeat, args.max_repeat)
+            results[name] = {"group": group, "scale": scale, "rows": rows, **stats}
+            print(f"{name:<36} {stats['median'] * 1000:>12.3f} ms  (min {stats['min'] * 1000:.3f} ms, {stats['repeat']} calls)")
+
+    run = {"metadata": metadata(), "results": results}
+    output = args.output or os.path.join(RESULTS_DIR, f"{run['metadata']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(run, file, indent=2)
+    print(f"✅ Results saved in {output}")
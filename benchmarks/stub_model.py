@@ -0,0 +1,28 @@
+"""
+Offline stand-in of the MLFlow model for the benchmarks.
+
+An XGBoost regressor of the same kind as the MLFlow one is trained on the pricing dataset
+(fixed seed) and saved as an offline bundle (see `ML_&_API/bundle.py`), so the API can be
+benchmarked without the tracking server. Its prices are not the production ones, its cost is.
+"""
+import os
+import shutil
+
+from bundle import NATIVE_MODEL_FILE, PREPROCESSOR_FILE, write_manifest
+
+
+def build_stub_bundle(output_dir, pricing_data, preprocessor_path):
+    import pickle
+    from xgboost import XGBRegressor
+
+    with open(preprocessor_path, "rb") as file:
+        preprocessor = pickle.load(file)
+    features = preprocessor.transform(pricing_data.drop(columns=["rental_price_per_day"]))
+    model = XGBRegressor(n_estimators=150, max_depth=5, random_state=0)
+    model.fit(features, pricing_data["rental_price_per_day"])
+
+    os.makedirs(output_dir, exist_ok=True)
+    model.get_booster().save_model(os.path.join(output_dir, NATIVE_MODEL_FILE))
+    shutil.copyfile(preprocessor_path, os.path.join(output_dir, PREPROCESSOR_FILE))
+    write_manifest(output_dir, version="benchmark-stub", model_uri="stub")
+    return output_dir
@@ -0,0 +1,92 @@
+"""
+Synthetic datasets with the schema of the project data, `factor` times bigger.
+
+The rows are tiled: copy k of the data gets its `rental_id`, `car_id` and
+`previous_ended_rental_id` shifted by k times the largest id, so every copy keeps its
+own chains of consecutive rentals and the distributions stay the same as the originals.
+
+`write_delay_parquet` writes the tiled delay analysis data of any number of rows to a Parquet
+file, chunk by chunk, for the out-of-core engine (see `Dashboard/duckdb_engine.py`):
+
+    python benchmarks/synthetic.py --rows 1000000 10000000 100000000 --output-dir benchmarks/data
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK_ROWS = 1_000_000
+
+
+def scale_delay_data(data, factor):
+    """`factor` copies of the delay analysis data (`get_around_delay_analysis.xlsx`)."""
+    if factor == 1:
+        return data.copy()
+    rental_offset = int(data["rental_id"].max()) + 1
+    car_offset = int(data["car_id"].max()) + 1
+    copies = []
+    for k in range(factor):
+        copy = data.copy()
+        copy["rental_id"] += k * rental_offset
+        copy["car_id"] += k * car_offset
+        copy["previous_ended_rental_id"] += k * rental_offset
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def tiled_rows(data, start, stop):
+    """Rows `start` to `stop` (excluded) of the endless tiling of the delay analysis data."""
+    rental_offset = int(data["rental_id"].max()) + 1
+    car_offset = int(data["car_id"].max()) + 1
+    copy, position = np.divmod(np.arange(start, stop), len(data))
+    rows = data.iloc[position].reset_index(drop=True)
+    rows["rental_id"] += copy * rental_offset
+    rows["car_id"] += copy * car_offset
+    rows["previous_ended_rental_id"] += copy * rental_offset
+    return rows
+
+
+def write_delay_parquet(data, n_rows, path, chunk_rows=CHUNK_ROWS):
+    """Write `n_rows` rows of the tiled delay analysis data to a Parquet file, one row group per chunk."""
+    data = data.reset_index(drop=True)
+    writer = None
+    try:
+        for start in range(0, n_rows, chunk_rows):
+            table = pa.Table.from_pandas(tiled_rows(data, start, min(start + chunk_rows, n_rows)), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return path
+
+
+def scale_pricing_data(data, factor):
+    """`factor` copies of the pricing data (`get_around_pricing_project.csv`)."""
+    return pd.concat([data] * factor, ignore_index=True)
+
+
+def rows_label(n_rows):
+    """1000000 -> "1M", 100000 -> "100k"."""
+    for size, suffix in ((1_000_000_000, "B"), (1_000_000, "M"), (1_000, "k")):
+        if n_rows >= size and n_rows % size == 0:
+            return f"{n_rows // size}{suffix}"
+    return str(n_rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000], help="Number of rows of each file")
+    parser.add_argument("--output-dir", default=os.path.join(ROOT, "benchmarks", "data"), help="Directory of the Parquet files")
+    args = parser.parse_args()
+
+    data = pd.read_excel(os.path.join(ROOT, "get_around_delay_analysis.xlsx"))
+    os.makedirs(args.output_dir, exist_ok=True)
+    for n_rows in args.rows:
+        path = write_delay_parquet(data, n_rows, os.path.join(args.output_dir, f"delay_analysis_{rows_label(n_rows)}.parquet"))
+        print(f"✅ {n_rows} rows saved in {path}")
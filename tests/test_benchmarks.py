@@ -0,0 +1,18 @@
+"""
+Smoke test of the benchmark suite (benchmarks/run.py): an API case and a dashboard case run in the
+same process, like a full run, so the modules of the API and of the dashboard can't shadow each other.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import run  # noqa: E402
+
+
+def test_api_and_dashboard_cases(tmp_path):
+    context = run.Context(str(tmp_path))
+    # The dashboard case first: its modules are imported before the API
+    for name in ("dashboard/clean_x1", "api/predict_single"):
+        setup = run.CASES[name][-1]
+        setup(context)()
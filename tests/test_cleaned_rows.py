@@ -0,0 +1,49 @@
+"""
+Rentals of the raw data viewer with the DuckDB and incremental engines (Dashboard/duckdb_engine.py,
+Dashboard/ingestion.py): all the cleaned rentals of `pipeline.clean_data`, not a preview, on
+get_around_delay_analysis.xlsx.
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Dashboard"))
+
+from pipeline import clean_data  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def data():
+    return pd.read_excel(os.path.join(ROOT, "get_around_delay_analysis.xlsx"))
+
+
+@pytest.fixture(scope="module")
+def expected(data):
+    pricing = pd.read_csv(os.path.join(ROOT, "get_around_pricing_project.csv"), index_col=0)
+    return clean_data(data, pricing).data
+
+
+def assert_same_rentals(rows, expected):
+    rows = rows[list(expected.columns)].sort_values("rental_id").reset_index(drop=True)
+    expected = expected.sort_values("rental_id").reset_index(drop=True)
+    pd.testing.assert_frame_equal(rows, expected, check_dtype=False, check_categorical=False)
+
+
+def test_duckdb_rows(data, expected, tmp_path):
+    pytest.importorskip("duckdb")
+    from duckdb_engine import cleaned_rows
+
+    data.to_parquet(tmp_path / "rentals.parquet")
+    assert_same_rentals(cleaned_rows(str(tmp_path / "rentals.parquet"), temp_dir=str(tmp_path)), expected)
+
+
+def test_incremental_rows(data, expected):
+    from ingestion import IncrementalCleaner
+
+    cleaner = IncrementalCleaner()
+    for batch in range(0, len(data), 5000):
+        cleaner.ingest(data.iloc[batch:batch + 5000])
+    assert_same_rentals(cleaner.cleaned_rows(), expected)
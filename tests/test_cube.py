@@ -0,0 +1,55 @@
+"""
+Aggregate cube (Dashboard/cube.py) of get_around_delay_analysis.xlsx: the `CleanedData` read from
+the cube is the one of `pipeline.clean_data`, and the cube stays small.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Dashboard"))
+
+from cube import build_cube, read_cube, write_cube  # noqa: E402
+from ingestion import COUNT_FIELDS, same  # noqa: E402
+from pipeline import clean_data  # noqa: E402
+from thresholds import MAX_THRESHOLD, SCOPES  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def sources():
+    return (pd.read_excel(os.path.join(ROOT, "get_around_delay_analysis.xlsx")),
+            pd.read_csv(os.path.join(ROOT, "get_around_pricing_project.csv"), index_col=0))
+
+
+@pytest.fixture(scope="module")
+def cube(sources, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("cube") / "delay_cube.arrow")
+    table = build_cube(*sources)
+    write_cube(table, path)
+    return table, read_cube(path)
+
+
+def test_cleaned_data(sources, cube):
+    expected, actual = clean_data(*sources), cube[1]
+    mismatches = [name for name in COUNT_FIELDS if not same(getattr(actual, name), getattr(expected, name))]
+    assert mismatches == []
+    for name, value in expected.delay_statistics.items():
+        assert np.isclose(actual.delay_statistics[name], value, equal_nan=True), name
+    assert actual.fingerprint == expected.fingerprint and actual.mean_rental_per_day == expected.mean_rental_per_day
+
+
+def test_threshold_index(sources, cube):
+    expected, actual = clean_data(*sources).threshold_index, cube[1].threshold_index
+    thresholds = np.arange(MAX_THRESHOLD + 1)
+    for scope in SCOPES:
+        for query in (actual.affected, actual.revenue_impacted, actual.solved):
+            np.testing.assert_array_equal(query(thresholds, scope), getattr(expected, query.__name__)(thresholds, scope))
+        assert actual.problematic_cases(scope) == expected.problematic_cases(scope)
+
+
+def test_fixed_size(cube):
+    # Categories: check-in types x states x delay categories x problematic; bins: check-in types x the grid and infinity
+    assert cube[0].num_rows <= 2 * 2 * 9 * 2 + 2 * (MAX_THRESHOLD + 2)
@@ -0,0 +1,58 @@
+"""
+Parity of the vectorized delay columns (Dashboard/delay_features.py) with the row-by-row code of
+the dashboard they replaced, on get_around_delay_analysis.xlsx.
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Dashboard"))
+
+from delay_features import add_delay_features, add_previous_rental  # noqa: E402
+
+
+def categorize_delay(delay):
+    if pd.isna(delay):
+        return "Unknown"
+    elif delay <= 0:
+        return "Early or in time"
+    elif delay < 60:
+        return "< 1 hour"
+    elif delay < 120:
+        return "1 to 2 hours"
+    elif delay < 180:
+        return "2 to 3 hours"
+    elif delay < 360:
+        return "3 to 6 hours"
+    elif delay < 720:
+        return "6 to 12 hours"
+    elif delay < 1440:
+        return "12 to 24 hours"
+    else:
+        return "1 day or more"
+
+
+@pytest.fixture(scope="module")
+def data():
+    return pd.read_excel(os.path.join(ROOT, "get_around_delay_analysis.xlsx"))
+
+
+def test_delay_columns(data):
+    features = add_delay_features(add_previous_rental(data))
+    categories = data["delay_at_checkout_in_minutes"].apply(categorize_delay)
+    statuses = categories.apply(lambda x: "Early or in time" if x == "Early or in time"
+                                else "Unkonwn" if x == "Unknown"
+                                else "Late")
+    assert (features["checkout_delay_category"].astype(str) == categories).all()
+    assert (features["checkout_delay_status"].astype(str) == statuses).all()
+    assert (features["late_checkout"] == (data["delay_at_checkout_in_minutes"] > 0)).all()
+
+
+def test_delay_columns_keep_the_input(data):
+    columns = list(data.columns)
+    features = add_delay_features(add_previous_rental(data))
+    assert list(data.columns) == columns
+    assert len(features) == len(data)
@@ -0,0 +1,47 @@
+"""
+Parity of the fast single-row encoder (ML_&_API/encoder.py) with `preprocessor.transform`, on every
+row of get_around_pricing_project.csv.
+"""
+import os
+import pickle
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(ROOT, "ML_&_API")
+sys.path.insert(0, API_DIR)
+
+from encoder import FastEncoder  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def preprocessor():
+    with open(os.path.join(API_DIR, "preprocessor.pkl"), "rb") as file:
+        return pickle.load(file)
+
+
+@pytest.fixture(scope="module")
+def cars():
+    return pd.read_csv(os.path.join(ROOT, "get_around_pricing_project.csv"), index_col=0).drop(columns=["rental_price_per_day"])
+
+
+def test_every_row_is_encoded_like_the_preprocessor(preprocessor, cars):
+    encoder = FastEncoder(preprocessor)
+    expected = preprocessor.transform(cars)
+    expected = expected.toarray() if hasattr(expected, "toarray") else expected
+    encoded = np.vstack([encoder.encode(SimpleNamespace(**car)).copy() for car in cars.to_dict(orient="records")])
+    assert encoded.shape == expected.shape
+    assert np.allclose(encoded, expected, rtol=0, atol=1e-6)
+
+
+def test_unknown_category_is_rejected(preprocessor, cars):
+    encoder = FastEncoder(preprocessor)
+    car = {**cars.iloc[0].to_dict(), "model_key": "other"}
+    with pytest.raises(ValueError):
+        preprocessor.transform(pd.DataFrame([car]))
+    with pytest.raises(ValueError, match="'other' in column 'model_key'"):
+        encoder.encode(SimpleNamespace(**car))
@@ -0,0 +1,63 @@
+"""
+Index of the incremental ingestion (Dashboard/ingestion.py) on get_around_delay_analysis.xlsx, ingested
+in shuffled batches so that rentals often arrive before their previous rental.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Dashboard"))
+
+from ingestion import IncrementalCleaner, check_consistency  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def data():
+    return pd.read_excel(os.path.join(ROOT, "get_around_delay_analysis.xlsx"))
+
+
+@pytest.fixture(scope="module")
+def pricing():
+    return pd.read_csv(os.path.join(ROOT, "get_around_pricing_project.csv"), index_col=0)
+
+
+def shuffled_batches(data, n_batches=5):
+    order = np.random.default_rng(0).permutation(len(data))
+    return [data.iloc[np.sort(part)] for part in np.array_split(order, n_batches)]
+
+
+def assert_index(cleaner):
+    """The index locates every ingested rental, and the waiting rentals are the ones whose previous rental is missing."""
+    rows = cleaner.rows()
+    assert cleaner.index["rental_id"].is_monotonic_increasing and len(cleaner.index) == len(rows)
+    for chunk, positions in cleaner.index.groupby("chunk")["row"]:
+        located = cleaner.chunks[chunk]["rental_id"].to_numpy()[positions.to_numpy()]
+        np.testing.assert_array_equal(located, cleaner.index.loc[positions.index, "rental_id"].to_numpy())
+    previous_ids = rows["previous_ended_rental_id"]
+    waiting = rows.loc[previous_ids.notna() & ~previous_ids.isin(rows["rental_id"]), "rental_id"]
+    assert sorted(cleaner.waiting["rental_id"]) == sorted(waiting)
+
+
+def test_shuffled_batches(data, pricing, tmp_path):
+    cleaner = IncrementalCleaner()
+    for batch in shuffled_batches(data):
+        cleaner.ingest(batch)
+        assert_index(cleaner)
+    assert check_consistency(cleaner, pricing) == []
+
+    cleaner.save(str(tmp_path))
+    loaded = IncrementalCleaner.load(str(tmp_path))
+    pd.testing.assert_frame_equal(loaded.index, cleaner.index)
+    pd.testing.assert_frame_equal(loaded.waiting, cleaner.waiting)
+
+
+def test_ingested_rentals_are_rejected(data):
+    cleaner = IncrementalCleaner()
+    batches = shuffled_batches(data)
+    cleaner.ingest(batches[0])
+    with pytest.raises(ValueError, match="already ingested"):
+        cleaner.ingest(pd.concat([batches[1], batches[0].iloc[:1]]))
@@ -0,0 +1,42 @@
+"""
+Parity of the join of each rental to its previous rental (`add_previous_rental` of
+Dashboard/delay_features.py) with a row-by-row lookup, on get_around_delay_analysis.xlsx.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Dashboard"))
+
+from delay_features import PREVIOUS_RENTAL_COLUMNS, add_delay_features, add_previous_rental  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def data():
+    return pd.read_excel(os.path.join(ROOT, "get_around_delay_analysis.xlsx"))
+
+
+def previous_rentals(data):
+    """Previous rental of each rental (a dict of its columns, None when it isn't in the data), one row at a time."""
+    rentals = {rental["rental_id"]: rental for rental in data.to_dict(orient="records")}
+    return [None if pd.isna(previous_id) else rentals.get(int(previous_id)) for previous_id in data["previous_ended_rental_id"]]
+
+
+def test_previous_rental_columns(data):
+    joined = add_previous_rental(data)
+    previous = previous_rentals(data)
+    for column, previous_column in PREVIOUS_RENTAL_COLUMNS.items():
+        expected = pd.Series([np.nan if rental is None else rental[column] for rental in previous], index=data.index)
+        pd.testing.assert_series_equal(joined[previous_column], expected, check_names=False, check_dtype=False)
+
+
+def test_problematic_delays(data):
+    features = add_delay_features(add_previous_rental(data))
+    previous_delays = np.array([np.nan if rental is None else rental["delay_at_checkout_in_minutes"] for rental in previous_rentals(data)])
+    delta = data["time_delta_with_previous_rental_in_minutes"].to_numpy() - previous_delays
+    assert np.array_equal(features["delta-late_checkout"].to_numpy(), delta, equal_nan=True)
+    assert (features["problematic_delay"].to_numpy() == (delta < 0)).all()
@@ -0,0 +1,33 @@
+"""
+Baseline of the cascading delays simulation (Dashboard/simulation.py) on get_around_delay_analysis.xlsx:
+without threshold, no policy applies, whatever the delta of the rentals.
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Dashboard"))
+
+from delay_features import add_delay_features, add_previous_rental  # noqa: E402
+from simulation import build_timelines, simulate  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def timelines():
+    data = add_delay_features(add_previous_rental(pd.read_excel(os.path.join(ROOT, "get_around_delay_analysis.xlsx"))))
+    return build_timelines(data)
+
+
+@pytest.mark.parametrize("policy", ["refuse", "shift"])
+def test_baseline_applies_no_policy(timelines, policy):
+    baseline = simulate(timelines, None, "all", policy, replications=5, workers=1)
+    assert (baseline["refused"] == 0).all() and (baseline["shifted"] == 0).all()
+    pd.testing.assert_frame_equal(baseline, simulate(timelines, None, "all", "refuse", replications=5, workers=1))
+
+
+def test_threshold_zero_affects_the_rentals_right_after_the_previous_one(timelines):
+    outcomes = simulate(timelines, 0, "all", "refuse", replications=1, workers=1)
+    assert outcomes["refused"].iloc[0] == (timelines.gaps == 0).sum() > 0
@@ -0,0 +1,60 @@
+"""
+Parity of the threshold index (Dashboard/thresholds.py) with the filtering loops of the Delays page
+it replaced, on get_around_delay_analysis.xlsx.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Dashboard"))
+
+from delay_features import add_delay_features, add_previous_rental  # noqa: E402
+from thresholds import CHART_THRESHOLDS, SCOPES, ThresholdIndex  # noqa: E402
+
+THRESHOLDS = [0, 1, 45, 137, 1439, 1441] + CHART_THRESHOLDS
+MEAN_RENTAL_PER_DAY = 121.21
+
+
+@pytest.fixture(scope="module")
+def data():
+    data = add_delay_features(add_previous_rental(pd.read_excel(os.path.join(ROOT, "get_around_delay_analysis.xlsx"))))
+    delays = data["delay_at_checkout_in_minutes"]
+    mean_delay_checkout, std_delay_checkout = delays.mean(), delays.std()
+    return data[(delays <= mean_delay_checkout + 3 * std_delay_checkout) & (delays >= mean_delay_checkout - 3 * std_delay_checkout) | delays.isna()]
+
+
+def in_scope(data, scope):
+    return data if scope == "all" else data[data["checkin_type"] == scope]
+
+
+@pytest.mark.parametrize("scope", SCOPES)
+def test_affected_rentals_and_revenue(data, scope):
+    index = ThresholdIndex.from_data(data, MEAN_RENTAL_PER_DAY)
+    data = data.assign(mean_price_per_rental=MEAN_RENTAL_PER_DAY)
+    for threshold in THRESHOLDS:
+        affected_rentals = in_scope(data, scope)[in_scope(data, scope)["time_delta_with_previous_rental_in_minutes"] <= threshold]
+        revenue_impact = affected_rentals["mean_price_per_rental"].sum() / data["mean_price_per_rental"].sum() * 100
+        assert index.affected(threshold, scope) == len(affected_rentals)
+        assert index.revenue_impacted(threshold, scope) == pytest.approx(revenue_impact, rel=1e-12)
+
+
+@pytest.mark.parametrize("scope", SCOPES)
+def test_solved_cases(data, scope):
+    index = ThresholdIndex.from_data(data, MEAN_RENTAL_PER_DAY)
+    negative_delay_impact = in_scope(data, scope)[in_scope(data, scope)["delta-late_checkout"] < 0]
+    assert index.problematic_cases(scope) == len(negative_delay_impact)
+    for threshold in THRESHOLDS:
+        solved = negative_delay_impact[negative_delay_impact["previous_delay_at_checkout_in_minutes"] <= threshold]
+        assert index.solved(threshold, scope) == len(solved)
+
+
+def test_table_matches_the_queries(data):
+    index = ThresholdIndex.from_data(data, MEAN_RENTAL_PER_DAY)
+    table = index.table(CHART_THRESHOLDS)
+    assert table["all_affected"].tolist() == [index.affected(threshold) for threshold in CHART_THRESHOLDS]
+    assert table["solved_connect"].tolist() == [index.solved(threshold, "connect") for threshold in CHART_THRESHOLDS]
+    assert np.allclose(table["revenue_impacted"], [index.revenue_impacted(threshold) for threshold in CHART_THRESHOLDS])